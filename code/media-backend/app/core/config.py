@@ -9,11 +9,81 @@ class Settings:
     # 项目根目录：backend/
     BASE_DIR: str = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
     DATA_DIR: str = os.path.join(BASE_DIR, "data")
-    STORIES_PATH: str = os.path.join(DATA_DIR, "stories.json")
+    STORIES_PATH: str = os.path.join(DATA_DIR, "stories.json")  # 旧版整文件存储，仅用于一次性迁移
+    STORIES_DIR: str = os.path.join(DATA_DIR, "stories")  # 每个 story 一个 append-only 日志段
+    # 每次 append 后 fsync，断电也不丢已返回的 turns；压测/开发可关掉
+    STORAGE_FSYNC: bool = os.getenv("STORAGE_FSYNC", "1") == "1"
+    # 存储引擎：log（默认，per-story jsonl 日志段）/ sqlite（WAL，embedding 存 float32 BLOB）
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "log")
+    SQLITE_PATH: str = os.path.join(DATA_DIR, "stories.sqlite3")
+
+    # 日志级别：DEBUG / INFO / WARNING / ERROR / OFF（DEBUG 会逐句打印打分细节）
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+
+    # 打分：增量 centroid 的校验模式（每轮再从头算一遍比对，只用于排查，线上别开）
+    SCORING_VERIFY: bool = os.getenv("SCORING_VERIFY", "0") == "1"
+    SCORING_VERIFY_TOL: float = float(os.getenv("SCORING_VERIFY_TOL", "1e-4"))
+
+    # 启动时在后台线程预热 Embedding / PCA 模型（关掉则第一次打分时才加载）
+    MODEL_WARMUP: bool = os.getenv("MODEL_WARMUP", "1") == "1"
+
+    # PCA 模型文件：空 = DATA_DIR/pca_model.pkl（跟着 DATA_DIR 走）；/api/analysis/rebuild 也写到这里
+    PCA_PATH: str = os.getenv("PCA_PATH", "")
+    # PCA 热加载：每隔多少秒检查一次 pca_model.pkl 是否被替换（换了就切到新版本，无需重启）
+    PCA_RELOAD_INTERVAL: float = float(os.getenv("PCA_RELOAD_INTERVAL", "5"))
+
+    # 打分 / 存储线程池：并发线程数，以及同时在途（执行 + 排队）的任务上限（超出即背压）
+    # 开启 Embedding 微批时模型前向只在合批线程里跑，打分线程大多在等结果，线程数可以比 CPU 核数多
+    SCORING_WORKERS: int = int(os.getenv("SCORING_WORKERS", "8"))
+    SCORING_MAX_PENDING: int = int(os.getenv("SCORING_MAX_PENDING", "64"))
+
+    # ws 流水线：已切好、等待打分的句子队列长度（满了 LLM 读流暂停，形成背压）
+    WS_PIPELINE_DEPTH: int = int(os.getenv("WS_PIPELINE_DEPTH", "8"))
+
+    # Embedding 缓存：内存 LRU 条数（0 关闭），以及可选的磁盘目录（空 = 只用内存，如 data/embed_cache）
+    EMBED_CACHE_SIZE: int = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+    EMBED_CACHE_DIR: str = os.getenv("EMBED_CACHE_DIR", "")
+    # Embedding 推理后端：torch（默认）/ onnx（ONNX Runtime fp32）/ onnx-int8（动态 int8 量化）
+    # 量化配置按 CPU 指令集选；Hub 上没有对应的量化文件时本地量化一次，缓存在 EMBED_ONNX_DIR
+    EMBED_BACKEND: str = os.getenv("EMBED_BACKEND", "torch")
+    EMBED_QUANT_CONFIG: str = os.getenv("EMBED_QUANT_CONFIG", "avx2")
+    EMBED_ONNX_DIR: str = os.getenv("EMBED_ONNX_DIR", os.path.join(DATA_DIR, "onnx_models"))
+    # Embedding 微批：所有连接 / 请求里缓存未命中的句子进同一个队列，凑够 EMBED_BATCH_MAX_SIZE 条
+    # 或第一条等满 EMBED_BATCH_MAX_WAIT_MS 毫秒后一次 model.encode；EMBED_BATCH_MAX_SIZE=1 关闭（各自 encode）
+    EMBED_BATCH_MAX_SIZE: int = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+    EMBED_BATCH_MAX_WAIT_MS: float = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+    # 进程外 Embedding 池（python -m app.scripts.embed_pool_server）：EMBED_POOL_SOCKET 非空时
+    # web worker 不再自己加载模型，编码请求经这个 Unix socket 交给池里的进程（只支持 Linux / macOS）
+    EMBED_POOL_SOCKET: str = os.getenv("EMBED_POOL_SOCKET", "")
+    EMBED_POOL_TIMEOUT: float = float(os.getenv("EMBED_POOL_TIMEOUT", "60"))
+    # 池进程数，以及每个进程的 torch 线程数（0 = CPU 核数 / 进程数）
+    EMBED_POOL_WORKERS: int = int(os.getenv("EMBED_POOL_WORKERS", "2"))
+    EMBED_POOL_TORCH_THREADS: int = int(os.getenv("EMBED_POOL_TORCH_THREADS", "0"))
+
+    # 语义检索（/api/search）：向量数 >= SEARCH_MIN_TRAIN 后训练 IVF 近似索引，
+    # 桶数 SEARCH_NLIST（0 = 自动取 sqrt(n)），每次查询扫描 SEARCH_NPROBE 个桶
+    SEARCH_MIN_TRAIN: int = int(os.getenv("SEARCH_MIN_TRAIN", "4096"))
+    SEARCH_NLIST: int = int(os.getenv("SEARCH_NLIST", "0"))
+    SEARCH_NPROBE: int = int(os.getenv("SEARCH_NPROBE", "16"))
 
     # 你队友接大模型用得到的占位配置
     LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "mock")
     LLM_API_KEY: str = os.getenv("LLM_API_KEY", "")
     LLM_BASE_URL: str = os.getenv("LLM_BASE_URL", "")
 
+    # LLM HTTP 连接池（应用生命周期内复用，keep-alive）
+    LLM_CONNECT_TIMEOUT: float = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+    LLM_STREAM_READ_TIMEOUT: float = float(os.getenv("LLM_STREAM_READ_TIMEOUT", "120"))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_MAX_KEEPALIVE: int = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+    LLM_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+    LLM_HTTP2: str = os.getenv("LLM_HTTP2", "auto")  # auto（装了 h2 就用）/ 1 / 0
+    # LLM 上下文：历史 turns 按估算 token 数裁剪（从最新往前保留），
+    # 首次构建最多读最近 LLM_CONTEXT_MAX_TURNS 条；常驻内存的 story 上下文个数上限
+    LLM_CONTEXT_TOKENS: int = int(os.getenv("LLM_CONTEXT_TOKENS", "3000"))
+    LLM_CONTEXT_MAX_TURNS: int = int(os.getenv("LLM_CONTEXT_MAX_TURNS", "200"))
+    LLM_CONTEXT_CACHE_SIZE: int = int(os.getenv("LLM_CONTEXT_CACHE_SIZE", "256"))
+    # /api/story/continue 的整体截止时间（LLM 生成 + 打分 + 存储），超时返回 504
+    CONTINUE_DEADLINE: float = float(os.getenv("CONTINUE_DEADLINE", "90"))
+
 settings = Settings()
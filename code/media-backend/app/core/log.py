@@ -0,0 +1,26 @@
+import logging
+import sys
+
+from app.core.config import settings
+
+# ====== 日志 ======
+# 各模块用 logging.getLogger(__name__)（都在 "app" 下），级别由 LOG_LEVEL 控制：
+# DEBUG 会打印每句的打分细节；线上用 INFO / WARNING；OFF 完全关闭。
+
+_configured = False
+
+
+def setup_logging(level: str = "") -> None:
+    global _configured
+    level = (level or settings.LOG_LEVEL).upper()
+    logger = logging.getLogger("app")
+    if level == "OFF":
+        logger.setLevel(logging.CRITICAL + 1)
+    else:
+        logger.setLevel(getattr(logging, level, logging.INFO))
+    if not _configured:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+        _configured = True
@@ -1,9 +1,29 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+
+from app.core.config import settings
+from app.core.log import setup_logging
+from app.routes import story, metrics, ws, analysis, health, search
+from app.services import executor, llm_proxy
+from app.utils import algo
+
+setup_logging()
 
-from app.routes import story, metrics, ws, analysis
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 模型在后台线程预热，服务立即可用；/api/health/ready 报告加载进度
+    if settings.MODEL_WARMUP:
+        algo.warm_up_in_background()
+    await llm_proxy.startup_clients()
+    yield
+    await llm_proxy.shutdown_clients()
+    executor.shutdown()
+    algo.shutdown_batcher()
 
-app = FastAPI(title="Story Lab API", version="1.0.0")
+app = FastAPI(title="Story Lab API", version="1.0.0", lifespan=lifespan)
 
 # 开发阶段直接放开，线上再收紧
 app.add_middleware(
@@ -13,7 +33,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 其余 JSON 接口（读取整段故事等）按需 gzip；已自带 Content-Encoding 的响应（analysis）会被跳过
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
+app.include_router(health.router, prefix="/api/health", tags=["health"])
 app.include_router(story.router, prefix="/api/story", tags=["story"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["metrics"])
+app.include_router(metrics.exposition, tags=["metrics"])
 app.include_router(analysis.router, prefix="/api/analysis", tags=["analysis"])
+app.include_router(search.router, prefix="/api/search", tags=["search"])
 app.include_router(ws.router, prefix="/api/ws", tags=["websocket"])
@@ -12,6 +12,7 @@ class Turn(BaseModel):
     entropy_score: float = 0.0
     x: Optional[float] = None
     y: Optional[float] = None
+    proj_version: Optional[str] = None  # x / y 所用的 PCA 版本
 
 class CreateStoryResp(BaseModel):
     story_id: str
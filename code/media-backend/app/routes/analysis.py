@@ -1,86 +1,51 @@
-from fastapi import APIRouter, HTTPException
-import json
-import numpy as np
-from pathlib import Path
-from sklearn.decomposition import PCA
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
+
+from app.services import analysis_data
+from app.utils import http_payload
 
 router = APIRouter()
 
 @router.get("/all-data")
-def get_analysis_data():
+def get_analysis_data(
+    request: Request,
+    fields: Optional[str] = Query(None, description="逗号分隔：coords,text,scores,embedding；不传 = 除 embedding 外全部字段"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="每页 story 数；不传 = 全部"),
+):
     """
-    动态获取所有实验数据
-    1. 扫描 data 目录下所有的 embeddings.json
-    2. 合并数据 & 提取所有向量
-    3. 实时运行 PCA 降维
-    4. 返回带 (x,y) 坐标的完整数据
+    获取所有实验数据
+    1. 扫描 data 目录下所有的 embeddings.json 并合并
+    2. 用已保存的 PCA 模型给每个 round 算 (x, y)
+    3. 结果按数据集版本（文件 mtime / 大小 + PCA 模型）缓存，数据不变时直接返回
+    4. fields 选字段、limit + cursor 按 story 分页，响应按 Accept-Encoding 预压缩（br / gzip）
+    重新拟合 PCA 请调用 POST /api/analysis/rebuild
     """
-    data_dir = Path(__file__).resolve().parent.parent.parent / "data"
-    merged_data = {
-        "experiment_name": "Merged Analysis",
-        "data": {}
-    }
-    
-    if not data_dir.exists():
-         raise HTTPException(status_code=404, detail="Data directory not found")
+    if not analysis_data.data_dir().exists():
+        raise HTTPException(status_code=404, detail="Data directory not found")
+
+    encoding = http_payload.pick_encoding(request.headers.get("accept-encoding", ""))
+    try:
+        body, version = analysis_data.get_page(fields, cursor, limit, encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=410, detail="cursor expired: dataset changed, restart from the first page")
 
-    # 1. 扫描并合并数据
-    json_files = list(data_dir.glob("*.json"))
-    
-    for jf in json_files:
-        if jf.name == "stories.json": continue
-        try:
-            with open(jf, "r", encoding="utf-8") as f:
-                content = json.load(f)
-                if "data" in content and isinstance(content["data"], dict):
-                    merged_data["data"].update(content["data"])
-        except Exception as e:
-            print(f"⚠️ Failed to load {jf}: {e}")
+    # 直接返回缓存好的字节，跳过每次请求的 jsonable_encoder / 序列化 / 压缩
+    headers = {"Vary": "Accept-Encoding", "X-Dataset-Version": version}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
 
-    # 2. 准备 PCA 数据
-    all_vectors = []
-    # 记录映射关系: (story_id, round_idx)
-    vector_map = [] 
-    
-    # 必须确保有数据才跑 PCA
-    has_data = False
-    
-    for sid, story_obj in merged_data["data"].items():
-        if "rounds" not in story_obj: continue
-        
-        for idx, turn in enumerate(story_obj["rounds"]):
-            # 兼容：有的可能是 list，有的可能是 numpy 导出的 list
-            emb = turn.get("embedding")
-            if emb and len(emb) > 0:
-                all_vectors.append(emb)
-                vector_map.append((sid, idx))
-                has_data = True
-    
-    # 3. 运行 PCA
-    if has_data and len(all_vectors) > 2:
-        try:
-            # 降到 2 维
-            pca = PCA(n_components=2)
-            coords = pca.fit_transform(all_vectors)
-            
-            # --- 关键修改：保存模型以统一坐标系 ---
-            import joblib
-            # 保存到 media-backend/data/pca_model.pkl
-            pca_save_path = data_dir / "pca_model.pkl"
-            joblib.dump(pca, pca_save_path)
-            print(f"✅ PCA Model updated and saved to: {pca_save_path}")
-            
-            # 4. 回填坐标
-            for i, (x, y) in enumerate(coords):
-                sid, ridx = vector_map[i]
-                # 写入 merged_data
-                merged_data["data"][sid]["rounds"][ridx]["x"] = round(float(x), 3)
-                merged_data["data"][sid]["rounds"][ridx]["y"] = round(float(y), 3)
-                
-                # 可选：如果不想把巨大向量发给前端，可以在这里 pop 掉
-                # merged_data["data"][sid]["rounds"][ridx].pop("embedding", None)
-                
-        except Exception as e:
-            print(f"❌ PCA Analysis Failed: {e}")
-    
-    return merged_data
+@router.post("/rebuild")
+def rebuild_analysis():
+    """在全部 embedding 上重新拟合 PCA 并保存（会改变之后新 turn 的坐标系），重算投影缓存"""
+    if not analysis_data.data_dir().exists():
+        raise HTTPException(status_code=404, detail="Data directory not found")
+    try:
+        return analysis_data.rebuild()
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.utils import algo
+
+router = APIRouter()
+
+@router.get("")
+def api_health():
+    """存活检查：进程起来就返回，不依赖模型"""
+    return {"status": "ok"}
+
+@router.get("/ready")
+def api_ready():
+    """
+    就绪检查：Embedding / PCA 模型是否已加载完毕。
+    加载中或加载失败（embedding_model 为 "failed"）返回 503，负载均衡可以据此把打分流量先导到已就绪的 worker；
+    非打分接口（create / 读取故事）在加载期间照常可用。
+    """
+    status = algo.model_status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
@@ -1,8 +1,12 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 from app.models.schemas import CompareResp
 from app.services.storage import get_story_turns
+from app.utils import algo
+from app.utils import metrics as prom
 
 router = APIRouter()
+# Prometheus 抓取入口挂在根路径 /metrics（main.py 不加前缀）
+exposition = APIRouter()
 
 @router.get("/compare", response_model=CompareResp)
 def api_compare(story_id: str):
@@ -13,3 +17,16 @@ def api_compare(story_id: str):
     """
     turns = get_story_turns(story_id)
     return {"story_id": story_id, "points": turns}
+
+@router.get("/embedding-cache")
+def api_embedding_cache_stats():
+    """Embedding 缓存命中 / 未命中 / 淘汰计数"""
+    if algo.embedding_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **algo.embedding_cache.stats()}
+
+@exposition.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """各段耗时直方图 + 计数器（Prometheus 文本格式）"""
+    body, content_type = prom.render()
+    return Response(content=body, media_type=content_type)
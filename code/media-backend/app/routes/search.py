@@ -0,0 +1,48 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.services import search_index
+
+router = APIRouter()
+
+@router.get("")
+def api_search(
+    q: str = Query(..., min_length=1, description="查询句子"),
+    k: int = Query(10, ge=1, le=200),
+    mode: str = Query("ivf", description="ivf（近似）/ exact（暴力扫描）"),
+    source: Optional[str] = Query(None, description="story / experiment；不传 = 全部"),
+    nprobe: Optional[int] = Query(None, ge=1, le=4096, description="ivf 扫描的桶数；不传 = SEARCH_NPROBE"),
+):
+    """
+    语义检索：跨所有 story 与实验数据，返回与 q 最相似的 k 个句子（cosine 相似度）。
+    索引在第一次查询时构建，之后随存库增量更新。
+    """
+    try:
+        return search_index.search(text=q, k=k, mode=mode, source=source, nprobe=nprobe)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.get("/similar")
+def api_similar(
+    story_id: str,
+    turn: int,
+    k: int = Query(10, ge=1, le=200),
+    mode: str = Query("ivf"),
+    source: Optional[str] = Query(None),
+    nprobe: Optional[int] = Query(None, ge=1, le=4096),
+):
+    """与某个已存 turn 最相似的句子（直接用它存库的 embedding，不重新编码；结果不含它自己）"""
+    try:
+        return search_index.similar_to_turn(story_id, turn, k=k, mode=mode, source=source, nprobe=nprobe)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="turn not found in index")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/status")
+def api_search_status():
+    """索引状态：向量数、是否已训练 IVF、桶数等"""
+    return search_index.status()
@@ -1,8 +1,16 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import logging
+from contextlib import suppress
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
+from app.core.config import settings
 from app.models.schemas import CreateStoryResp, ContinueReq, ContinueResp, StoryResp
-from app.services.storage import create_story, get_story_turns, append_turns
+from app.services.executor import run_scoring
+from app.services.storage import create_story, get_story_turns
 from app.services.llm_proxy import generate_ai_turns
-from app.services.scoring import score_turns
+from app.services.scoring import score_and_store
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -36,7 +44,7 @@ def api_get_static_data():
                 with open(p, 'r', encoding='utf-8') as f:
                     return json.load(f)
             except Exception as e:
-                print(f"Error reading json: {e}")
+                logger.error("Error reading json: %s", e)
                 
     return {"error": "Static data not found", "paths_tried": possible_paths}
 
@@ -47,22 +55,49 @@ def api_get_story(story_id: str):
         raise HTTPException(status_code=404, detail="story not found")
     return {"story_id": story_id, "turns": turns}
 
-@router.post("/continue", response_model=ContinueResp)
-def api_continue(req: ContinueReq):
+async def _continue(req: ContinueReq):
     # 1) 先把用户输入作为一个 turn（human）
     base_turns = [{
         "author": "human",
         "text": req.user_text
     }]
 
-    # 2) 生成 AI turns（mock/真实LLM都从 llm_proxy 来）
-    ai_turns = generate_ai_turns(req.story_id, req.user_text, req.rounds, req.mode)
+    # 2) 生成 AI turns（mock/真实LLM都从 llm_proxy 来，async，不占线程池）
+    ai_turns = await generate_ai_turns(req.story_id, req.user_text, req.rounds, req.mode)
 
-    # 3) 合并并打分
+    # 3) 合并、打分、存储并给 turn 编号（阻塞部分放进打分线程池）
     all_new = base_turns + ai_turns
-    scored = score_turns(req.story_id, all_new)
-
-    # 4) 存储并给 turn 编号
-    saved = append_turns(req.story_id, scored)
+    saved = await run_scoring(score_and_store, req.story_id, all_new)
 
     return {"story_id": req.story_id, "new_turns": saved}
+
+async def _wait_disconnect(request: Request, interval: float = 0.5):
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+
+@router.post("/continue", response_model=ContinueResp)
+async def api_continue(req: ContinueReq, request: Request):
+    """
+    整体截止时间 CONTINUE_DEADLINE；客户端断开时取消生成（底层 SSE 连接随之关闭）。
+    注意：已经进入打分线程池的 打分+存库 会执行完（append 是原子的），不会存一半。
+    """
+    work = asyncio.create_task(_continue(req))
+    watcher = asyncio.create_task(_wait_disconnect(request))
+    try:
+        done, _ = await asyncio.wait(
+            {work, watcher},
+            timeout=settings.CONTINUE_DEADLINE,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        if work in done:
+            return work.result()
+        if watcher in done:
+            # 客户端已经走了，响应没人收；499 沿用 nginx 的约定
+            return JSONResponse({"detail": "client disconnected"}, status_code=499)
+        raise HTTPException(status_code=504, detail="continue deadline exceeded")
+    finally:
+        for t in (work, watcher):
+            if not t.done():
+                t.cancel()
+                with suppress(asyncio.CancelledError):
+                    await t
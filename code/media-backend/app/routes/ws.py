@@ -1,10 +1,57 @@
+import asyncio
+from contextlib import suppress
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from app.services.scoring import score_turns
-from app.services.storage import append_turns
+from app.core.config import settings
+from app.services.executor import run_scoring
+from app.services.scoring import score_and_store
 from app.services.llm_proxy import stream_ai_turns
 
 router = APIRouter()
 
+_END = object()
+
+async def _pipeline_ai_turns(websocket: WebSocket, story_id: str, user_text: str, rounds: int, mode: str):
+    """
+    生产者 / 消费者流水线：
+    - 生产者：读 LLM 流，切好的整句放进有界队列，不等打分就继续读 SSE
+    - 消费者：按队列顺序逐句 打分 -> 存库 -> 推给前端（单消费者保证 turn 顺序与编号）
+    LLM 生成与 embedding 的耗时因此重叠，而不是相加。
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_PIPELINE_DEPTH)
+
+    async def wait_stored():
+        # 续写请求要读历史：先等已产出的句子全部落库
+        await queue.join()
+
+    async def produce():
+        try:
+            async for ai_turn in stream_ai_turns(
+                story_id, user_text, rounds, mode, before_continue=wait_stored
+            ):
+                await queue.put(ai_turn)
+        except Exception as e:
+            await queue.put(e)
+        await queue.put(_END)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            try:
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                saved_ai = await run_scoring(score_and_store, story_id, [item])
+                await websocket.send_json(saved_ai[0])
+            finally:
+                queue.task_done()
+    finally:
+        if not producer.done():
+            producer.cancel()
+        with suppress(asyncio.CancelledError):
+            await producer
+
 @router.websocket("/ws/story/{story_id}")
 async def ws_story(websocket: WebSocket, story_id: str):
     await websocket.accept()
@@ -16,17 +63,14 @@ async def ws_story(websocket: WebSocket, story_id: str):
             mode = payload.get("mode") or "human_ai"
 
             # 1) 先把 human turn 推给前端（也存库）
+            # 打分 / 存储在线程池里跑，事件循环继续给其他连接推流
             human_turn = {"author": "human", "text": user_text}
-            scored_human = score_turns(story_id, [human_turn])
-            saved_human = append_turns(story_id, scored_human)
+            saved_human = await run_scoring(score_and_store, story_id, [human_turn])
             # append_turns 返回 list
             await websocket.send_json(saved_human[0])
 
-            # 2) 再流式推 AI turns（每条：打分->存库->推给前端）
-            async for ai_turn in stream_ai_turns(story_id, user_text, rounds, mode):
-                scored_ai = score_turns(story_id, [ai_turn])
-                saved_ai = append_turns(story_id, scored_ai)
-                await websocket.send_json(saved_ai[0])
+            # 2) 再流式推 AI turns（生成与 打分->存库->推送 并行流水线）
+            await _pipeline_ai_turns(websocket, story_id, user_text, rounds, mode)
 
     except WebSocketDisconnect:
         return
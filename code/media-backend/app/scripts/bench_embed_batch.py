@@ -0,0 +1,135 @@
+"""
+Embedding 微批基准：N 个并发会话（线程）各自逐句编码，走 algo.encode_texts（与线上 score_turns 同一路径），
+对比「关闭微批（每个调用方自己 model.encode）」与「开启微批」的吞吐、单句延迟 p50 / p95 和平均每次 encode 的句数。
+
+每句都是没见过的文本（并关掉 embedding 缓存），量的是模型前向本身。
+没装 sentence-transformers 时可以用 --mock-cost 模拟模型：一次 encode = 固定开销 + 每句开销（毫秒），
+模拟期间持有一把全局锁（相当于前向占满 CPU），只用来验证合批机制本身。
+
+用法（在 media-backend 目录下）:
+    python -m app.scripts.bench_embed_batch --sessions 1,10,50,100 --sentences 20
+    python -m app.scripts.bench_embed_batch --max-batch 16,32,64 --max-wait-ms 2,5
+    python -m app.scripts.bench_embed_batch --mock-cost 8,0.6
+"""
+import argparse
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.core.config import settings
+from app.utils import algo
+
+_TEXTS = [
+    "雾气从河面升起，像一层薄薄的纱。",
+    "她停下脚步，回头望向来时的路。",
+    "The old lighthouse keeper had not spoken to anyone in years.",
+    "远处的钟声敲了三下，街灯一盏盏亮起。",
+]
+
+
+class _MockModel:
+    def __init__(self, fixed_ms: float, per_item_ms: float, dim: int = 384):
+        self.fixed = fixed_ms / 1000
+        self.per_item = per_item_ms / 1000
+        self.dim = dim
+        self._cpu = threading.Lock()
+
+    def encode(self, texts):
+        with self._cpu:
+            time.sleep(self.fixed + self.per_item * len(texts))
+        return np.ones((len(texts), self.dim), dtype=np.float32)
+
+
+class _CountingModel:
+    """统计 encode 调用次数与句数"""
+
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def encode(self, texts, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.items += len(texts)
+        return self.model.encode(texts, *args, **kwargs)
+
+
+def _run(sessions: int, sentences: int, counter) -> dict:
+    seq = itertools.count()
+    latencies = [[] for _ in range(sessions)]
+
+    def session(idx: int) -> None:
+        for _ in range(sentences):
+            i = next(seq)
+            text = f"{_TEXTS[i % len(_TEXTS)]}（会话 {idx} 第 {i} 句）"
+            t0 = time.perf_counter()
+            algo.encode_texts([text])
+            latencies[idx].append((time.perf_counter() - t0) * 1000)
+
+    counter.calls = counter.items = 0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session, range(sessions)))
+    wall = time.perf_counter() - t0
+    flat = [x for xs in latencies for x in xs]
+    return {
+        "throughput": len(flat) / wall,
+        "p50": float(np.percentile(flat, 50)),
+        "p95": float(np.percentile(flat, 95)),
+        "batch": counter.items / max(counter.calls, 1),
+    }
+
+
+def _configure(max_batch: int, max_wait_ms: float) -> None:
+    algo.shutdown_batcher()
+    settings.EMBED_BATCH_MAX_SIZE = max_batch
+    settings.EMBED_BATCH_MAX_WAIT_MS = max_wait_ms
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", default="1,10,50,100")
+    parser.add_argument("--sentences", type=int, default=20, help="每个会话编码的句数")
+    parser.add_argument("--max-batch", default="32")
+    parser.add_argument("--max-wait-ms", default="5")
+    parser.add_argument("--mock-cost", help="固定开销,每句开销（毫秒），用模拟模型代替 sentence-transformers")
+    args = parser.parse_args()
+
+    if args.mock_cost:
+        fixed, per_item = (float(x) for x in args.mock_cost.split(","))
+        model = _MockModel(fixed, per_item)
+    else:
+        model = algo.get_model()
+        if model is None:
+            raise SystemExit("❌ Embedding 模型不可用；可以用 --mock-cost 8,0.6 模拟")
+    counter = _CountingModel(model)
+    algo._model, algo._model_state = counter, "loaded"
+    algo.embedding_cache = None
+    algo.encode_texts(["预热"])
+
+    configs = [("off", 1, 0.0)] + [
+        (f"batch={b} wait={w}ms", b, w)
+        for b in (int(x) for x in args.max_batch.split(",") if x)
+        for w in (float(x) for x in args.max_wait_ms.split(",") if x)
+    ]
+    for sessions in (int(x) for x in args.sessions.split(",") if x):
+        print(f"\n=== sessions={sessions} x {args.sentences} 句 ===")
+        base = None
+        for label, max_batch, max_wait in configs:
+            _configure(max_batch, max_wait)
+            r = _run(sessions, args.sentences, counter)
+            base = base or r["throughput"]
+            print(
+                f"{label:<22}: {r['throughput']:8.1f} 句/s ({r['throughput'] / base:5.2f}x)  "
+                f"p50 {r['p50']:8.2f} ms  p95 {r['p95']:8.2f} ms  平均批大小 {r['batch']:5.1f}"
+            )
+    algo.shutdown_batcher()
+
+
+if __name__ == "__main__":
+    main()
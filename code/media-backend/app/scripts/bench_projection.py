@@ -0,0 +1,68 @@
+"""
+PCA 投影基准：sklearn pca.transform vs Projection 的 float32 矩阵乘法内核，
+逐向量 transform（旧的线上 / consolidate 写法）与整批 transform 的耗时。
+两者数值一致（含 whiten，误差 < 1e-4）由 tests/test_projection.py 保证。
+
+用法（在 media-backend 目录下）:
+    python -m app.scripts.bench_projection --n 100000
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+from sklearn.decomposition import PCA
+
+from app.utils.projection import from_model
+
+
+def _fit(dim: int, whiten: bool, seed: int) -> PCA:
+    rng = np.random.default_rng(seed)
+    # 有明显主方向的数据，接近真实 embedding 的分布
+    basis = rng.normal(size=(8, dim))
+    X = rng.normal(size=(2000, 8)) @ basis * 0.05 + rng.normal(size=(2000, dim)) * 0.01
+    return PCA(n_components=2, whiten=whiten).fit(X)
+
+
+def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def bench(dim: int, n: int, repeat: int) -> None:
+    pca = _fit(dim, False, seed=0)
+    proj = from_model("bench", pca)
+    rng = np.random.default_rng(0)
+    X = (rng.normal(size=(n, dim)) * 0.05).astype(np.float32)
+    rows = X.tolist()
+
+    per_vec = min(n, 2000)
+    sk_one = _median_ms(lambda: [pca.transform(np.array(r).reshape(1, -1)) for r in rows[:per_vec]], repeat)
+    np_one = _median_ms(lambda: [proj.transform([r]) for r in rows[:per_vec]], repeat)
+    print(f"逐向量（{per_vec} 个）: sklearn {sk_one / per_vec * 1000:.1f} µs/个 | "
+          f"numpy {np_one / per_vec * 1000:.1f} µs/个 | {sk_one / np_one:.1f}x")
+
+    for size in (10, 1000, n):
+        sk = _median_ms(lambda: pca.transform(X[:size].astype(np.float64)), repeat)
+        nk = _median_ms(lambda: proj.transform(X[:size]), repeat)
+        print(f"整批 {size:>7}: sklearn {sk:8.3f} ms | numpy {nk:8.3f} ms | {sk / nk:.1f}x")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--n", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    bench(args.dim, args.n, args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+打分基准：逐句 calculate_metrics_incremental vs 一次 encode 的 calculate_metrics_batch，
+rounds = 1 / 5 / 10，并校验两条路径的输出一致。
+
+用法（在 media-backend 目录下）:
+    python -m app.scripts.bench_scoring --repeat 20
+"""
+import argparse
+import statistics
+import time
+
+from app.utils import algo
+from app.utils.context_state import ContextState
+
+_SENTENCES = [
+    "清晨的阳光透过树叶洒在你的脸上。",
+    "你发现自己站在一条蜿蜒的小径上。",
+    "周围是郁郁葱葱的森林，鸟鸣声清脆悦耳。",
+    "The old lighthouse keeper had not spoken to anyone in years.",
+    "走近一看，原来是枚古老的铜币。",
+    "A cold wind swept across the harbour as the boats returned.",
+    "铜币上刻着你不认识的文字。",
+    "She folded the map twice and hid it inside her coat.",
+]
+
+
+def _sequential(texts, state):
+    state = state.copy()
+    out = []
+    for text in texts:
+        m = algo.calculate_metrics_incremental(text, state)
+        if m["embedding"]:
+            state.push(m["embedding"])
+        out.append(m)
+    return out
+
+
+def _timeit(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--history", type=int, default=50, help="已有上下文的句子数")
+    args = parser.parse_args()
+
+    if not algo.get_model():
+        print("❌ Embedding 模型未加载，无法测试")
+        return
+
+    state = ContextState()
+    for i in range(args.history):
+        state.advance(algo.get_embedding(f"{_SENTENCES[i % len(_SENTENCES)]} #{i}"))
+
+    print(f"{'rounds':>6} | {'sequential ms':>13} | {'batched ms':>10} | {'speedup':>7} | identical")
+    for rounds in (1, 5, 10):
+        texts = [f"{_SENTENCES[i % len(_SENTENCES)]} ({rounds}-{i})" for i in range(rounds)]
+        seq_ms, seq = _timeit(lambda: _sequential(texts, state), args.repeat)
+        bat_ms, bat = _timeit(lambda: algo.calculate_metrics_batch(texts, state), args.repeat)
+
+        same = all(
+            a[k] == b[k]
+            for a, b in zip(seq, bat)
+            for k in ("flow_score", "entropy_score", "x", "y")
+        )
+        print(f"{rounds:>6} | {seq_ms:>13.2f} | {bat_ms:>10.2f} | {seq_ms / bat_ms:>6.2f}x | {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+向量检索基准：exact（暴力扫描）vs IVF 的召回率与延迟。
+
+合成数据：--dim 维、64 个簇的高斯混合（簇内很分散，近邻不集中在一个桶里），查询是同分布的新点。
+对每个规模：构建（add + train）耗时、exact / IVF（不同 nprobe）的单次查询 p50 / p95、
+IVF 相对 exact 的 recall@k，以及训练后逐条增量 add 的耗时。
+
+用法（在 media-backend 目录下）:
+    python -m app.scripts.bench_search                       # 10k / 100k / 1M
+    python -m app.scripts.bench_search --sizes 10000,100000 --nprobe 4,16,64
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from app.utils.vector_index import VectorIndex
+
+
+def make_data(n: int, dim: int, seed: int, sample_seed: int = 0) -> np.ndarray:
+    """同一个 seed 的簇中心相同；sample_seed 不同时得到同分布的另一批点（用作查询）"""
+    centers = np.random.default_rng(seed).normal(size=(64, dim)).astype(np.float32)
+    rng = np.random.default_rng((seed, sample_seed))
+    X = np.empty((n, dim), dtype=np.float32)
+    # 分块生成，1M x 384 不需要额外的 float64 中间数组
+    for s in range(0, n, 65536):
+        e = min(n, s + 65536)
+        X[s:e] = centers[rng.integers(0, len(centers), e - s)]
+        X[s:e] += rng.normal(scale=1.5, size=(e - s, dim)).astype(np.float32)
+    return X
+
+
+def _pct(samples, q):
+    return float(np.percentile(samples, q))
+
+
+def _timed(fn, queries):
+    out, samples = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        out.append(fn(q))
+        samples.append((time.perf_counter() - t0) * 1000)
+    return out, samples
+
+
+def bench(n: int, dim: int, k: int, n_queries: int, nprobes, seed: int) -> None:
+    X = make_data(n, dim, seed)
+    queries = make_data(n_queries, dim, seed, sample_seed=1)
+
+    index = VectorIndex(dim, min_train=1)
+    t0 = time.perf_counter()
+    index.add(X)
+    t_add = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    index.train()
+    t_train = time.perf_counter() - t0
+    del X
+    stats = index.stats()
+    print(f"\n=== n={n:,} dim={dim} nlist={stats['nlist']} | add {t_add:.2f}s, train {t_train:.2f}s ===")
+
+    exact, samples = _timed(lambda q: index.search(q, k, exact=True)[1], queries)
+    print(f"exact        : p50 {_pct(samples, 50):8.3f} ms  p95 {_pct(samples, 95):8.3f} ms  recall@{k} 1.000")
+    truth = [set(r.tolist()) for r in exact]
+
+    for nprobe in nprobes:
+        got, samples = _timed(lambda q: index.search(q, k, nprobe=nprobe)[1], queries)
+        recall = statistics.mean(len(truth[i] & set(r.tolist())) / k for i, r in enumerate(got))
+        print(
+            f"ivf nprobe={nprobe:<4}: p50 {_pct(samples, 50):8.3f} ms  p95 {_pct(samples, 95):8.3f} ms  "
+            f"recall@{k} {recall:.3f}"
+        )
+
+    # 线上的增量路径：训练好之后逐条 add（每条都要分桶）
+    extra = make_data(200, dim, seed, sample_seed=2)
+    t0 = time.perf_counter()
+    for v in extra:
+        index.add(v)
+    print(f"incremental add: {(time.perf_counter() - t0) / len(extra) * 1000:.3f} ms/条")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", default="4,16,64")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    nprobes = [int(x) for x in args.nprobe.split(",") if x]
+    for n in (int(x) for x in args.sizes.split(",") if x):
+        bench(n, args.dim, args.k, args.queries, nprobes, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+断句器微基准：SentenceSegmenter 与旧的「整 buffer 重跑 extract_complete_sentences」对比，
+长的中文 / 英文流（含无标点的长段）逐 delta 喂入的总耗时。
+两者逐步输出一致由 tests/test_segmenter.py 的随机切片测试保证。
+
+用法（在 media-backend 目录下）:
+    python -m app.scripts.bench_segmenter --length 2000 --delta 3
+"""
+import argparse
+import sys
+import time
+
+from app.services.llm_proxy import SentenceSegmenter, extract_complete_sentences
+
+
+def _reference(chunks):
+    buffer = ""
+    out = []
+    for d in chunks:
+        buffer += d
+        sents, buffer = extract_complete_sentences(buffer)
+        out.append((sents, buffer))
+    return out
+
+
+def _incremental(chunks):
+    seg = SentenceSegmenter()
+    return [(seg.feed(d), seg.remainder) for d in chunks]
+
+
+def _stream(kind: str, length: int, delta: int):
+    if kind == "zh-no-punct":
+        text = ("雾气从河面升起像一层薄薄的纱" * (length // 14 + 1))[:length] + "。"
+    elif kind == "en-no-punct":
+        text = ("the fog rose slowly over the river " * (length // 35 + 1))[:length] + "."
+    else:
+        text = ("雾气从河面升起，像一层薄薄的纱。She stopped and looked back! " * (length // 40 + 1))[:length]
+    return [text[i:i + delta] for i in range(0, len(text), delta)]
+
+
+def bench(length: int, delta: int) -> None:
+    print(f"{'stream':<12} | {'chars':>6} | {'full re-scan ms':>15} | {'incremental ms':>14} | speedup")
+    for kind in ("zh-no-punct", "en-no-punct", "mixed"):
+        chunks = _stream(kind, length, delta)
+        t0 = time.perf_counter()
+        ref = _reference(chunks)
+        t_ref = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        inc = _incremental(chunks)
+        t_inc = (time.perf_counter() - t0) * 1000
+        assert ref == inc
+        print(f"{kind:<12} | {length:>6} | {t_ref:>15.1f} | {t_inc:>14.2f} | {t_ref / max(t_inc, 1e-6):.0f}x")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--length", type=int, default=2000, help="基准流的字符数")
+    parser.add_argument("--delta", type=int, default=3, help="每个 delta 的字符数")
+    args = parser.parse_args()
+
+    bench(args.length, args.delta)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
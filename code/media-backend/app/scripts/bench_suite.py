@@ -0,0 +1,487 @@
+"""
+可复现的基准套件：一次跑完后端各段的性能，结果写成 JSON（每项指标一个数），
+和另一次（比如上一个 commit）的结果比较，超出阈值的退化让退出码为 1，可以直接放进 CI。
+
+覆盖（--cases 选择，默认全部）:
+- segmenter : extract_complete_sentences 单次调用；SentenceSegmenter 逐 delta 喂完一段长流
+- scoring   : calculate_metrics（20 条上下文）与 score_turns（1 / 5 句）；没有 embedding 模型时跳过
+- storage   : log / sqlite 引擎，story 里已有 1k / 10k / 100k 条 turns 时的 append_turns / get_story_turns / get_recent_turns
+- analysis  : 合成数据集（列式 .cols）上 GET /api/analysis/all-data 的冷启动 / 磁盘缓存 / 内存缓存延迟与分页
+- ws        : 本地起 mock LLM（mock_llm_server）和后端子进程，并发 1 / 10 / 50 个 websocket 会话各跑一轮
+
+数据全部写在临时目录里，不碰 data/；合成数据固定 seed，同一台机器上重复跑结果可比。
+阈值：按 case 的相对容差（TOLERANCES，--tolerance 统一覆盖），再加一个绝对噪声下限（NOISE_FLOOR），
+两者都超过才算退化。
+
+用法（在 media-backend 目录下）:
+    python -m app.scripts.bench_suite --out bench/main.json
+    python -m app.scripts.bench_suite --cases segmenter,storage --storage-sizes 1000,10000
+    python -m app.scripts.bench_suite --out bench/new.json --baseline bench/main.json   # 跑完直接比较
+    python -m app.scripts.bench_suite --compare bench/main.json bench/new.json          # 只比较两份结果
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.log import setup_logging
+from app.utils import projection
+
+CASES = ("segmenter", "scoring", "storage", "analysis", "ws")
+
+# 相对容差：新值比基线差超过这个比例算退化（端到端的 ws 受调度影响大，放宽）
+TOLERANCES = {"segmenter": 0.15, "scoring": 0.2, "storage": 0.3, "analysis": 0.3, "ws": 0.5}
+# 绝对噪声下限：差值小于它的不算退化（亚毫秒级的抖动）
+NOISE_FLOOR = {"ms": 0.05, "us": 0.5, "count": 0.0, "1/s": 0.0}
+
+# 仓库里的 PCA 模型：ws 的后端子进程拷一份过去用，保证投影路径和线上一致
+_REPO_PCA_PATH = projection.pca_path()
+
+_TEXTS = [
+    "雾气从河面升起，像一层薄薄的纱。",
+    "她停下脚步，回头望向来时的路。",
+    "远处的钟声敲了三下，街灯一盏盏亮起。",
+    "The old lighthouse keeper had not spoken to anyone in years.",
+    "他把信折好，塞进了外套的内袋。",
+    "A cold wind swept across the harbour as the boats returned.",
+]
+
+
+# ====== 工具 ======
+def _median_ms(fn: Callable[[], Any], repeat: int, warmup: int = 1) -> float:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def _pct(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def _size_label(n: int) -> str:
+    return f"{n // 1000}k" if n >= 1000 and n % 1000 == 0 else str(n)
+
+
+def _ints(text: str) -> List[int]:
+    return [int(x) for x in text.split(",") if x]
+
+
+def _use_data_dir(data_dir: str, backend: str = "log", fsync: bool = False) -> None:
+    """把存储、分析数据、PCA 模型都指到 data_dir（不碰仓库里的 data/），并清掉按旧目录建好的进程内状态"""
+    from app.services import analysis_data, log_store, storage
+
+    os.makedirs(data_dir, exist_ok=True)
+    settings.STORAGE_BACKEND = backend
+    settings.STORAGE_FSYNC = fsync
+    settings.DATA_DIR = data_dir
+    settings.STORIES_PATH = os.path.join(data_dir, "stories.json")
+    settings.STORIES_DIR = os.path.join(data_dir, "stories")
+    settings.SQLITE_PATH = os.path.join(data_dir, "stories.sqlite3")
+    settings.PCA_PATH = ""  # 跟着 DATA_DIR
+    projection.reload()
+    storage._impl = None
+    log_store._store_ready = False
+    analysis_data._cache = None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, timeout=10,
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Recorder:
+    def __init__(self):
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+        self.skipped: Dict[str, str] = {}
+
+    def __call__(self, name: str, value: float, unit: str = "ms", better: Optional[str] = "lower") -> None:
+        """better: lower / higher / None（只记录不比较，如响应体大小）"""
+        self.metrics[name] = {"value": round(float(value), 4), "unit": unit, "better": better}
+        print(f"  {name:<48} {value:12.3f} {unit}")
+
+
+# ====== cases ======
+def bench_segmenter(args, record: Recorder, workdir: str) -> Optional[str]:
+    from app.services.llm_proxy import SentenceSegmenter, extract_complete_sentences
+
+    rng = random.Random(args.seed)
+    text = "".join(rng.choice(_TEXTS) for _ in range(2000))
+    deltas = [text[i:i + 4] for i in range(0, len(text), 4)]
+    buffer = text[:600] + "还没有写完的残句"
+
+    def feed_all():
+        seg = SentenceSegmenter()
+        for d in deltas:
+            seg.feed(d)
+
+    # 单次调用只有几微秒：每个样本跑 100 次
+    per_100 = _median_ms(lambda: [extract_complete_sentences(buffer) for _ in range(100)], args.repeat)
+    record("segmenter.extract_us", per_100 * 10, "us")
+    record("segmenter.stream_ms", _median_ms(feed_all, args.repeat))
+    return None
+
+
+def bench_scoring(args, record: Recorder, workdir: str) -> Optional[str]:
+    from app.services import scoring, storage
+    from app.utils import algo
+
+    _use_data_dir(os.path.join(workdir, "scoring"))
+    if algo.get_model() is None:
+        return "embedding model unavailable"
+
+    # 每次都用没见过的句子，量的是真实 encode，而不是 embedding 缓存
+    seq = iter(range(10 ** 9))
+
+    def fresh() -> str:
+        i = next(seq)
+        return f"{_TEXTS[i % len(_TEXTS)]} #{i}"
+
+    context = [algo.get_embedding(fresh()) for _ in range(20)]
+    record("scoring.calculate_metrics_ms", _median_ms(lambda: algo.calculate_metrics(fresh(), context), args.repeat))
+
+    story_id = storage.create_story()
+    storage.append_turns(story_id, scoring.score_turns(story_id, [{"author": "human", "text": fresh()} for _ in range(20)]))
+    for rounds in (1, 5):
+        record(
+            f"scoring.score_turns_{rounds}_ms",
+            _median_ms(lambda: scoring.score_turns(story_id, [{"author": "ai", "text": fresh()} for _ in range(rounds)]), args.repeat),
+        )
+    return None
+
+
+def _synthetic_turns(rng: np.random.Generator, start: int, count: int, dim: int) -> List[Dict[str, Any]]:
+    embs = rng.standard_normal((count, dim), dtype=np.float32).tolist() if dim else None
+    scores = rng.random((count, 4)).round(4).tolist()
+    turns = []
+    for i in range(count):
+        turn = {
+            "author": "human" if (start + i) % 2 == 0 else "ai",
+            "text": f"{_TEXTS[(start + i) % len(_TEXTS)]}（第 {start + i} 句）",
+            "flow_score": scores[i][0], "entropy_score": scores[i][1], "x": scores[i][2], "y": scores[i][3],
+        }
+        if embs is not None:
+            turn["embedding"] = embs[i]
+        turns.append(turn)
+    return turns
+
+
+def bench_storage(args, record: Recorder, workdir: str) -> Optional[str]:
+    from app.services import storage
+
+    rng = np.random.default_rng(args.seed)
+    for backend in args.storage_backends.split(","):
+        _use_data_dir(os.path.join(workdir, "storage-" + backend), backend, fsync=args.fsync)
+        for n in _ints(args.storage_sizes):
+            story_id = storage.create_story()
+            for s in range(0, n, 1000):
+                storage.append_turns(story_id, _synthetic_turns(rng, s, min(1000, n - s), args.storage_dim))
+
+            prefix = f"storage.{backend}.{_size_label(n)}"
+            one = _synthetic_turns(rng, n, 1, args.storage_dim)
+            record(f"{prefix}.append_ms", _median_ms(lambda: storage.append_turns(story_id, one), args.repeat))
+            # 整段读取随 n 线性增长：大 story 少读几次
+            reads = max(3, min(args.repeat, 300_000 // n))
+            record(f"{prefix}.get_story_turns_ms", _median_ms(lambda: storage.get_story_turns(story_id), reads))
+            record(f"{prefix}.get_recent_turns_ms", _median_ms(lambda: storage.get_recent_turns(story_id, 20), args.repeat))
+    return None
+
+
+def bench_analysis(args, record: Recorder, workdir: str) -> Optional[str]:
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.services import analysis_data
+    from app.utils import columnar
+
+    client = TestClient(app)  # 不进 lifespan：不预热 embedding 模型
+    headers = {"Accept-Encoding": "gzip"}
+    rng = np.random.default_rng(args.seed)
+    rounds_per_story = 10
+
+    def get(url: str):
+        resp = client.get(url, headers=headers)
+        resp.raise_for_status()
+        return resp
+
+    def drop_memory_cache():
+        analysis_data._cache = None
+
+    def drop_all_caches():
+        drop_memory_cache()
+        shutil.rmtree(os.path.join(settings.DATA_DIR, ".analysis"), ignore_errors=True)
+
+    for n in _ints(args.analysis_points):
+        data_dir = os.path.join(workdir, f"analysis-{n}")
+        _use_data_dir(data_dir)
+        stories = {}
+        for s in range(0, n, rounds_per_story):
+            rounds = _synthetic_turns(rng, s, min(rounds_per_story, n - s), args.analysis_dim)
+            for t in rounds:
+                del t["x"], t["y"]
+            stories[f"bench_{s // rounds_per_story:06d}"] = {"group": "human" if s % 20 else "ai", "rounds": rounds}
+        analysis_data.stories_to_table(os.path.join(data_dir, "bench" + columnar.SUFFIX), stories)
+        del stories
+        analysis_data.rebuild()
+
+        prefix = f"analysis.{_size_label(n)}"
+        reads = max(3, min(args.repeat, 30_000 // n))
+
+        def cold():
+            drop_all_caches()
+            get("/api/analysis/all-data")
+
+        def from_disk():
+            drop_memory_cache()
+            get("/api/analysis/all-data")
+
+        record(f"{prefix}.cold_ms", _median_ms(cold, reads, warmup=0))
+        record(f"{prefix}.disk_cache_ms", _median_ms(from_disk, reads, warmup=0))
+        record(f"{prefix}.warm_ms", _median_ms(lambda: get("/api/analysis/all-data"), args.repeat))
+        record(f"{prefix}.page_ms", _median_ms(lambda: get("/api/analysis/all-data?limit=100"), args.repeat))
+        record(f"{prefix}.bytes", len(get("/api/analysis/all-data").content), "bytes", better=None)
+        drop_all_caches()
+    return None
+
+
+def _wait_http(url: str, timeout: float, proc: subprocess.Popen) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{' '.join(proc.args)} exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout:.0f}s")
+
+
+def bench_ws(args, record: Recorder, workdir: str) -> Optional[str]:
+    from app.scripts import load_ws
+
+    data_dir = os.path.join(workdir, "ws")
+    os.makedirs(data_dir, exist_ok=True)
+    if os.path.exists(_REPO_PCA_PATH):
+        shutil.copy(_REPO_PCA_PATH, os.path.join(data_dir, "pca_model.pkl"))
+
+    llm_port, api_port = _free_port(), _free_port()
+    env = dict(
+        os.environ,
+        DEEPSEEK_BASE_URL=f"http://127.0.0.1:{llm_port}",
+        DEEPSEEK_API_KEY="bench",
+        LOG_LEVEL="WARNING",
+    )
+    procs = [
+        subprocess.Popen([
+            sys.executable, "-m", "app.scripts.mock_llm_server",
+            "--port", str(llm_port), "--delay", str(args.llm_delay),
+        ]),
+        subprocess.Popen(
+            [sys.executable, "-m", "app.scripts.bench_suite", "--serve", str(api_port), "--data-dir", data_dir],
+            env=env,
+        ),
+    ]
+    base_url = f"http://127.0.0.1:{api_port}"
+    try:
+        _wait_http(f"http://127.0.0.1:{llm_port}/stats", 30, procs[0])
+        # 等模型预热结束（加载失败也算结束），第一轮不把加载时间算进去
+        _wait_http(f"{base_url}/api/health/ready", 300, procs[1])
+
+        async def sweep(clients: int):
+            ws_url = base_url.replace("http://", "ws://")
+            t0 = time.perf_counter()
+            results = await asyncio.gather(
+                *[load_ws._client(base_url, ws_url, args.ws_rounds, i) for i in range(clients)],
+                return_exceptions=True,
+            )
+            return results, time.perf_counter() - t0
+
+        for clients in _ints(args.ws_concurrency):
+            results, wall = asyncio.run(sweep(clients))
+            ok = [r for r in results if not isinstance(r, Exception)]
+            first, first_ai, total = ([x * 1000 for x in col if x is not None] for col in zip(*ok)) if ok else ([], [], [])
+            prefix = f"ws.c{clients}"
+            record(f"{prefix}.first_turn_p50_ms", _pct(first, 50))
+            record(f"{prefix}.first_turn_p95_ms", _pct(first, 95))
+            record(f"{prefix}.first_ai_p50_ms", _pct(first_ai, 50))
+            record(f"{prefix}.first_ai_p95_ms", _pct(first_ai, 95))
+            record(f"{prefix}.round_p95_ms", _pct(total, 95))
+            record(f"{prefix}.rounds_per_s", len(ok) / wall, "1/s", better="higher")
+            record(f"{prefix}.errors", len(results) - len(ok), "count")
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+    return None
+
+
+_BENCHES = {
+    "segmenter": bench_segmenter,
+    "scoring": bench_scoring,
+    "storage": bench_storage,
+    "analysis": bench_analysis,
+    "ws": bench_ws,
+}
+
+
+# ====== 比较 ======
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: Optional[float] = None) -> int:
+    """打印逐项对比，返回退化的指标个数"""
+    old, new = baseline.get("metrics", {}), current.get("metrics", {})
+    print(f"\n=== {baseline.get('meta', {}).get('commit')} -> {current.get('meta', {}).get('commit')} ===")
+    regressions = 0
+    for name in sorted(set(old) | set(new)):
+        if name not in new or name not in old:
+            print(f"  {name:<48} {'missing' if name not in new else 'new'}")
+            continue
+        a, b = old[name]["value"], new[name]["value"]
+        better, unit = new[name].get("better"), new[name].get("unit", "ms")
+        change = (b - a) / a if a else (0.0 if a == b else float("inf"))
+        status = ""
+        if better in ("lower", "higher") and np.isfinite(a) and np.isfinite(b):
+            worse = b - a if better == "lower" else a - b
+            tol = tolerance if tolerance is not None else TOLERANCES.get(name.split(".")[0], 0.2)
+            if worse > abs(a) * tol and worse > NOISE_FLOOR.get(unit, 0.0):
+                status = f"❌ regression (> {tol:.0%})"
+                regressions += 1
+            elif -worse > abs(a) * tol and -worse > NOISE_FLOOR.get(unit, 0.0):
+                status = "✅ improved"
+        print(f"  {name:<48} {a:12.3f} -> {b:12.3f} {unit:<5} {change:+8.1%}  {status}")
+    print(f"{'❌' if regressions else '✅'} {regressions} regression(s)")
+    return regressions
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ====== 入口 ======
+def _serve(port: int, data_dir: str) -> None:
+    """ws case 用：在 data_dir 上起一个后端（子进程里运行，和压测客户端分开）"""
+    import uvicorn
+
+    _use_data_dir(data_dir)
+    from app.main import app
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def run(args) -> Dict[str, Any]:
+    record = Recorder()
+    cases = [c for c in args.cases.split(",") if c]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        raise SystemExit(f"unknown case(s): {', '.join(sorted(unknown))} (allowed: {', '.join(CASES)})")
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="storylab-bench-") as workdir:
+        for case in cases:
+            print(f"\n=== {case} ===")
+            t0 = time.perf_counter()
+            reason = _BENCHES[case](args, record, workdir)
+            if reason:
+                record.skipped[case] = reason
+                print(f"  ⏭️  skipped: {reason}")
+            else:
+                print(f"  ({time.perf_counter() - t0:.1f}s)")
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "elapsed_s": round(time.perf_counter() - started, 1),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "compare", "serve", "data_dir")},
+        },
+        "metrics": record.metrics,
+        "skipped": record.skipped,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--repeat", type=int, default=30, help="每项指标的采样次数（取中位数）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--storage-sizes", default="1000,10000,100000")
+    parser.add_argument("--storage-backends", default="log,sqlite")
+    parser.add_argument("--storage-dim", type=int, default=64, help="存储 case 的 embedding 维度（0 = 不带 embedding）")
+    parser.add_argument("--fsync", action="store_true", help="存储 case 每次 append 都 fsync（默认关，减少磁盘抖动）")
+    parser.add_argument("--analysis-points", default="1000,10000", help="合成数据集的 round 总数（每个 story 10 轮）")
+    parser.add_argument("--analysis-dim", type=int, default=384)
+    parser.add_argument("--ws-concurrency", default="1,10,50")
+    parser.add_argument("--ws-rounds", type=int, default=3)
+    parser.add_argument("--llm-delay", type=float, default=0.02, help="mock LLM 每个 SSE chunk 的间隔（秒）")
+    parser.add_argument("--out", help="结果 JSON 的路径")
+    parser.add_argument("--baseline", help="跑完后与这份结果比较，有退化时退出码为 1")
+    parser.add_argument("--tolerance", type=float, help="统一的相对容差（默认按 case 取 TOLERANCES）")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="只比较两份已有结果")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        _serve(args.serve, args.data_dir)
+        return 0
+    if args.compare:
+        return 1 if compare(_load(args.compare[0]), _load(args.compare[1]), args.tolerance) else 0
+
+    # 基准里不要逐条的 INFO 日志（环境变量显式指定时照旧）
+    if "LOG_LEVEL" not in os.environ:
+        settings.LOG_LEVEL = "WARNING"
+    setup_logging()
+
+    result = run(args)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 {args.out}")
+    if args.baseline:
+        return 1 if compare(_load(args.baseline), result, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+验证 LLM 连接池复用：起一个本地 mock LLM，连续跑若干次续写（非流式 generate_ai_turns
+与流式 stream_ai_turns 共用同一个 AsyncClient），对比请求数与服务端看到的 TCP 连接数。
+
+用法（在 media-backend 目录下）:
+    python -m app.scripts.check_llm_pool --calls 20
+"""
+import argparse
+import asyncio
+import sys
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from app.scripts.mock_llm_server import create_app
+from app.services import llm_proxy
+
+
+def _start_mock(port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(create_app(delay=0.001), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def _run(calls: int) -> None:
+    await llm_proxy.startup_clients()
+    try:
+        for i in range(2 * calls):
+            payload = {"model": "mock", "messages": [{"role": "user", "content": f"第{i}次"}], "stream": True}
+            async for _ in llm_proxy._call_deepseek_stream(payload):
+                pass
+    finally:
+        await llm_proxy.shutdown_clients()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--port", type=int, default=9011)
+    args = parser.parse_args()
+
+    server = _start_mock(args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+    llm_proxy.DEEPSEEK_BASE_URL = base_url
+    llm_proxy.DEEPSEEK_API_KEY = "mock"
+
+    asyncio.run(_run(args.calls))
+    stats = httpx.get(f"{base_url}/stats").json()
+    server.should_exit = True
+
+    # 顺序请求全部复用同一条 keep-alive 连接
+    ok = stats["requests"] == 2 * args.calls and stats["connections"] == 1
+    print(f"{'✅' if ok else '❌'} requests={stats['requests']} connections={stats['connections']}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
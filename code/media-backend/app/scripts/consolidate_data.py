@@ -1,23 +1,44 @@
-
-import os
+# 用法（在 media-backend 目录下）: python -m app.scripts.consolidate_data [--workers 4] [--force] [--format both]
+#
+# 流水线：
+# 1) 每个实验文件是一个 source，流式逐条读记录（不整文件 json.load），每条产出 (embedding, point)
+# 2) embedding 攒够 BATCH_SIZE 条整批投影（Projection 的 float32 矩阵乘法）
+# 3) 各 source 在进程池里并行处理
+# 4) 每个 source 的结果缓存在 CACHE_DIR，清单里记录输入文件 (大小, mtime, sha1) 与 PCA 版本；
+#    没变的 source 直接复用缓存，只重算新增 / 修改过的实验文件，最后按固定顺序拼出 OUTPUT_PATH
+# 5) 缓存和输出都是列式格式（app/utils/columnar.py）：embedding 存 float32 矩阵，元数据按列存；
+#    --format both（默认）时另外写一份不带 embedding 的 analysis_dataset.json，兼容旧的读取方
+import argparse
+import hashlib
 import json
-import joblib
-import numpy as np
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import numpy as np
+
+from app.utils import columnar, projection
+from app.utils.json_stream import iter_members
+
 # 定义路径
 BASE_DIR = Path(__file__).resolve().parent.parent.parent  # media-backend
 # media-backend -> code -> media -> lab -> data
 DATA_ROOT = BASE_DIR.parent.parent.parent / "data"               # lab/data
-PCA_MODEL_PATH = BASE_DIR / "app/data/pca_model.pkl"
+PCA_MODEL_PATH = Path(projection.pca_path())  # 与线上打分 / rebuild 同一个模型（settings.PCA_PATH / DATA_DIR）
 OUTPUT_PATH = BASE_DIR / "app/data/analysis_dataset.json"
+CACHE_DIR = BASE_DIR / "app/data/.consolidate"
+OUTPUT_FIELDS = ("dataset", "id", "text", "x", "y", "type")
+
+BATCH_SIZE = 4096
 
-def load_pca():
-    if not PCA_MODEL_PATH.exists():
-        print(f"❌ PCA model not found at {PCA_MODEL_PATH}")
+def load_pca(path=PCA_MODEL_PATH):
+    """读成与线上相同的 Projection（float32 投影矩阵），批量 transform 只是一次矩阵乘法"""
+    if not Path(path).exists():
+        print(f"❌ PCA model not found at {path}")
         return None
-    print(f"✅ Loading PCA model from {PCA_MODEL_PATH}...")
-    return joblib.load(PCA_MODEL_PATH)
+    print(f"✅ Loading PCA model from {path}...")
+    return projection.load_file(str(path))
 
 def safe_float(v):
     try:
@@ -25,194 +46,261 @@ def safe_float(v):
     except:
         return 0.0
 
-def process_exp1(pca):
+# ====== 记录生成器：每条产出 (embedding, point)，point 的 x / y 稍后整批回填 ======
+def _point(dataset, pid, text, ptype):
+    return {"dataset": dataset, "id": pid, "text": text, "x": None, "y": None, "type": ptype}
+
+def records_exp1(path):
     """处理实验1数据"""
-    path = DATA_ROOT / "1/experiment_embeddings.json"
-    if not path.exists():
-        print(f"⚠️ Exp1 file not found: {path}")
-        return []
-        
-    print(f"Processing Exp1: {path}")
-    points = []
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            
-        for group_id, items in data.get("experiment_data", {}).items():
-            # 原始句
-            if "original_embedding" in items:
-                emb = np.array(items["original_embedding"]).reshape(1, -1)
-                xy = pca.transform(emb)[0]
-                points.append({
-                    "dataset": "Exp1",
-                    "id": f"{group_id}_orig",
-                    "text": items.get("original_sentence", "")[:50],
-                    "x": safe_float(xy[0]),
-                    "y": safe_float(xy[1]),
-                    "type": "human_orig"
-                })
-            
-            # 修改轮次
-            for round_idx, r in enumerate(items.get("modification_rounds", [])):
-                # 随机修改
-                if "random_mod_embedding" in r:
-                    emb = np.array(r["random_mod_embedding"]).reshape(1, -1)
-                    xy = pca.transform(emb)[0]
-                    points.append({
-                        "dataset": "Exp1",
-                        "id": f"{group_id}_r{round_idx}_rand",
-                        "text": r.get("random_modification", "")[:50],
-                        "x": safe_float(xy[0]),
-                        "y": safe_float(xy[1]),
-                        "type": "ai_noise"
-                    })
-                
-                # 优化结果
-                if "optimized_embedding" in r:
-                    emb = np.array(r["optimized_embedding"]).reshape(1, -1)
-                    xy = pca.transform(emb)[0]
-                    points.append({
-                        "dataset": "Exp1",
-                        "id": f"{group_id}_r{round_idx}_opt",
-                        "text": r.get("optimized_result", "")[:50],
-                        "x": safe_float(xy[0]),
-                        "y": safe_float(xy[1]),
-                        "type": "human_opt"
-                    })
-    except Exception as e:
-        print(f"❌ Error processing Exp1: {e}")
-        
-    return points
+    for group_id, items in iter_members(path, ("experiment_data",)):
+        # 原始句
+        if "original_embedding" in items:
+            yield items["original_embedding"], _point(
+                "Exp1", f"{group_id}_orig", items.get("original_sentence", "")[:50], "human_orig"
+            )
+
+        for round_idx, r in enumerate(items.get("modification_rounds", [])):
+            # 随机修改
+            if "random_mod_embedding" in r:
+                yield r["random_mod_embedding"], _point(
+                    "Exp1", f"{group_id}_r{round_idx}_rand", r.get("random_modification", "")[:50], "ai_noise"
+                )
+            # 优化结果
+            if "optimized_embedding" in r:
+                yield r["optimized_embedding"], _point(
+                    "Exp1", f"{group_id}_r{round_idx}_opt", r.get("optimized_result", "")[:50], "human_opt"
+                )
 
-def process_exp2(pca):
+def records_exp2(path):
     """处理实验2数据"""
-    path = DATA_ROOT / "2/experiment_2a_data.json"
-    if not path.exists():
-        print(f"⚠️ Exp2 file not found: {path}")
-        return []
+    for key, items in iter_members(path, ("experiment_data",)):
+        if "original_embedding" in items:
+            yield items["original_embedding"], _point(
+                "Exp2", f"{key}_orig", items.get("original_sentence", "")[:50], "human_orig"
+            )
+
+        for round_idx, r in enumerate(items.get("modification_rounds", [])):
+            if "selected_embedding" in r:
+                yield r["selected_embedding"], _point(
+                    "Exp2", f"{key}_r{round_idx}_sel", r.get("selected_result", "")[:50], "human_select"
+                )
+
+# 4a: cross_embedding, mutated_embedding
+# 4b: child_embedding, selected_embedding, etc.
+_EXP4_KEYS = [
+    "cross_embedding", "mutated_embedding", "child_embedding", "selected_embedding",
+    "random_mod_embedding", "optimized_embedding"
+]
+
+def records_exp4(path):
+    """处理实验4数据（4a / 4b 结构混合）"""
+    # Exp4 结构差异: root key可能是 "data" 或 "experiment_data"（"data" 非空时优先）
+    for key, items in iter_members(path, ("data", "experiment_data")):
+        if "original_embedding" in items:
+            yield items["original_embedding"], _point(
+                "Exp4", f"{key}_orig", items.get("original_sentence") or items.get("original", "")[:50], "seed"
+            )
+
+        # Rounds 可能叫 rounds, modification_rounds, generations
+        rounds = items.get("rounds") or items.get("modification_rounds") or items.get("generations") or []
+        for round_idx, r in enumerate(rounds):
+            for k in _EXP4_KEYS:
+                if k in r:
+                    # 尝试找对应的文本
+                    txt_key = k.replace("_embedding", "_result")  # e.g. cross_result
+                    if txt_key not in r:
+                        txt_key = "text"  # fallback
+                    yield r[k], _point(
+                        "Exp4", f"{key}_r{round_idx}_{k.split('_')[0]}",
+                        str(r.get(txt_key, r.get("text", "")))[:50], "evolution"
+                    )
+
+# (source 名, 相对 DATA_ROOT 的路径, 记录生成器)；输出按这个顺序拼接
+SOURCES = [
+    ("Exp1", "1/experiment_embeddings.json", records_exp1),
+    ("Exp2", "2/experiment_2a_data.json", records_exp2),
+    ("Exp4", "4/experiment_4a_data.json", records_exp4),
+    ("Exp4", "4/experiment_4b_data(AI).json", records_exp4),
+]
+_RECORDS = {fn.__name__: fn for _, _, fn in SOURCES}
+
+# ====== 单个 source（在子进程里跑） ======
+def project_points(pca, embs, points):
+    """把收集好的 embedding 一次性投影，回填到对应 point 的 x / y"""
+    if not points:
+        return points
+    xy = pca.transform(np.asarray(embs, dtype=np.float32))
+    for point, (x, y) in zip(points, xy):
+        point["x"] = safe_float(x)
+        point["y"] = safe_float(y)
+    return points
+
+def process_source(name, path, records_name, pca_path, cache_path, batch_size=BATCH_SIZE):
+    """
+    结果（元数据 + float32 embedding 矩阵）直接在子进程里写成 cache_path 列式表，只把点数传回主进程。
+    返回 (点数, ok)；读到一半出错时保留已处理的点，但 ok=False（不记入清单，下次重试）
+    """
+    print(f"Processing {name}: {path}")
+    pca = projection.load_file(pca_path)
+    points, blocks, pending_embs, pending_points = [], [], [], []
+    ok = True
+
+    def flush():
+        if pending_points:
+            block = np.asarray(pending_embs, dtype=np.float32)
+            points.extend(project_points(pca, block, pending_points))
+            blocks.append(block)
 
-    print(f"Processing Exp2: {path}")
-    points = []
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        for key, items in data.get("experiment_data", {}).items():
-            # 这里 experiment_data 的结构可能是一层
-            # 同样找 embedding
-            if "original_embedding" in items:
-                emb = np.array(items["original_embedding"]).reshape(1, -1)
-                xy = pca.transform(emb)[0]
-                points.append({
-                    "dataset": "Exp2",
-                    "id": f"{key}_orig",
-                    "text": items.get("original_sentence", "")[:50],
-                    "x": safe_float(xy[0]),
-                    "y": safe_float(xy[1]),
-                    "type": "human_orig"
-                })
-
-            for round_idx, r in enumerate(items.get("modification_rounds", [])):
-                if "selected_embedding" in r:
-                    emb = np.array(r["selected_embedding"]).reshape(1, -1)
-                    xy = pca.transform(emb)[0]
-                    points.append({
-                        "dataset": "Exp2",
-                        "id": f"{key}_r{round_idx}_sel",
-                        "text": r.get("selected_result", "")[:50],
-                        "x": safe_float(xy[0]),
-                        "y": safe_float(xy[1]),
-                        "type": "human_select"
-                    })
+        for emb, point in _RECORDS[records_name](path):
+            pending_embs.append(emb)
+            pending_points.append(point)
+            if len(pending_points) >= batch_size:
+                flush()
+                pending_embs, pending_points = [], []
     except Exception as e:
-        print(f"❌ Error processing Exp2: {e}")
-        
-    return points
+        ok = False
+        print(f"❌ Error processing {name} {path}: {e}")
+    try:
+        flush()
+    except Exception as e:
+        ok = False
+        print(f"❌ Error projecting {name} {path}: {e}")
 
-def process_exp4(pca):
-    """处理实验4数据"""
-    # 实验4有两个 json: experiment_4a_data.json 和 experiment_4b_data(AI).json
-    files = ["4/experiment_4a_data.json", "4/experiment_4b_data(AI).json"]
-    points = []
-    
-    for fname in files:
-        path = DATA_ROOT / fname
-        if not path.exists():
-            continue
-            
-        print(f"Processing Exp4: {path}")
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                
-            # Exp4 结构差异: root key可能是 "data" 或 "experiment_data"
-            content = data.get("data") or data.get("experiment_data", {})
-            
-            for key, items in content.items():
-                if "original_embedding" in items:
-                    emb = np.array(items["original_embedding"]).reshape(1, -1)
-                    xy = pca.transform(emb)[0]
-                    points.append({
-                        "dataset": "Exp4",
-                        "id": f"{key}_orig",
-                        "text": items.get("original_sentence") or items.get("original", "")[:50],
-                        "x": safe_float(xy[0]),
-                        "y": safe_float(xy[1]),
-                        "type": "seed"
-                    })
-                    
-                # Rounds 可能叫 rounds, modification_rounds, generations
-                rounds = items.get("rounds") or items.get("modification_rounds") or items.get("generations") or []
-                
-                for round_idx, r in enumerate(rounds):
-                    # 检查里面的字段 (4a/4b 混合)
-                    # 4a: cross_embedding, mutated_embedding
-                    # 4b: child_embedding, selected_embedding, etc.
-                    keys_to_check = [
-                        "cross_embedding", "mutated_embedding", "child_embedding", "selected_embedding", 
-                        "random_mod_embedding", "optimized_embedding"
-                    ]
-                    
-                    for k in keys_to_check:
-                         if k in r:
-                            emb = np.array(r[k]).reshape(1, -1)
-                            xy = pca.transform(emb)[0]
-                            # 尝试找对应的文本
-                            txt_key = k.replace("_embedding", "_result") # e.g. cross_result
-                            if txt_key not in r:
-                                txt_key = "text" # fallback
-                                
-                            points.append({
-                                "dataset": "Exp4",
-                                "id": f"{key}_r{round_idx}_{k.split('_')[0]}",
-                                "text": str(r.get(txt_key, r.get("text", "")))[:50],
-                                "x": safe_float(xy[0]),
-                                "y": safe_float(xy[1]),
-                                "type": "evolution"
-                            })
-
-        except Exception as e:
-            print(f"❌ Error processing Exp4 {fname}: {e}")
-            
-    return points
+    embeddings = np.concatenate(blocks) if blocks else None
+    columns = {k: [p[k] for p in points] for k in OUTPUT_FIELDS}
+    columnar.write_table(cache_path, columns, embeddings)
+    return len(points), ok
+
+# ====== 增量缓存 ======
+def _sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _cache_file(rel):
+    return CACHE_DIR / (hashlib.sha1(rel.encode("utf-8")).hexdigest()[:16] + columnar.SUFFIX)
+
+def _load_manifest():
+    try:
+        with open(CACHE_DIR / "manifest.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_manifest(manifest):
+    tmp = CACHE_DIR / "manifest.json.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, CACHE_DIR / "manifest.json")
+
+def _is_fresh(entry, path, proj_version):
+    """(大小, mtime) 没变直接算命中；变了再比内容 sha1（复制 / touch 过的文件不重算）"""
+    if not entry or entry.get("proj_version") != proj_version or not _cache_file(entry["rel"]).exists():
+        return False
+    st = os.stat(path)
+    if entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+        return True
+    if entry["size"] == st.st_size and entry["sha1"] == _sha1(path):
+        entry["mtime_ns"] = st.st_mtime_ns
+        return True
+    return False
+
+def _write_output(rels, fmt):
+    """各 source 缓存表按固定顺序拼成一张表：embedding 从 memmap 直接拼接，不经过 JSON"""
+    tables = [columnar.load_table(str(_cache_file(rel))) for rel in rels]
+    columns = {k: [] for k in OUTPUT_FIELDS}
+    for t in tables:
+        for k in OUTPUT_FIELDS:
+            col = t.column(k)
+            columns[k].extend(col.tolist() if isinstance(col, np.ndarray) else col)
+    mats = [t.embeddings for t in tables if t.embeddings is not None]
+    embeddings = np.concatenate(mats) if mats else None
+
+    if fmt in ("cols", "both"):
+        columnar.write_table(columnar.table_path(str(OUTPUT_PATH)), columns, embeddings)
+    if fmt in ("json", "both"):
+        n = len(columns["id"])
+        points = [{k: columns[k][i] for k in OUTPUT_FIELDS} for i in range(n)]
+        tmp = OUTPUT_PATH.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(points, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, OUTPUT_PATH)
 
 def main():
-    pca = load_pca()
+    global DATA_ROOT, PCA_MODEL_PATH, OUTPUT_PATH, CACHE_DIR
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-root", default=str(DATA_ROOT))
+    parser.add_argument("--pca", default=str(PCA_MODEL_PATH))
+    parser.add_argument("--output", default=str(OUTPUT_PATH))
+    parser.add_argument("--cache-dir", default=str(CACHE_DIR))
+    parser.add_argument("--workers", type=int, default=min(len(SOURCES), os.cpu_count() or 1))
+    parser.add_argument("--force", action="store_true", help="忽略缓存，全部重算")
+    parser.add_argument(
+        "--format", choices=("cols", "json", "both"), default="both",
+        help="cols: 只写列式 analysis_dataset.cols；json: 只写 analysis_dataset.json；both: 都写",
+    )
+    args = parser.parse_args()
+    DATA_ROOT, PCA_MODEL_PATH = Path(args.data_root), Path(args.pca)
+    OUTPUT_PATH, CACHE_DIR = Path(args.output), Path(args.cache_dir)
+
+    pca = load_pca(PCA_MODEL_PATH)
     if not pca:
         return
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+
+    manifest = {} if args.force else _load_manifest()
+    present, todo = [], []
+    for name, rel, fn in SOURCES:
+        path = DATA_ROOT / rel
+        if not path.exists():
+            print(f"⚠️ {name} file not found: {path}")
+            continue
+        present.append(rel)
+        if _is_fresh(manifest.get(rel), path, pca.version):
+            print(f"♻️ {name} unchanged, reuse cache: {path}")
+        else:
+            todo.append((name, rel, fn, path))
+
+    # 先记下输入文件的状态再处理：处理期间文件又被改了，下次运行还会重算
+    stats = {rel: (os.stat(path), _sha1(path)) for _, rel, _, path in todo}
+    workers = max(1, min(args.workers, len(todo)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            rel: pool.submit(
+                process_source, name, str(path), fn.__name__, str(PCA_MODEL_PATH), str(_cache_file(rel))
+            )
+            for name, rel, fn, path in todo
+        }
+        total = 0
+        counts = {}
+        for rel, fut in futures.items():
+            n, ok = fut.result()
+            total += n
+            counts[rel] = n
+            st, digest = stats[rel]
+            if ok:
+                manifest[rel] = {
+                    "rel": rel, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                    "sha1": digest, "proj_version": pca.version, "points": n,
+                }
+            else:
+                manifest.pop(rel, None)
+    _save_manifest(manifest)
 
-    all_points = []
-    all_points.extend(process_exp1(pca))
-    all_points.extend(process_exp2(pca))
-    all_points.extend(process_exp4(pca))
-
-    print(f"Total points collected: {len(all_points)}")
-    
-    # Save
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-        json.dump(all_points, f, ensure_ascii=False, separators=(',', ':'))
-    
-    print(f"🎉 Saved analysis dataset to {OUTPUT_PATH}")
+    _write_output(present, args.format)
+    n_points = sum(counts.get(rel, manifest.get(rel, {}).get("points", 0)) for rel in present)
+    print(
+        f"Total points collected: {n_points}"
+        f"（重算 {len(todo)} 个 source / {total} 点，复用 {len(present) - len(todo)} 个，"
+        f"{time.perf_counter() - t0:.2f}s）"
+    )
+    outputs = {"cols": [columnar.table_path(str(OUTPUT_PATH))], "json": [str(OUTPUT_PATH)]}
+    outputs["both"] = outputs["cols"] + outputs["json"]
+    print(f"🎉 Saved analysis dataset to {', '.join(outputs[args.format])}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,154 @@
+"""
+把现有的 JSON 数据集转换成列式格式（app/utils/columnar.py），输出到同目录的 <name>.cols/。
+
+支持两种 JSON：
+- {"data": {story_id: {..., "rounds": [...]}}}：data/ 下的 *_embeddings.json（分析接口读取的格式）
+- [{"dataset", "id", "text", "x", "y", "type", ...}, ...]：consolidate_data 产出的 analysis_dataset.json
+
+分析接口看到同名的 .cols 会优先用它、忽略 .json；转换后原 JSON 可以保留，也可以删掉。
+--verify 会把列式表读回来和原 JSON 逐字段比较（embedding 按 float32 精度比较）。
+
+用法（在 media-backend 目录下）:
+    python -m app.scripts.convert_columnar                      # 转换 DATA_DIR 下还没有 .cols 的数据集 JSON
+    python -m app.scripts.convert_columnar path/a.json --verify
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.services import analysis_data
+from app.utils import columnar
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def convert_points(out: str, points: List[Dict[str, Any]]) -> int:
+    """点列表：embedding 字段（如果有）进矩阵，其余字段按列存"""
+    vectors = [p.get("embedding") for p in points]
+    embeddings = mask = None
+    dims = {len(v) for v in vectors if v}
+    if len(dims) == 1:
+        embeddings = np.zeros((len(points), dims.pop()), dtype=np.float32)
+        mask = np.zeros(len(points), dtype=bool)
+        for i, v in enumerate(vectors):
+            if v:
+                embeddings[i] = v
+                mask[i] = True
+    exclude = ("embedding",) if embeddings is not None else ()
+    columnar.write_table(out, columnar.columns_from_rows(points, exclude=exclude), embeddings, mask)
+    return len(points)
+
+
+def _same(a: Any, b: Any) -> bool:
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.array_equal(np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32))
+    if isinstance(a, float) or isinstance(b, float):
+        return float(a) == float(b)
+    return a == b
+
+
+def _norm(value: Any) -> Any:
+    """比较前把嵌套里的 embedding 变成 ndarray（float32 存储会丢掉 float64 的尾数）"""
+    if isinstance(value, dict):
+        return {k: (np.asarray(v, dtype=np.float32) if k == "embedding" else _norm(v)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_norm(v) for v in value]
+    return value
+
+
+def _diff(a: Any, b: Any, where: str) -> List[str]:
+    if isinstance(a, dict) and isinstance(b, dict):
+        out = [f"{where}.{k}: missing" for k in a.keys() ^ b.keys()]
+        for k in a.keys() & b.keys():
+            out += _diff(a[k], b[k], f"{where}.{k}")
+        return out
+    if isinstance(a, list) and isinstance(b, list):
+        if len(a) != len(b):
+            return [f"{where}: length {len(a)} != {len(b)}"]
+        return [d for i, (x, y) in enumerate(zip(a, b)) for d in _diff(x, y, f"{where}[{i}]")]
+    return [] if _same(a, b) else [f"{where}: {a!r:.60} != {b!r:.60}"]
+
+
+def verify(out: str, content: Any) -> List[str]:
+    table = columnar.load_table(out)
+    if isinstance(content, list):
+        got = table.rows()
+        if table.embeddings is not None:
+            mask = table.embedding_mask
+            for i, row in enumerate(got):
+                if mask is None or mask[i]:
+                    row["embedding"] = np.asarray(table.embeddings[i])
+        return _diff(_norm(content), _norm(got), "$")
+    expected = {
+        sid: dict(story, rounds=story.get("rounds") or [])
+        for sid, story in content["data"].items()
+    }
+    return _diff(_norm(expected), _norm(analysis_data.stories_from_table(table)), "$.data")
+
+
+def convert(path: Path, check: bool) -> bool:
+    t0 = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        content = json.load(f)
+    json_load = time.perf_counter() - t0
+
+    out = columnar.table_path(str(path))
+    if isinstance(content, list):
+        n = convert_points(out, content)
+    elif isinstance(content, dict) and isinstance(content.get("data"), dict):
+        n = analysis_data.stories_to_table(out, content["data"])
+    else:
+        print(f"⚠️ 跳过 {path}: 不认识的结构")
+        return True
+
+    t0 = time.perf_counter()
+    table = columnar.load_table(out)
+    if table.embeddings is not None:
+        float(table.embeddings[-1, -1])
+    cols_load = time.perf_counter() - t0
+    print(
+        f"✅ {path.name} -> {os.path.basename(out)}: {n} 行, dim={table.dim}, "
+        f"{path.stat().st_size / 1e6:.1f} MB -> {_dir_size(out) / 1e6:.1f} MB, "
+        f"打开 {json_load * 1000:.0f} ms -> {cols_load * 1000:.1f} ms"
+    )
+
+    if check:
+        problems = verify(out, content)
+        if problems:
+            print(f"❌ {path.name} 读回后不一致（{len(problems)} 处），例如:")
+            for p in problems[:5]:
+                print(f"   {p}")
+            return False
+        print("   读回一致 ✅")
+    return True
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*", help="要转换的 JSON 文件（已有 .cols 会覆盖）；不给则转换 DATA_DIR 下还没转换过的")
+    parser.add_argument("--verify", action="store_true", help="读回列式表和原 JSON 逐字段比较")
+    args = parser.parse_args()
+
+    if args.paths:
+        paths = [Path(p) for p in args.paths]
+    else:
+        paths = [p for p in analysis_data.dataset_files() if p.suffix == ".json"]
+    if not paths:
+        print("⚠️ 没有要转换的 JSON 文件")
+        return 0
+    ok = True
+    for path in sorted(paths):
+        ok &= convert(path, args.verify)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
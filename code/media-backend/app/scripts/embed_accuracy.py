@@ -0,0 +1,154 @@
+"""
+Embedding 后端精度 / 速度报告：用已存的 story 文本，把 onnx / onnx-int8 的结果和 torch fp32 基线逐句对比。
+
+每个 story 的全部 turn 按原顺序链式打分（score_embeddings_batch，与线上同一公式），报告:
+- 向量：与基线的余弦相似度 mean / min
+- 分数：|Δflow|、|Δentropy|、PCA 坐标偏移 |Δ(x, y)| 的 mean / p95 / max（没有 PCA 模型时坐标恒为 0）
+- 速度：逐句单独 encode（线上 ws 的典型调用）的 p50 延迟，以及相对 torch 的加速比
+
+不写存储，只读 turns；EMBED_QUANT_CONFIG / EMBED_ONNX_DIR 与线上一致。
+
+用法（在 media-backend 目录下，需要 pip install "sentence-transformers[onnx]"）:
+    python -m app.scripts.embed_accuracy
+    python -m app.scripts.embed_accuracy --backends onnx-int8 --limit 2000 --out bench/embed_accuracy.json
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.core.config import settings
+from app.services import storage
+from app.utils import algo, embed_backend, projection
+from app.utils.context_state import ContextState
+
+
+def _load_stories(limit: int) -> List[List[str]]:
+    stories, total = [], 0
+    for story_id in storage.list_story_ids():
+        texts = [t["text"] for t in storage.get_story_turns(story_id) if t.get("text")]
+        if not texts:
+            continue
+        if limit and total + len(texts) > limit:
+            texts = texts[:limit - total]
+        stories.append(texts)
+        total += len(texts)
+        if limit and total >= limit:
+            break
+    return stories
+
+
+def _score(model, stories: List[List[str]]) -> Dict[str, np.ndarray]:
+    emb, flow, entropy, coords = [], [], [], []
+    for texts in stories:
+        e = np.asarray(model.encode(texts), dtype=np.float32)
+        rows = algo.score_embeddings_batch(e, ContextState())
+        emb.append(e)
+        flow += [r["flow_score"] for r in rows]
+        entropy += [r["entropy_score"] for r in rows]
+        coords += [(r["x"], r["y"]) for r in rows]
+    return {
+        "emb": np.vstack(emb),
+        "flow": np.asarray(flow),
+        "entropy": np.asarray(entropy),
+        "coords": np.asarray(coords),
+    }
+
+
+def _latency_ms(model, texts: List[str]) -> float:
+    model.encode(texts[:1])
+    samples = []
+    for text in texts:
+        t0 = time.perf_counter()
+        model.encode([text])
+        samples.append((time.perf_counter() - t0) * 1000)
+    return float(np.percentile(samples, 50))
+
+
+def _summary(values: np.ndarray) -> Dict[str, float]:
+    return {
+        "mean": round(float(values.mean()), 6),
+        "p95": round(float(np.percentile(values, 95)), 6),
+        "max": round(float(values.max()), 6),
+    }
+
+
+def _compare(base: Dict[str, np.ndarray], other: Dict[str, np.ndarray]) -> Dict[str, dict]:
+    a, b = base["emb"], other["emb"]
+    cos = np.einsum("ij,ij->i", a, b) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return {
+        "cosine": {"mean": round(float(cos.mean()), 6), "min": round(float(cos.min()), 6)},
+        "flow": _summary(np.abs(base["flow"] - other["flow"])),
+        "entropy": _summary(np.abs(base["entropy"] - other["entropy"])),
+        "coords": _summary(np.linalg.norm(base["coords"] - other["coords"], axis=1)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="onnx,onnx-int8", help="与 torch 基线对比的后端，逗号分隔")
+    parser.add_argument("--limit", type=int, default=1000, help="最多用多少条 turn（0 = 全部）")
+    parser.add_argument("--latency-sentences", type=int, default=100, help="测单句延迟用的句数")
+    parser.add_argument("--out", help="结果另存为 JSON")
+    args = parser.parse_args()
+
+    backends = [b for b in args.backends.split(",") if b]
+    for b in backends:
+        if b not in embed_backend.BACKENDS or b == "torch":
+            raise SystemExit(f"❌ 不支持的对比后端: {b}（可选 onnx / onnx-int8）")
+
+    stories = _load_stories(args.limit)
+    total = sum(len(s) for s in stories)
+    if not total:
+        raise SystemExit("❌ 存储里没有带文本的 turn，先跑几轮故事再来")
+    projection.reload()
+    sample = [t for s in stories for t in s][:args.latency_sentences]
+    print(f"📚 {len(stories)} 个 story，{total} 条 turn；PCA {projection.status().get('version') or '无'}")
+
+    results: Dict[str, dict] = {}
+    baseline = None
+    for backend in ["torch"] + backends:
+        try:
+            model = embed_backend.load(
+                algo.MODEL_NAME, backend, settings.EMBED_QUANT_CONFIG, settings.EMBED_ONNX_DIR,
+            )
+        except Exception as e:
+            if backend == "torch":
+                raise SystemExit(f"❌ torch 基线模型加载失败: {e}")
+            print(f"⚠️ {backend}: 加载失败，跳过（{e}）")
+            continue
+        scored = _score(model, stories)
+        entry = {"latency_p50_ms": round(_latency_ms(model, sample), 3)}
+        if baseline is None:
+            baseline = scored
+        else:
+            entry.update(_compare(baseline, scored))
+            entry["speedup"] = round(results["torch"]["latency_p50_ms"] / entry["latency_p50_ms"], 2)
+        results[backend] = entry
+
+    base_ms = results["torch"]["latency_p50_ms"]
+    print(f"\n{'backend':<10} {'p50 ms':>8} {'加速':>6} {'cos mean':>9} {'cos min':>8} "
+          f"{'Δflow p95':>10} {'Δentropy p95':>13} {'Δxy p95':>8}")
+    print(f"{'torch':<10} {base_ms:8.2f} {1.0:5.2f}x")
+    for backend in backends:
+        r = results.get(backend)
+        if r is None:
+            continue
+        print(
+            f"{backend:<10} {r['latency_p50_ms']:8.2f} {r['speedup']:5.2f}x {r['cosine']['mean']:9.5f} "
+            f"{r['cosine']['min']:8.5f} {r['flow']['p95']:10.4f} {r['entropy']['p95']:13.4f} "
+            f"{r['coords']['p95']:8.3f}"
+        )
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"stories": len(stories), "turns": total, "backends": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 已写入 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
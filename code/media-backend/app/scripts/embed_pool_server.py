@@ -0,0 +1,48 @@
+"""
+进程外 Embedding 池：父进程加载一次模型，fork 出 --workers 个进程（权重写时复制共享），
+每个进程 --torch-threads 个 torch 线程，在 Unix socket 上服务编码请求。
+web worker 设置 EMBED_POOL_SOCKET 后不再各自加载模型，加多少个 uvicorn worker 模型都只有一份。
+
+用法（在 media-backend 目录下，Linux / macOS）:
+    python -m app.scripts.embed_pool_server --socket /tmp/storylab-embed.sock --workers 2 --torch-threads 2
+    EMBED_POOL_SOCKET=/tmp/storylab-embed.sock uvicorn app.main:app --workers 4
+"""
+import argparse
+import os
+
+from app.core.config import settings
+from app.core.log import setup_logging
+from app.utils import embed_backend, embed_pool
+from app.utils.algo import MODEL_NAME
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", default=settings.EMBED_POOL_SOCKET or "/tmp/storylab-embed.sock")
+    parser.add_argument("--workers", type=int, default=settings.EMBED_POOL_WORKERS)
+    parser.add_argument(
+        "--torch-threads", type=int, default=settings.EMBED_POOL_TORCH_THREADS,
+        help="每个 worker 的 torch 线程数（0 = CPU 核数 / worker 数）",
+    )
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--backend", default=settings.EMBED_BACKEND, choices=embed_backend.BACKENDS)
+    parser.add_argument(
+        "--no-preload", action="store_true",
+        help="每个 worker 各自加载模型（不共享权重；父进程加载后 fork 有问题时用）",
+    )
+    args = parser.parse_args()
+
+    setup_logging()
+    workers = max(1, args.workers)
+    threads = args.torch_threads or max(1, (os.cpu_count() or 1) // workers)
+
+    def load_model():
+        return embed_backend.load(
+            args.model, args.backend, settings.EMBED_QUANT_CONFIG, settings.EMBED_ONNX_DIR, threads=threads,
+        )
+
+    embed_pool.serve(args.socket, load_model, workers=workers, threads=threads, preload=not args.no_preload)
+
+
+if __name__ == "__main__":
+    main()
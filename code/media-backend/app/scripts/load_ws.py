@@ -0,0 +1,81 @@
+"""
+WebSocket 压测：N 个并发客户端各自建一个 story、发一轮输入，统计
+time-to-first-turn（human turn 回推）与 time-to-first-AI-turn 的 p50 / p99。
+
+先用 mock LLM（不配置 DEEPSEEK_API_KEY）启动后端:
+    uvicorn app.main:app --port 8000
+再运行（在 media-backend 目录下）:
+    python -m app.scripts.load_ws --clients 50 --rounds 3
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+import websockets
+
+
+def _pct(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))
+    return values[idx]
+
+
+async def _client(base_url: str, ws_url: str, rounds: int, idx: int):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as http:
+        story_id = (await http.post("/api/story/create")).json()["story_id"]
+
+    async with websockets.connect(f"{ws_url}/api/ws/ws/story/{story_id}") as ws:
+        t0 = time.perf_counter()
+        await ws.send(json.dumps({"user_text": f"压测客户端 {idx} 的开场白。", "rounds": rounds}))
+        first = first_ai = None
+        for i in range(rounds + 1):
+            json.loads(await ws.recv())
+            now = time.perf_counter() - t0
+            if i == 0:
+                first = now
+            elif i == 1:
+                first_ai = now
+        total = time.perf_counter() - t0
+    return first, first_ai, total
+
+
+async def _run(args) -> None:
+    ws_url = args.url.replace("http://", "ws://").replace("https://", "wss://")
+    t0 = time.perf_counter()
+    results = await asyncio.gather(
+        *[_client(args.url, ws_url, args.rounds, i) for i in range(args.clients)],
+        return_exceptions=True,
+    )
+    wall = time.perf_counter() - t0
+
+    ok = [r for r in results if not isinstance(r, Exception)]
+    errors = [r for r in results if isinstance(r, Exception)]
+    ms = lambda xs: [x * 1000 for x in xs if x is not None]  # noqa: E731
+    first, first_ai, total = (ms(col) for col in zip(*ok)) if ok else ([], [], [])
+
+    print(f"clients={args.clients} rounds={args.rounds} ok={len(ok)} errors={len(errors)} wall={wall:.2f}s")
+    for name, xs in (("first turn", first), ("first AI turn", first_ai), ("full round", total)):
+        if xs:
+            print(
+                f"  {name:<14} p50={_pct(xs, 50):8.1f} ms  p99={_pct(xs, 99):8.1f} ms  "
+                f"mean={statistics.mean(xs):8.1f} ms"
+            )
+    if errors:
+        print(f"  first error: {errors[0]!r}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+本地 OpenAI 兼容的 LLM 替身服务（/chat/completions，支持 stream=true 的 SSE），
+并统计请求数与 TCP 连接数，用来验证连接复用、做压测时替代真实 DeepSeek。
+
+用法（在 media-backend 目录下）:
+    python -m app.scripts.mock_llm_server --port 9001 --delay 0.02
+    DEEPSEEK_BASE_URL=http://127.0.0.1:9001 DEEPSEEK_API_KEY=mock uvicorn app.main:app
+统计：GET http://127.0.0.1:9001/stats
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+_SENTENCES = [
+    "雾气从河面升起，像一层薄薄的纱。",
+    "她停下脚步，回头望向来时的路。",
+    "远处的钟声敲了三下，街灯一盏盏亮起。",
+    "他把信折好，塞进了外套的内袋。",
+    "风里夹着潮湿的泥土味，雨快要来了。",
+    "老人笑了笑，没有回答她的问题。",
+]
+
+
+def create_app(delay: float = 0.02, chunk_chars: int = 4, sentences: int = 3) -> FastAPI:
+    app = FastAPI(title="Mock LLM")
+    stats = {"requests": 0, "stream_requests": 0, "connections": set(), "started": time.time()}
+
+    def _content(messages) -> str:
+        seed = sum(len(m.get("content") or "") for m in messages)
+        return "".join(_SENTENCES[(seed + i) % len(_SENTENCES)] for i in range(sentences))
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        # 每个 TCP 连接的客户端端口不同：端口数 = 连接数
+        stats["connections"].add(f"{request.client.host}:{request.client.port}")
+        content = _content(body.get("messages") or [])
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay * max(1, len(content) // chunk_chars))
+            return {
+                "id": "mock",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            }
+
+        stats["stream_requests"] += 1
+
+        async def events():
+            for i in range(0, len(content), chunk_chars):
+                await asyncio.sleep(delay)
+                chunk = {"choices": [{"index": 0, "delta": {"content": content[i:i + chunk_chars]}}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return {
+            "requests": stats["requests"],
+            "stream_requests": stats["stream_requests"],
+            "connections": len(stats["connections"]),
+        }
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        stats["requests"] = stats["stream_requests"] = 0
+        stats["connections"] = set()
+        return {"ok": True}
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--delay", type=float, default=0.02, help="每个 SSE chunk 的间隔（秒）")
+    parser.add_argument("--chunk-chars", type=int, default=4)
+    parser.add_argument("--sentences", type=int, default=3, help="每次回复的句子数")
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(args.delay, args.chunk_chars, args.sentences),
+        host=args.host, port=args.port, log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
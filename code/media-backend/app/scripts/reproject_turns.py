@@ -0,0 +1,62 @@
+"""
+重投影：把已存 story turns 的 x / y 换算到当前 PCA 版本。
+直接用存库的 embedding 做 transform，不重新编码文本；proj_version 已是当前版本的 turn 跳过。
+
+用法（在 media-backend 目录下，STORAGE_BACKEND 与线上一致）:
+    python -m app.scripts.reproject_turns            # 只处理版本不一致的 turn
+    python -m app.scripts.reproject_turns --all      # 全部重算
+    python -m app.scripts.reproject_turns --dry-run  # 只统计
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services import storage
+from app.utils import projection
+
+
+def reproject_story(story_id: str, proj: projection.Projection, force: bool, dry_run: bool) -> int:
+    turns = [
+        t for t in storage.get_story_turns(story_id)
+        if t.get("embedding") and (force or t.get("proj_version") != proj.version)
+    ]
+    if not turns:
+        return 0
+    coords = proj.transform(np.asarray([t["embedding"] for t in turns], dtype=np.float32))
+    if dry_run:
+        return len(turns)
+    updates = {
+        t["turn"]: (round(float(x), 3), round(float(y), 3), proj.version)
+        for t, (x, y) in zip(turns, coords)
+    }
+    return storage.update_projections(story_id, updates)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--all", action="store_true", help="不管 proj_version，全部重算")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    proj = projection.reload()
+    if proj is None:
+        print(f"❌ PCA 模型不存在: {projection.pca_path()}")
+        return
+
+    t0 = time.perf_counter()
+    stories = turns = 0
+    for story_id in storage.list_story_ids():
+        n = reproject_story(story_id, proj, args.all, args.dry_run)
+        if n:
+            stories += 1
+            turns += n
+    verb = "需要重投影" if args.dry_run else "已重投影"
+    print(
+        f"✅ {verb} {turns} 个 turn（{stories} 个 story）-> PCA {proj.version}，"
+        f"耗时 {time.perf_counter() - t0:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
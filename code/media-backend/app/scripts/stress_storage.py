@@ -0,0 +1,92 @@
+"""
+存储并发压测：多进程 x 多线程同时往同一个 story 追加 turns，
+检查 turn 既不丢失也不重复，且序号连续。
+
+用法（在 media-backend 目录下）:
+    python -m app.scripts.stress_storage --procs 4 --threads 16 --appends 50
+    python -m app.scripts.stress_storage --backend sqlite
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.core.config import settings
+from app.services import storage
+
+
+def _use_data_dir(data_dir: str, backend: str) -> None:
+    settings.STORAGE_BACKEND = backend
+    settings.DATA_DIR = data_dir
+    settings.STORIES_PATH = os.path.join(data_dir, "stories.json")
+    settings.STORIES_DIR = os.path.join(data_dir, "stories")
+    settings.SQLITE_PATH = os.path.join(data_dir, "stories.sqlite3")
+    settings.STORAGE_FSYNC = False
+
+
+def _worker(data_dir: str, backend: str, story_id: str, proc_idx: int, threads: int, appends: int) -> int:
+    _use_data_dir(data_dir, backend)
+
+    def run(thread_idx: int) -> int:
+        n = 0
+        for i in range(appends):
+            # 每次追加 1~3 条，模拟 human + 若干 AI turn
+            batch = [
+                {"author": "ai", "text": f"p{proc_idx}-t{thread_idx}-a{i}-{k}"}
+                for k in range(1 + i % 3)
+            ]
+            storage.append_turns(story_id, batch)
+            n += len(batch)
+        return n
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return sum(pool.map(run, range(threads)))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--appends", type=int, default=50)
+    parser.add_argument("--backend", choices=["log", "sqlite"], default="log")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        _use_data_dir(data_dir, args.backend)
+        story_id = storage.create_story()
+
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.procs) as pool:
+            futures = [
+                pool.submit(_worker, data_dir, args.backend, story_id, p, args.threads, args.appends)
+                for p in range(args.procs)
+            ]
+            expected = sum(f.result() for f in futures)
+        elapsed = time.perf_counter() - t0
+
+        turns = storage.get_story_turns(story_id)
+        numbers = [t["turn"] for t in turns]
+        texts = [t["text"] for t in turns]
+
+        ok = True
+        if len(turns) != expected:
+            print(f"❌ 丢失 turns: 期望 {expected}，实际 {len(turns)}")
+            ok = False
+        if numbers != list(range(1, len(turns) + 1)):
+            print("❌ turn 序号不连续或有重复")
+            ok = False
+        if len(set(texts)) != len(texts):
+            print("❌ 存在重复写入的 turn")
+            ok = False
+
+        print(
+            f"{'✅' if ok else '❌'} [{args.backend}] {args.procs} procs x {args.threads} threads, "
+            f"{expected} turns in {elapsed:.2f}s"
+        )
+        return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
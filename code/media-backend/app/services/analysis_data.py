@@ -0,0 +1,374 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.utils import columnar, http_payload, projection
+
+logger = logging.getLogger(__name__)
+
+# ====== 分析数据：预计算 + 缓存的 PCA 投影 ======
+# - 数据集 = data/*.json（不含 stories.json）与 data/*.cols 列式表；同名的 .cols 存在时优先用它、跳过 .json
+# - 数据集版本 = 上述文件与 pca_model.pkl 的 (文件名, 大小, mtime) 指纹
+# - GET 只用「已有的」PCA 模型做 transform，每个版本只算一次：内存缓存 + data/.analysis 磁盘缓存
+#   （磁盘缓存是列式表 all_data-<版本>.cols：重启后 embedding 直接 memmap，不再解析 JSON 文本）
+# - 重新拟合 PCA 只在 rebuild()（POST /api/analysis/rebuild）里做，不会被刷新页面悄悄改掉坐标系
+
+_EXCLUDED = {"stories.json"}
+_CACHE_DIRNAME = ".analysis"
+_CACHE_PREFIX = "all_data-"
+_EXPERIMENT_NAME = "Merged Analysis"
+
+_cache: Optional[Dict[str, Any]] = None  # {"version": str, "payload": dict, "pages": 已渲染的分页}
+_build_lock = threading.Lock()
+
+
+def data_dir() -> Path:
+    return Path(settings.DATA_DIR)
+
+
+def _cache_path(version: str) -> Path:
+    return data_dir() / _CACHE_DIRNAME / f"{_CACHE_PREFIX}{version}{columnar.SUFFIX}"
+
+
+def dataset_files() -> List[Path]:
+    """数据源（按文件名排序）：xxx.cols 目录，或没有对应 .cols 的 xxx.json"""
+    tables = {p.stem: p for p in data_dir().glob("*" + columnar.SUFFIX) if (p / "table.json").exists()}
+    files = [p for p in data_dir().glob("*.json") if p.name not in _EXCLUDED and p.stem not in tables]
+    return sorted(files + list(tables.values()), key=lambda p: p.stem)
+
+
+def dataset_version(include_model: bool = True) -> str:
+    """只 stat，不读内容；任何数据文件或 PCA 模型变了，版本号就变（include_model=False 只看数据文件）"""
+    h = hashlib.sha1()
+    for p in dataset_files() + ([Path(projection.pca_path())] if include_model else []):
+        try:
+            # 列式表整目录替换，table.json 最后写，看它就够了
+            st = (p / "table.json").stat() if p.suffix == columnar.SUFFIX else p.stat()
+        except FileNotFoundError:
+            continue
+        h.update(f"{p.name}\x00{st.st_size}\x00{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+# ====== {story_id: {..., "rounds": [...]}} <-> 列式表 ======
+# 每个 round 一行：story_id + "story." 前缀的 story 级字段 + round 字段；round 的 embedding 进 float32 矩阵。
+# 没有 round 的 story 占一行，"_empty" 列为 True。
+_STORY_PREFIX = "story."
+
+
+def stories_to_table(path: str, data: Dict[str, Any]) -> int:
+    """把 content["data"] 写成列式表，返回行数"""
+    rows, vectors = [], []
+    dim = 0
+    for sid, story in data.items():
+        head = {"story_id": sid}
+        head.update({_STORY_PREFIX + k: v for k, v in story.items() if k != "rounds"})
+        rounds = story.get("rounds") or []
+        if not rounds:
+            rows.append(dict(head, _empty=True))
+            vectors.append(None)
+            continue
+        for turn in rounds:
+            rows.append(dict(head, **{k: v for k, v in turn.items() if k != "embedding"}))
+            emb = turn.get("embedding")
+            vectors.append(emb if emb is not None and len(emb) > 0 else None)
+            dim = dim or (len(emb) if vectors[-1] is not None else 0)
+
+    embeddings = mask = None
+    if dim:
+        embeddings = np.zeros((len(rows), dim), dtype=np.float32)
+        mask = np.zeros(len(rows), dtype=bool)
+        for i, emb in enumerate(vectors):
+            if emb is not None:
+                embeddings[i] = emb
+                mask[i] = True
+    columnar.write_table(path, columnar.columns_from_rows(rows), embeddings, mask)
+    return len(rows)
+
+
+def stories_from_table(table: columnar.Table) -> Dict[str, Any]:
+    """列式表 -> {story_id: story}；round 的 embedding 是 memmap 上的行视图，不拷贝"""
+    data: Dict[str, Any] = {}
+    mask = table.embedding_mask
+    for i, row in enumerate(table.rows()):
+        sid = row.pop("story_id")
+        story = data.get(sid)
+        if story is None:
+            story = {k[len(_STORY_PREFIX):]: v for k, v in row.items() if k.startswith(_STORY_PREFIX)}
+            story["rounds"] = []
+            data[sid] = story
+        if row.get("_empty"):
+            continue
+        turn = {k: v for k, v in row.items() if not k.startswith(_STORY_PREFIX) and k != "_empty"}
+        if table.embeddings is not None and (mask is None or mask[i]):
+            turn["embedding"] = np.asarray(table.embeddings[i])
+        story["rounds"].append(turn)
+    return data
+
+
+def _load_source(path: Path) -> Optional[Dict[str, Any]]:
+    if path.suffix == columnar.SUFFIX:
+        return {"data": stories_from_table(columnar.load_table(str(path)))}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _merge() -> Dict[str, Any]:
+    merged_data = {"experiment_name": _EXPERIMENT_NAME, "data": {}}
+    for jf in dataset_files():
+        try:
+            content = _load_source(jf)
+            if "data" in content and isinstance(content["data"], dict):
+                merged_data["data"].update(content["data"])
+        except Exception as e:
+            logger.warning("⚠️ Failed to load %s: %s", jf, e)
+    return merged_data
+
+
+def _collect_vectors(merged_data: Dict[str, Any]) -> Tuple[List[list], List[dict]]:
+    """所有带 embedding 的 round（按 story、round 顺序），以及对应的 round dict"""
+    vectors, rounds = [], []
+    for story_obj in merged_data["data"].values():
+        for turn in story_obj.get("rounds") or []:
+            emb = turn.get("embedding")
+            if emb is not None and len(emb) > 0:
+                vectors.append(emb)
+                rounds.append(turn)
+    return vectors, rounds
+
+
+def _project(merged_data: Dict[str, Any], proj: Optional[projection.Projection]) -> int:
+    vectors, rounds = _collect_vectors(merged_data)
+    if not vectors or proj is None:
+        return 0
+    coords = proj.transform(np.asarray(vectors, dtype=np.float32))
+    for turn, (x, y) in zip(rounds, coords):
+        turn["x"] = round(float(x), 3)
+        turn["y"] = round(float(y), 3)
+    return len(rounds)
+
+
+def _write_disk_cache(version: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    写成列式表并删掉旧版本的缓存；返回从表里读回的 payload（embedding 为 memmap 视图），
+    各 worker 冷启动 / 重启后拿到的结构一致。写失败（如各文件 embedding 维度不一）返回 None，只用内存缓存。
+    """
+    path = _cache_path(version)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        stories_to_table(str(path), payload["data"])
+    except Exception as e:
+        logger.warning("⚠️ [Analysis] 投影缓存写入失败，只保留内存缓存: %s", e)
+        return None
+    _remove_stale_caches(path)
+    return _read_disk_cache(version)
+
+
+def _remove_stale_caches(keep: Path) -> None:
+    """
+    只删已写完的其他版本的表（all_data-<版本>.cols）和以前的 JSON 格式缓存；
+    别的 worker 正在换入的 .cols.tmp / .cols.old 不动。删不掉（被占用等）就留着，下次再删。
+    """
+    try:
+        entries = list(keep.parent.iterdir())
+    except OSError:
+        return
+    for old in entries:
+        try:
+            if old.name == "all_data.json":
+                old.unlink()
+            elif old != keep and old.name.startswith(_CACHE_PREFIX) and old.suffix == columnar.SUFFIX:
+                shutil.rmtree(old)
+        except OSError:
+            pass
+
+
+def _read_disk_cache(version: str) -> Optional[Dict[str, Any]]:
+    path = _cache_path(version)
+    try:
+        table = columnar.load_table(str(path))
+    except (FileNotFoundError, ValueError):
+        return None
+    return {"experiment_name": _EXPERIMENT_NAME, "data": stories_from_table(table)}
+
+
+def _build(version: str) -> Dict[str, Any]:
+    payload = _read_disk_cache(version)
+    if payload is not None:
+        return payload
+
+    payload = _merge()
+    try:
+        # 数据集版本里含 pkl 的 stat：这里直接重读一次，保证投影用的就是这个版本的模型
+        proj = projection.reload()
+        n = _project(payload, proj)
+        logger.info("✅ [Analysis] 数据集 %s: 投影 %d 个点", version, n)
+    except Exception as e:
+        logger.error("❌ PCA Analysis Failed: %s", e)
+    return _write_disk_cache(version, payload) or payload
+
+
+def _current() -> Dict[str, Any]:
+    global _cache
+    version = dataset_version()
+    cached = _cache
+    if cached is not None and cached["version"] == version:
+        return cached
+
+    # 同一时刻只构建一次，其他请求等它完成后直接拿结果
+    with _build_lock:
+        cached = _cache
+        if cached is None or cached["version"] != version:
+            cached = {"version": version, "payload": _build(version)}
+            _cache = cached
+    return cached
+
+
+def get_all_data() -> Dict[str, Any]:
+    """合并后的实验数据（带 x / y），同一数据集版本直接返回缓存"""
+    return _current()["payload"]
+
+
+# ====== 瘦身 / 分页的响应 ======
+# fields 选择每个 round 带哪些字段组（默认不带 embedding），limit + cursor 按 story 分页。
+# 同一数据集版本下，同样参数的结果（序列化 + 压缩后的字节）放在有界缓存里。
+FIELD_GROUPS = {
+    "coords": ("x", "y"),
+    "text": ("text",),
+    "scores": ("flow_score", "entropy_score"),
+    "embedding": ("embedding",),
+}
+_ALWAYS_FIELDS = ("author", "turn")
+_MAX_CACHED_PAGES = 32
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """"coords,text" -> ("coords", "text")；None 表示默认（除 embedding 以外全部字段）"""
+    if fields is None or not fields.strip():
+        return None
+    groups = tuple(sorted({f.strip() for f in fields.split(",") if f.strip()}))
+    unknown = [g for g in groups if g not in FIELD_GROUPS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)} (allowed: {', '.join(FIELD_GROUPS)})")
+    return groups
+
+
+def _is_embedding_key(key: str) -> bool:
+    return key == "embedding" or key.endswith("_embedding")
+
+
+def _slim_round(turn: Dict[str, Any], keep: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+    if keep is None:
+        return {k: v for k, v in turn.items() if not _is_embedding_key(k)}
+    return {k: turn[k] for k in keep if k in turn}
+
+
+def _slim_story(story: Dict[str, Any], groups: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+    with_embedding = groups is not None and "embedding" in groups
+    out = {
+        k: v for k, v in story.items()
+        if k != "rounds" and (with_embedding or not _is_embedding_key(k))
+    }
+    keep = None
+    if groups is not None:
+        keep = _ALWAYS_FIELDS + tuple(k for g in groups for k in FIELD_GROUPS[g])
+    if "rounds" in story:
+        out["rounds"] = [_slim_round(t, keep) for t in story.get("rounds") or []]
+    return out
+
+
+def _story_ids(cached: Dict[str, Any]) -> Tuple[List[str], Dict[str, int]]:
+    if "story_ids" not in cached:
+        ids = list(cached["payload"]["data"].keys())
+        cached["positions"] = {sid: i for i, sid in enumerate(ids)}
+        cached["story_ids"] = ids
+    return cached["story_ids"], cached["positions"]
+
+
+def _render(cached: Dict[str, Any], groups, cursor: Optional[str], limit: Optional[int]) -> bytes:
+    payload = cached["payload"]
+    ids, positions = _story_ids(cached)
+    start = 0
+    if cursor:
+        if cursor not in positions:
+            raise KeyError(cursor)
+        start = positions[cursor] + 1
+    end = len(ids) if limit is None else min(len(ids), start + limit)
+
+    data = payload["data"]
+    page = {sid: _slim_story(data[sid], groups) for sid in ids[start:end]}
+    return http_payload.dumps({
+        "experiment_name": payload.get("experiment_name"),
+        "version": cached["version"],
+        "data": page,
+        "next_cursor": ids[end - 1] if end < len(ids) and end > start else None,
+    })
+
+
+def get_page(
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    encoding: Optional[str] = None,
+) -> Tuple[bytes, str]:
+    """
+    返回 (响应体字节, 数据集版本)。cursor 为上一页最后一个 story_id；
+    字段名不合法抛 ValueError，cursor 不存在（数据集已变）抛 KeyError。
+    """
+    groups = parse_fields(fields)
+    cached = _current()
+    key = (groups, cursor, limit, encoding)
+    pages = cached.setdefault("pages", OrderedDict())
+    body = pages.get(key)
+    if body is None:
+        body = http_payload.compress(_render(cached, groups, cursor, limit), encoding)
+        with _build_lock:
+            pages[key] = body
+            while len(pages) > _MAX_CACHED_PAGES:
+                pages.popitem(last=False)
+    return body, cached["version"]
+
+
+def rebuild() -> Dict[str, Any]:
+    """
+    显式重建：在全部数据的 embedding 上重新拟合 PCA，原子替换 pca_model.pkl，
+    本进程立即切到新版本（其他 worker 在 PCA_RELOAD_INTERVAL 内跟上），并重算投影缓存。
+    已存的 story turns 用 `python -m app.scripts.reproject_turns` 重投影到新版本。
+    """
+    global _cache
+    # sklearn / joblib 只在这里用到，放到函数里导入，避免拖慢 API 启动
+    import joblib
+    from sklearn.decomposition import PCA
+
+    with _build_lock:
+        payload = _merge()
+        vectors, _ = _collect_vectors(payload)
+        if len(vectors) <= 2:
+            raise ValueError(f"not enough embeddings to fit PCA: {len(vectors)}")
+
+        pca = PCA(n_components=2)
+        pca.fit(np.asarray(vectors, dtype=np.float64))
+
+        # 原子替换：其他 worker 定期检查时要么看到旧文件，要么看到完整的新文件
+        path = projection.pca_path()
+        tmp = path + ".tmp"
+        joblib.dump(pca, tmp)
+        os.replace(tmp, path)
+        proj = projection.reload()
+        logger.info("✅ PCA Model %s saved to: %s", proj.version, path)
+
+        version = dataset_version()
+        _project(payload, proj)
+        payload = _write_disk_cache(version, payload) or payload
+        _cache = {"version": version, "payload": payload}
+
+    return {"version": version, "proj_version": proj.version, "points": len(vectors)}
@@ -0,0 +1,132 @@
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.storage import get_recent_turns, get_turns_after
+
+# ====== Per-story LLM 上下文 ======
+# 每个 story 一个 ConversationContext：首次使用时从存储读一次最近的 turns，
+# 之后只追加新 turn（本进程存库时 observe，或 refresh 只读 last_turn 之后的增量），
+# 按估算 token 数从最旧的一端裁剪。续写重试不再重复解析整段历史。
+
+SYSTEM_PROMPT = (
+    "你是一个擅长互动叙事续写的助手。"
+    "请严格延续当前故事的设定、人物与场景继续写，不要新开故事，不要换主角，不要跳出叙事。"
+    "输出应是自然的句子，不要只输出标点符号。"
+)
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+# CJK / 全角字符大致 1 字 1 token，其余（英文、数字、空格）大致 4 字符 1 token
+_WIDE_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    wide = len(_WIDE_RE.findall(text))
+    return wide + (len(text) - wide + 3) // 4 + 4  # +4：每条 message 的角色等开销
+
+
+class ConversationContext:
+    """
+    一个 story 的 LLM 历史：deque 里放好已经拼好的 message dict（只读共享），
+    total_tokens 随追加 / 裁剪增量维护。
+    """
+
+    def __init__(self, story_id: str, budget: int):
+        self.story_id = story_id
+        self.budget = budget
+        self.last_turn = 0
+        self.total_tokens = 0
+        self._messages: Deque[Dict[str, str]] = deque()
+        self._tokens: Deque[int] = deque()
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _push(self, turn: Dict[str, Any]) -> None:
+        self.last_turn = max(self.last_turn, int(turn.get("turn") or 0))
+        text = (turn.get("text") or "").strip()
+        if not text:
+            return
+        role = "assistant" if turn.get("author") == "ai" else "user"
+        tokens = estimate_tokens(text)
+        self._messages.append({"role": role, "content": text})
+        self._tokens.append(tokens)
+        self.total_tokens += tokens
+
+    def _trim(self) -> None:
+        # 至少保留最新的一条，哪怕它自己就超预算
+        while len(self._messages) > 1 and self.total_tokens > self.budget:
+            self._messages.popleft()
+            self.total_tokens -= self._tokens.popleft()
+
+    def _load(self) -> None:
+        for t in get_recent_turns(self.story_id, settings.LLM_CONTEXT_MAX_TURNS) or []:
+            self._push(t)
+        self._trim()
+        self._loaded = True
+
+    def observe(self, saved: List[Dict[str, Any]]) -> None:
+        """刚存库的 turns：与已知历史相接时直接追加，否则留给下一次 refresh 去读"""
+        with self._lock:
+            if not self._loaded or not saved:
+                return
+            if int(saved[0].get("turn") or 0) != self.last_turn + 1:
+                return
+            for t in saved:
+                self._push(t)
+            self._trim()
+
+    def refresh(self) -> None:
+        """只读 last_turn 之后的新 turns（其他进程 / 其他连接写入的）"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                return
+            new_turns = get_turns_after(self.story_id, self.last_turn)
+            for t in new_turns:
+                self._push(t)
+            if new_turns:
+                self._trim()
+
+    def build_messages(self, user_text: str, continue_hint: str = "") -> List[Dict[str, str]]:
+        """system + 历史 + 当前输入；历史 message dict 是共享引用，不逐条复制"""
+        final_user = (user_text or "").strip() + (continue_hint or "")
+        with self._lock:
+            messages = [_SYSTEM_MESSAGE]
+            messages.extend(self._messages)
+        messages.append({"role": "user", "content": final_user})
+        return messages
+
+
+_contexts: "OrderedDict[str, ConversationContext]" = OrderedDict()
+_contexts_lock = threading.Lock()
+
+
+def _get(story_id: str, create: bool) -> Optional[ConversationContext]:
+    with _contexts_lock:
+        ctx = _contexts.get(story_id)
+        if ctx is not None:
+            _contexts.move_to_end(story_id)
+            return ctx
+        if not create:
+            return None
+        ctx = ConversationContext(story_id, settings.LLM_CONTEXT_TOKENS)
+        _contexts[story_id] = ctx
+        while len(_contexts) > settings.LLM_CONTEXT_CACHE_SIZE:
+            _contexts.popitem(last=False)
+        return ctx
+
+
+def get_context(story_id: str) -> ConversationContext:
+    """取（或建）该 story 的上下文，并补上存储里新增的 turns"""
+    ctx = _get(story_id, create=True)
+    ctx.refresh()
+    return ctx
+
+
+def observe_turns(story_id: str, saved: List[Dict[str, Any]]) -> None:
+    """存库后调用：上下文已在内存里时顺手追加，不触发任何读取"""
+    ctx = _get(story_id, create=False)
+    if ctx is not None:
+        ctx.observe(saved)
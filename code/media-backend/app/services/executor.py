@@ -0,0 +1,49 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.core.config import settings
+
+# ====== 打分 / 存储专用线程池 ======
+# ws 是 async 路由，直接调用 score_turns / append_turns 会把 transformer 前向和文件 I/O
+# 跑在事件循环上，卡住该 worker 的所有连接。这里把它们丢到独立的有界线程池：
+# - torch 前向和文件 I/O 都会释放 GIL，线程池即可并行，不需要每个进程再加载一份模型
+# - 同时在途（执行中 + 排队）的任务数受 SCORING_MAX_PENDING 限制，超出时调用方在
+#   asyncio.Semaphore 上等待（背压），事件循环本身不阻塞，其他连接照常收发
+
+_executor: Optional[ThreadPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+_slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.SCORING_WORKERS, thread_name_prefix="scoring"
+        )
+    return _executor
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots, _slots_loop
+    loop = asyncio.get_running_loop()
+    if _slots is None or _slots_loop is not loop:
+        _slots = asyncio.Semaphore(max(settings.SCORING_MAX_PENDING, settings.SCORING_WORKERS))
+        _slots_loop = loop
+    return _slots
+
+
+async def run_scoring(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """在打分线程池里执行阻塞函数，池满时在这里排队等待"""
+    async with _get_slots():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
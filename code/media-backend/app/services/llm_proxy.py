@@ -1,14 +1,20 @@
 import os
 import re
+import time
 import asyncio
-from typing import AsyncGenerator, Dict, List, Tuple
+import logging
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
 import httpx
 
-# 读取历史故事
-from app.services.storage import get_story_turns
+from app.core.config import settings
+from app.utils.metrics import LLM_CONTINUE_RETRIES, LLM_MOCK_FALLBACK, LLM_STREAM, LLM_TTFT, SEGMENT
 
+# 读取历史故事（per-story 上下文，按 token 预算裁剪）
+from app.services.conversation import get_context
+
+logger = logging.getLogger(__name__)
 
 # ====== Config ======
 load_dotenv()  # 自动读取 .env
@@ -17,6 +23,60 @@ DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
 
+
+# ====== Shared HTTP clients ======
+# 应用生命周期内复用的 AsyncClient 连接池（由 main.py 的 lifespan 创建 / 关闭），
+# 续写重试最多 MAX_CONTINUE_CALLS 次也不用每次重新 TCP + TLS 握手。
+# 没走 lifespan（脚本里直接调用）时按需懒创建。
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_enabled() -> bool:
+    if settings.LLM_HTTP2 == "0":
+        return False
+    try:
+        import h2  # noqa: F401  httpx 的 HTTP/2 支持需要 h2 包
+        return True
+    except ImportError:
+        if settings.LLM_HTTP2 == "1":
+            logger.warning("⚠️ [LLM] LLM_HTTP2=1 但未安装 h2（pip install 'httpx[http2]'），回退到 HTTP/1.1")
+        return False
+
+
+def _client_kwargs(read_timeout: float) -> Dict:
+    return {
+        "http2": _http2_enabled(),
+        "limits": httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(
+            connect=settings.LLM_CONNECT_TIMEOUT,
+            read=read_timeout,
+            write=settings.LLM_CONNECT_TIMEOUT,
+            pool=settings.LLM_CONNECT_TIMEOUT,
+        ),
+    }
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(**_client_kwargs(settings.LLM_STREAM_READ_TIMEOUT))
+    return _async_client
+
+
+async def startup_clients() -> None:
+    _get_async_client()
+
+
+async def shutdown_clients() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
 # ====== Mock ======
 def _mock_turns(user_text: str, rounds: int) -> List[Dict]:
     return [
@@ -41,6 +101,9 @@ _SENT_PATTERN = re.compile(
     re.VERBOSE,
 )
 
+_END_PUNCT_RE = re.compile(_END_PUNCT)
+_WS_RE = re.compile(r"\s+")
+
 _BAD_ONLY_PUNCT = re.compile(
     r'^[\s"“”‘’\'，,。.！？.!?、:：;；…\-—（）()\[\]【】]+$'
 )
@@ -88,38 +151,51 @@ def extract_complete_sentences(buffer: str) -> Tuple[List[str], str]:
     return sentences, remainder
 
 
-# ====== Messages with real context ======
-def _build_messages_from_story(story_id: str, user_text: str, continue_hint: str = "") -> List[Dict]:
+class SentenceSegmenter:
     """
-    ✅ 关键：从 storage 里读取该 story 的历史 turns，按时间顺序拼 messages，
-    让模型真正“记得之前写到哪”。
+    增量断句器（流式用）：feed(delta) 的输出与
+        buffer += delta; sents, buffer = extract_complete_sentences(buffer)
+    完全一致，但不再每来一个 delta 就对整个 buffer 重跑正则。
+
+    依据：句子必须以句末符号结尾。若 delta 里没有句末符号（且不是单独一个换行），
+    它不可能让 buffer 里多出新的完整句子——除非 buffer 自身后面接任意非句末字符就能切出句子，
+    这一点在每次真正跑正则之后算一次并记在 _pending 里。
+    快速路径只处理 delta 本身（空白折叠 + 去尾部空白，与 _clean_sentence 等价），O(len(delta))；
+    只有遇到句末符号时才对 buffer 跑一次 extract_complete_sentences。
     """
-    history = get_story_turns(story_id) or []
-
-    messages: List[Dict] = [
-        {
-            "role": "system",
-            "content": (
-                "你是一个擅长互动叙事续写的助手。"
-                "请严格延续当前故事的设定、人物与场景继续写，不要新开故事，不要换主角，不要跳出叙事。"
-                "输出应是自然的句子，不要只输出标点符号。"
-            ),
-        }
-    ]
-
-    # 控制上下文长度：只取最近 N 条 turns（避免 prompt 太长）
-    max_turns = 24
-    for t in history[-max_turns:]:
-        role = "assistant" if t.get("author") == "ai" else "user"
-        text = (t.get("text") or "").strip()
-        if text:
-            messages.append({"role": role, "content": text})
 
-    # 当前输入放最后
-    final_user = (user_text or "").strip() + (continue_hint or "")
-    messages.append({"role": "user", "content": final_user})
-
-    return messages
+    def __init__(self) -> None:
+        self._parts: List[str] = []   # 已清洗的 buffer，分段存放避免反复拼接
+        self._pending = False
+
+    @property
+    def remainder(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def reset(self) -> None:
+        self._parts = []
+        self._pending = False
+
+    def feed(self, delta: str) -> List[str]:
+        delta = delta or ""
+        if delta and delta != "\n" and not self._pending and not _END_PUNCT_RE.search(delta):
+            part = _WS_RE.sub(" ", delta)
+            if not self._parts:
+                part = part.lstrip()
+            part = part.rstrip()
+            if part:
+                self._parts.append(part)
+            return []
+
+        sentences, remainder = extract_complete_sentences(self.remainder + delta)
+        self._parts = [remainder] if remainder else []
+        # 句末符号至少要出现在第 2 个字符之后才可能组成一句，绝大多数残句在这里直接排除
+        self._pending = bool(
+            _END_PUNCT_RE.search(remainder, 1) and _SENT_PATTERN.search(remainder + "_")
+        )
+        return sentences
 
 
 def _auth_headers() -> Dict[str, str]:
@@ -129,131 +205,65 @@ def _auth_headers() -> Dict[str, str]:
     }
 
 
-# ====== Non-stream call ======
-def _call_deepseek(messages: List[Dict], stream: bool = False) -> str:
-    url = f"{DEEPSEEK_BASE_URL}/chat/completions"
-    payload = {
-        "model": DEEPSEEK_MODEL,
-        "messages": messages,
-        "stream": stream,
-        "temperature": 0.9,
-        "top_p": 0.9,
-        "max_tokens": 512,
-    }
-    with httpx.Client(timeout=60) as client:
-        resp = client.post(url, headers=_auth_headers(), json=payload)
-        resp.raise_for_status()
-        data = resp.json()
-
-    return (
-        data.get("choices", [{}])[0]
-        .get("message", {})
-        .get("content", "")
-    ).strip()
-
-
-def generate_ai_turns(story_id: str, user_text: str, rounds: int, mode: str) -> List[Dict]:
-    """
-    非流式：自动补齐 rounds。
-    ✅ 使用真实上下文（story_id 对应历史 turns），不会开新故事。
-    """
-    if mode == "human_only":
-        return []
-
-    if not DEEPSEEK_API_KEY:
-        return _mock_turns(user_text, rounds)
-
-    MAX_CONTINUE_CALLS = 6  # 防止无限继续
-    all_sentences: List[str] = []
-
-    try:
-        for _ in range(MAX_CONTINUE_CALLS):
-            need = rounds - len(all_sentences)
-            if need <= 0:
-                break
-
-            continue_hint = (
-                f"\n\n请在延续上文的前提下继续故事，严格再输出{need}句完整自然的句子，"
-                f"每句必须包含内容，不要只输出标点。"
-            )
-
-            messages = _build_messages_from_story(story_id, user_text, continue_hint)
-
-            content = _call_deepseek(messages, stream=False)
-            if not content:
-                break
-
-            sents, remainder = extract_complete_sentences(content)
-
-            # 一句都切不出来：若整体像句子，则当作一句
-            if not sents and _is_valid_sentence(content):
-                sents = [_clean_sentence(content)]
-
-            for s in sents:
-                if len(all_sentences) >= rounds:
-                    break
-                all_sentences.append(s)
-
-            # 输出质量太差就停止，避免空转
-            if not sents and not remainder:
-                break
-
-        if not all_sentences:
-            return _mock_turns(user_text, rounds)
-
-        return [{"author": "ai", "text": s} for s in all_sentences[:rounds]]
-
-    except Exception:
-        return _mock_turns(user_text, rounds)
-
-
 # ====== Stream call helpers ======
 async def _call_deepseek_stream(payload: Dict) -> AsyncGenerator[str, None]:
     """
     读取 SSE，yield 增量 delta.content
     """
     url = f"{DEEPSEEK_BASE_URL}/chat/completions"
-    async with httpx.AsyncClient(timeout=120) as client:
-        async with client.stream("POST", url, headers=_auth_headers(), json=payload) as resp:
-            resp.raise_for_status()
-
-            async for line in resp.aiter_lines():
-                if not line:
-                    continue
-
-                if line.startswith("data:"):
-                    chunk = line[len("data:"):].strip()
-                else:
-                    chunk = line.strip()
-
-                if chunk == "[DONE]":
-                    break
-
-                try:
-                    j = httpx.Response(200, content=chunk).json()
-                except Exception:
-                    continue
+    client = _get_async_client()
+    async with client.stream("POST", url, headers=_auth_headers(), json=payload) as resp:
+        resp.raise_for_status()
 
-                delta = (
-                    j.get("choices", [{}])[0]
-                    .get("delta", {})
-                    .get("content", "")
-                )
-                if delta:
-                    yield delta
+        done = False
+        async for line in resp.aiter_lines():
+            # [DONE] 之后继续把响应读完（而不是 break），连接才能回到池里复用
+            if done or not line:
+                continue
+
+            if line.startswith("data:"):
+                chunk = line[len("data:"):].strip()
+            else:
+                chunk = line.strip()
+
+            if chunk == "[DONE]":
+                done = True
+                continue
+
+            try:
+                j = httpx.Response(200, content=chunk).json()
+            except Exception:
+                continue
+
+            delta = (
+                j.get("choices", [{}])[0]
+                .get("delta", {})
+                .get("content", "")
+            )
+            if delta:
+                yield delta
 
 
 async def stream_ai_turns(
-    story_id: str, user_text: str, rounds: int, mode: str
+    story_id: str,
+    user_text: str,
+    rounds: int,
+    mode: str,
+    before_continue: Optional[Callable[[], Awaitable[None]]] = None,
+    fallback: bool = True,
 ) -> AsyncGenerator[Dict, None]:
     """
     流式：边到边切句 yield；如果结束后不够 rounds，会自动继续请求补齐。
     ✅ 使用真实上下文（story_id 对应历史 turns），不会开新故事。
+    before_continue：补齐请求前等待的回调（调用方若异步存库，用它保证已产出的句子先落库，
+    续写请求读到的上下文才完整）。
+    fallback：出错时是否逐句间隔输出 mock 句补齐剩余的（ws 打字效果）；False 时原样抛出，由调用方兜底。
     """
     if mode == "human_only":
         return
 
     if not DEEPSEEK_API_KEY:
+        LLM_MOCK_FALLBACK.labels(reason="no_api_key").inc()
         for i in range(rounds):
             await asyncio.sleep(0.35)
             yield {"author": "ai", "text": f"（mock stream）{user_text} -> AI 续写第{i+1}句"}
@@ -261,20 +271,29 @@ async def stream_ai_turns(
 
     MAX_CONTINUE_CALLS = 6
     yielded = 0
-    buffer = ""
+    segmenter = SentenceSegmenter()
 
     try:
+        # 读存储可能等 per-story 锁（别的请求正在 append + fsync），放到线程里，不卡事件循环
+        context = await asyncio.to_thread(get_context, story_id)
         for attempt in range(MAX_CONTINUE_CALLS):
             need = rounds - yielded
             if need <= 0:
                 return
 
+            if attempt > 0:
+                LLM_CONTINUE_RETRIES.inc()
+                if before_continue is not None:
+                    await before_continue()
+                # 只补读上一次之后新落库的 turns，不重新解析整段历史
+                await asyncio.to_thread(context.refresh)
+
             continue_hint = (
                 f"\n\n请在延续上文的前提下继续故事，严格再输出{need}句完整自然的句子，"
                 f"每句必须包含内容，不要只输出标点。"
             )
 
-            messages = _build_messages_from_story(story_id, user_text, continue_hint)
+            messages = context.build_messages(user_text, continue_hint)
 
             payload = {
                 "model": DEEPSEEK_MODEL,
@@ -286,12 +305,16 @@ async def stream_ai_turns(
             }
 
             produced_this_attempt = 0
+            t_request = time.perf_counter()
+            first_token = True
 
             async for delta in _call_deepseek_stream(payload):
-                buffer += delta
-
-                sents, remainder = extract_complete_sentences(buffer)
-                buffer = remainder
+                if first_token:
+                    LLM_TTFT.observe(time.perf_counter() - t_request)
+                    first_token = False
+                t_feed = time.perf_counter()
+                sents = segmenter.feed(delta)
+                SEGMENT.observe(time.perf_counter() - t_feed)
 
                 for s in sents:
                     if yielded >= rounds:
@@ -300,10 +323,13 @@ async def stream_ai_turns(
                     produced_this_attempt += 1
                     yield {"author": "ai", "text": s}
 
+            LLM_STREAM.observe(time.perf_counter() - t_request)
+
             # 一次流结束：残句如果像句子，也可以当一句输出
+            buffer = segmenter.remainder
             if yielded < rounds and buffer and _is_valid_sentence(buffer):
                 s = _clean_sentence(buffer)
-                buffer = ""
+                segmenter.reset()
                 yielded += 1
                 produced_this_attempt += 1
                 yield {"author": "ai", "text": s}
@@ -312,10 +338,43 @@ async def stream_ai_turns(
             if attempt > 0 and produced_this_attempt == 0:
                 break
 
-    except Exception:
+    except Exception as e:
+        if not fallback:
+            raise
+        logger.warning("⚠️ [LLM] 流式续写失败，剩余 %d 句改用 mock: %r", rounds - yielded, e)
+        LLM_MOCK_FALLBACK.labels(reason="error").inc()
         for i in range(rounds - yielded):
             await asyncio.sleep(0.35)
             yield {
                 "author": "ai",
                 "text": f"（mock stream fallback）{user_text} -> AI 续写第{yielded + i + 1}句",
             }
+
+
+# ====== Non-stream (collect the stream) ======
+async def generate_ai_turns(story_id: str, user_text: str, rounds: int, mode: str) -> List[Dict]:
+    """
+    非流式：自动补齐 rounds，一次性返回。
+    与 stream_ai_turns 共用同一条流式代码路径（连接池、断句、续写补齐），
+    出错或一句都没拿到时整段返回 _mock_turns（不与已生成的句子拼接，也不逐句等待）；
+    async 实现不会在等 LLM 时占住线程池里的 worker；调用方取消时底层 SSE 连接随之关闭。
+    ✅ 使用真实上下文（story_id 对应历史 turns），不会开新故事。
+    """
+    if mode == "human_only":
+        return []
+
+    if not DEEPSEEK_API_KEY:
+        LLM_MOCK_FALLBACK.labels(reason="no_api_key").inc()
+        return _mock_turns(user_text, rounds)
+
+    try:
+        turns = [t async for t in stream_ai_turns(story_id, user_text, rounds, mode, fallback=False)]
+    except Exception as e:
+        logger.warning("⚠️ [LLM] 续写失败，改用 mock: %r", e)
+        LLM_MOCK_FALLBACK.labels(reason="error").inc()
+        return _mock_turns(user_text, rounds)
+
+    if not turns:
+        LLM_MOCK_FALLBACK.labels(reason="empty").inc()
+        return _mock_turns(user_text, rounds)
+    return turns
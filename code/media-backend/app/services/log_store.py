@@ -0,0 +1,337 @@
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.context_state import ContextState
+from app.utils.filelock import file_lock
+
+logger = logging.getLogger(__name__)
+
+# ====== 存储引擎：每个 story 一个 append-only 日志段 ======
+# data/stories/<story_id>.jsonl，每行一个 turn（紧凑 JSON，不缩进）
+# 进程内索引：story_id -> 每行起始 offset 列表 + 当前文件末尾 offset
+# 追加只写新 turns（O(新增)），读取只读该 story 的段（O(该 story)）
+#
+# 并发：
+# - 同一 story 的写入由「线程锁 + 文件锁」串行化，多个 uvicorn worker 进程之间也成立
+# - turn 序号在持锁状态下按段内已提交行数分配，保证单调、不重复
+# - 一次 append 只做一次 write（可选 fsync），只有以换行结尾的行才算已提交；
+#   崩溃留下的半行会在下一次持锁写入前被截掉，读者永远看不到
+
+_STORY_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+_SEGMENT_SUFFIX = ".jsonl"
+_STATE_SUFFIX = ".state"
+_LOCK_DIRNAME = ".locks"
+
+# story_id -> 每个 turn 所在行的起始字节 offset
+_offsets: Dict[str, List[int]] = {}
+# story_id -> 已索引到的文件末尾 offset
+_ends: Dict[str, int] = {}
+# story_id -> 建索引时段文件的 inode（段被整体重写后 inode 会变，索引作废重建）
+_inodes: Dict[str, int] = {}
+_store_ready = False
+
+_registry_lock = threading.Lock()
+_thread_locks: Dict[str, threading.Lock] = {}
+
+
+def _dump_line(turn: Dict[str, Any]) -> bytes:
+    return (json.dumps(turn, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _segment_path(story_id: str) -> str:
+    if not _STORY_ID_PATTERN.match(story_id or ""):
+        raise ValueError(f"invalid story_id: {story_id!r}")
+    return os.path.join(settings.STORIES_DIR, story_id + _SEGMENT_SUFFIX)
+
+
+# ====== Locks ======
+def _thread_lock(story_id: str) -> threading.Lock:
+    with _registry_lock:
+        lock = _thread_locks.get(story_id)
+        if lock is None:
+            lock = _thread_locks[story_id] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def _story_write_lock(story_id: str) -> Iterator[None]:
+    lock_path = os.path.join(settings.STORIES_DIR, _LOCK_DIRNAME, story_id + ".lock")
+    with _thread_lock(story_id):
+        with file_lock(lock_path):
+            yield
+
+
+# ====== Migration ======
+def migrate_from_json(json_path: str, stories_dir: str) -> int:
+    """
+    一次性迁移：把旧的整文件 stories.json 拆成每个 story 一个日志段。
+    先写到临时目录再整体 rename，迁移中途崩溃不会留下半套数据。
+    返回迁移的 story 数量。
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        db = json.load(f)
+
+    tmp_dir = stories_dir + ".migrating"
+    os.makedirs(tmp_dir, exist_ok=True)
+    count = 0
+    for story_id, turns in db.items():
+        if not _STORY_ID_PATTERN.match(story_id):
+            logger.warning("⚠️ [Storage] 跳过非法 story_id: %r", story_id)
+            continue
+        with open(os.path.join(tmp_dir, story_id + _SEGMENT_SUFFIX), "wb") as f:
+            for t in turns or []:
+                f.write(_dump_line(t))
+            f.flush()
+            os.fsync(f.fileno())
+        count += 1
+
+    os.replace(tmp_dir, stories_dir)
+    return count
+
+
+def _ensure_store() -> None:
+    global _store_ready
+    if _store_ready:
+        return
+    os.makedirs(settings.DATA_DIR, exist_ok=True)
+    # 多个 worker 同时启动时只允许一个做迁移
+    with _registry_lock, file_lock(os.path.join(settings.DATA_DIR, ".stories.migrate.lock")):
+        if not os.path.isdir(settings.STORIES_DIR):
+            if os.path.exists(settings.STORIES_PATH):
+                n = migrate_from_json(settings.STORIES_PATH, settings.STORIES_DIR)
+                logger.info("✅ [Storage] 已从 %s 迁移 %d 个 story 到 %s", settings.STORIES_PATH, n, settings.STORIES_DIR)
+            else:
+                os.makedirs(settings.STORIES_DIR, exist_ok=True)
+        _store_ready = True
+
+
+# ====== Index ======
+def _refresh_index(story_id: str) -> bool:
+    """
+    把 offset 索引追到文件当前末尾，只扫描上次索引之后新增的字节
+    （其他进程追加的 turns 也能看到）。未以换行结尾的半行不计入。
+    story 不存在返回 False。调用方需持有该 story 的线程锁。
+    """
+    _ensure_store()
+    path = _segment_path(story_id)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    size = st.st_size
+
+    if _inodes.get(story_id) != st.st_ino:
+        # 第一次索引，或段被 rewrite_segment 整体替换过（可能是其他进程）
+        _offsets.pop(story_id, None)
+        _ends.pop(story_id, None)
+        _inodes[story_id] = st.st_ino
+    offsets = _offsets.setdefault(story_id, [])
+    end = _ends.setdefault(story_id, 0)
+    if size > end:
+        pos = end
+        with open(path, "rb") as f:
+            f.seek(end)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offsets.append(pos)
+                pos += len(line)
+        _ends[story_id] = pos
+    return True
+
+
+def create_story() -> str:
+    _ensure_store()
+    story_id = str(uuid.uuid4())[:8]
+    with open(_segment_path(story_id), "xb"):
+        pass
+    return story_id
+
+
+def _read_turns(
+    story_id: str, limit: Optional[int] = None, after_turn: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    按 offset 索引读取该 story 的 turns；limit 只读最后 limit 条，
+    after_turn 只读序号大于它的 turns（turn 序号 = 段内行号 + 1）
+    """
+    while True:
+        try:
+            with _thread_lock(story_id):
+                if not _refresh_index(story_id):
+                    return []
+                offsets = _offsets[story_id]
+                if not offsets or limit == 0 or after_turn >= len(offsets):
+                    return []
+                first = offsets[-limit] if limit and limit < len(offsets) else offsets[0]
+                first = max(first, offsets[after_turn])
+                end = _ends[story_id]
+                inode = _inodes[story_id]
+        except ValueError:
+            return []
+
+        with open(_segment_path(story_id), "rb") as f:
+            # 拿到索引之后段刚好被重写：offset 属于旧文件，按新文件重新索引再读
+            if os.fstat(f.fileno()).st_ino != inode:
+                continue
+            f.seek(first)
+            raw = f.read(end - first)
+        return [json.loads(line) for line in raw.splitlines() if line]
+
+
+def _read_range(path: str, first: int, end: int) -> List[Dict[str, Any]]:
+    with open(path, "rb") as f:
+        f.seek(first)
+        raw = f.read(end - first)
+    return [json.loads(line) for line in raw.splitlines() if line]
+
+
+def get_story_turns(story_id: str) -> List[Dict[str, Any]]:
+    return _read_turns(story_id)
+
+
+def get_recent_turns(story_id: str, limit: int) -> List[Dict[str, Any]]:
+    return _read_turns(story_id, limit)
+
+
+def list_story_ids() -> List[str]:
+    _ensure_store()
+    return sorted(
+        name[: -len(_SEGMENT_SUFFIX)]
+        for name in os.listdir(settings.STORIES_DIR)
+        if name.endswith(_SEGMENT_SUFFIX)
+    )
+
+
+def get_turns_after(story_id: str, after_turn: int) -> List[Dict[str, Any]]:
+    return _read_turns(story_id, after_turn=max(0, after_turn))
+
+
+def get_story_embeddings(story_id: str) -> List[List[float]]:
+    return [t["embedding"] for t in _read_turns(story_id) if t.get("embedding")]
+
+
+# ====== Scoring state ======
+# <story_id>.state 与日志段放在一起，持有写锁时随 append 一起更新（temp + rename）。
+# state.turns 与段内已提交行数不一致（崩溃 / 旧数据）时，从段里的 embedding 重建。
+def _state_path(story_id: str) -> str:
+    return os.path.join(settings.STORIES_DIR, story_id + _STATE_SUFFIX)
+
+
+def _load_state_file(story_id: str) -> Optional[ContextState]:
+    try:
+        with open(_state_path(story_id), "rb") as f:
+            return ContextState.from_bytes(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def _write_state_file(story_id: str, state: ContextState) -> None:
+    path = _state_path(story_id)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(state.to_bytes())
+    os.replace(tmp, path)
+
+
+def get_scoring_state(story_id: str) -> ContextState:
+    try:
+        with _thread_lock(story_id):
+            if not _refresh_index(story_id):
+                return ContextState()
+            n = len(_offsets[story_id])
+    except ValueError:
+        return ContextState()
+
+    state = _load_state_file(story_id)
+    if state is None or state.turns != n:
+        state = ContextState.from_turns(_read_turns(story_id)[:n])
+    return state
+
+
+def append_turns(story_id: str, turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    path = _segment_path(story_id)
+    _ensure_store()
+
+    with _story_write_lock(story_id):
+        # 与旧实现一致：往不存在的 story 追加时自动创建
+        with open(path, "ab"):
+            pass
+        _refresh_index(story_id)
+
+        offsets = _offsets[story_id]
+        end = _ends[story_id]
+        start_turn = len(offsets)
+
+        saved = []
+        chunk = bytearray()
+        new_offsets = []
+        for i, t in enumerate(turns):
+            # 统一分配 turn 序号（从 1 开始）
+            t2 = dict(t)
+            t2["story_id"] = story_id
+            t2["turn"] = start_turn + i + 1
+            saved.append(t2)
+
+            new_offsets.append(end + len(chunk))
+            chunk += _dump_line(t2)
+
+        with open(path, "r+b") as f:
+            # 截掉上次崩溃留下的半行，再整批写入
+            f.truncate(end)
+            f.seek(end)
+            f.write(chunk)
+            f.flush()
+            if settings.STORAGE_FSYNC:
+                os.fsync(f.fileno())
+
+        offsets.extend(new_offsets)
+        _ends[story_id] = end + len(chunk)
+
+        state = _load_state_file(story_id)
+        if state is None or state.turns != start_turn:
+            state = ContextState.from_turns(_read_range(path, 0, end))
+        for t in saved:
+            state.advance(t.get("embedding"))
+        _write_state_file(story_id, state)
+    return saved
+
+
+# ====== Rewrite ======
+# 日志段平时只追加；重投影（x / y / proj_version 改写）是唯一的原地修改：
+# 持写锁把整段写到临时文件再 os.replace，读者按 inode 发现替换并重建索引。
+# embedding 不变，scoring state 不受影响。
+def update_projections(story_id: str, updates: Dict[int, Tuple[float, float, str]]) -> int:
+    """updates: turn 序号 -> (x, y, proj_version)；返回实际改写的 turn 数"""
+    path = _segment_path(story_id)
+    _ensure_store()
+
+    with _story_write_lock(story_id):
+        if not _refresh_index(story_id):
+            return 0
+        turns = _read_range(path, 0, _ends[story_id])
+        changed = 0
+        for t in turns:
+            u = updates.get(t.get("turn"))
+            if u is not None:
+                t["x"], t["y"], t["proj_version"] = u
+                changed += 1
+        if not changed:
+            return 0
+
+        tmp = path + ".rewrite"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(_dump_line(t) for t in turns))
+            f.flush()
+            if settings.STORAGE_FSYNC:
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _refresh_index(story_id)
+    return changed
@@ -1,36 +1,55 @@
+import logging
 from typing import Dict, List
+from app.core.config import settings
 from app.utils import algo
-from app.services.storage import get_story_turns
+from app.utils.metrics import SCORING
+from app.services.conversation import observe_turns
+from app.services.storage import append_turns, get_scoring_state, get_story_embeddings
+
+logger = logging.getLogger(__name__)
 
 def _clamp01(x: float) -> float:
     if x < 0: return 0.0
     if x > 1: return 1.0
     return x
 
+def _verify_incremental(story_id: str, scored: List[Dict]) -> None:
+    """
+    校验模式：用全部历史 embedding 从头重算一遍，与增量结果比对（容差 SCORING_VERIFY_TOL）
+    """
+    context_vectors = get_story_embeddings(story_id) or []
+    tol = settings.SCORING_VERIFY_TOL
+    for t in scored:
+        if not t["embedding"]:
+            continue
+        ref = algo.score_embedding(t["embedding"], context_vectors)
+        for k in ("flow_score", "entropy_score"):
+            if abs(ref[k] - t[k]) > tol:
+                logger.warning(
+                    "⚠️ [Scoring] 增量结果与从头计算不一致: story=%s %s incremental=%s full=%s",
+                    story_id, k, t[k], ref[k],
+                )
+        context_vectors.append(t["embedding"])
+
 def score_turns(story_id: str, new_turns: List[Dict]) -> List[Dict]:
     """
-    使用 algo.py 计算真实的 Flow & Entropy
+    使用 algo.py 计算真实的 Flow & Entropy（总耗时记入 storylab_scoring_seconds）
     """
-    # 1. 获取该故事的所有历史 turns (为了拿到上下文向量)
-    history_turns = get_story_turns(story_id) or []
-    
-    # 提取所有历史的 embedding (如果有的话)
-    context_vectors = []
-    for t in history_turns:
-        if t.get("embedding"):
-            context_vectors.append(t["embedding"])
+    with SCORING.time():
+        return _score_turns(story_id, new_turns)
+
+def _score_turns(story_id: str, new_turns: List[Dict]) -> List[Dict]:
+    # 1. 取该故事的增量打分状态 (centroid 累加和 + 最后一个向量)，每句 O(d)
+    state = get_scoring_state(story_id)
     
     scored_result = []
     
-    # 2. 逐条计算新生成的 turn
-    for t in new_turns:
-        text = (t.get("text") or "").strip()
-        
-        # 调用核心算法
-        # 注意：这里我们传入当前的 context_vectors，
-        # 算完一条后，要把这一条的 embedding 加进去，作为下一条的 context
-        metrics = algo.calculate_metrics(text, context_vectors)
-        print(f"🐛 [DEBUG] Text: {text[:10]}... | Metrics: {metrics.keys()} | X: {metrics.get('x')} | Y: {metrics.get('y')}")
+    # 2. 一次 encode 批量计算全部新 turn（第 i 条以前 i-1 条为上下文，与逐条计算一致）
+    texts = [(t.get("text") or "").strip() for t in new_turns]
+    batch_metrics = algo.calculate_metrics_batch(texts, state)
+
+    for t, text, metrics in zip(new_turns, texts, batch_metrics):
+        logger.debug("🐛 Text: %s... | X: %s | Y: %s", text[:10], metrics.get("x"), metrics.get("y"))
         
         # 组装结果
         t2 = dict(t)
@@ -40,11 +59,17 @@ def score_turns(story_id: str, new_turns: List[Dict]) -> List[Dict]:
         # 新增可视化坐标
         t2["x"] = metrics.get("x", 0.0)
         t2["y"] = metrics.get("y", 0.0)
-        
-        # 将当前向量加入上下文，供下一轮循环使用 (如果是批量生成多条的情况)
-        if metrics["embedding"]:
-            context_vectors.append(metrics["embedding"])
-            
+        # x / y 来自哪个 PCA 版本（热加载后据此找出需要重投影的旧 turn）
+        t2["proj_version"] = metrics.get("proj_version")
         scored_result.append(t2)
+
+    if settings.SCORING_VERIFY:
+        _verify_incremental(story_id, scored_result)
         
     return scored_result
+
+def score_and_store(story_id: str, turns: List[Dict]) -> List[Dict]:
+    """打分 + 存库（阻塞），路由里整体放进打分线程池执行；存完顺手更新内存里的 LLM 上下文（检索索引由存储回调更新）"""
+    saved = append_turns(story_id, score_turns(story_id, turns))
+    observe_turns(story_id, saved)
+    return saved
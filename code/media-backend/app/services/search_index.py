@@ -0,0 +1,246 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services import analysis_data, storage
+from app.utils import algo
+from app.utils.vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+# ====== 语义检索：所有 story turns + 实验数据的向量索引 ======
+# - 第一次查询时构建：实验数据用 analysis_data 的合并结果（含列式表 memmap 出来的 embedding），
+#   story turns 直接用存库的 embedding，不重新编码
+# - 之后每次 storage.append_turns（打分存库、脚本 / 迁移直接写入）经存储回调 observe_turns 增量追加；向量数涨到上次训练的几倍后在后台线程重训 IVF
+# - 实验数据文件变了（不看 PCA 模型）在后台整体重建，重建完成前继续用旧索引
+# - 只看得到本进程写入的 turns；多 worker 部署时其他 worker 新写的 turn 要等下次重建才可见
+
+SOURCES = ("story", "experiment")
+_SOURCE_CODES = {name: i for i, name in enumerate(SOURCES)}
+
+
+class _State:
+    """一次构建的索引 + 每行的元数据（按行号对齐）"""
+
+    def __init__(self, dim: int, exp_version: str):
+        self.index = VectorIndex(
+            dim,
+            nlist=settings.SEARCH_NLIST,
+            nprobe=settings.SEARCH_NPROBE,
+            min_train=settings.SEARCH_MIN_TRAIN,
+        )
+        self.exp_version = exp_version
+        self.meta: List[Tuple[str, str, Any, str, Optional[str]]] = []  # (source, story_id, turn, text, author)
+        self.rows: Dict[Tuple[str, str, Any], int] = {}
+        self.sources = np.empty(1024, dtype=np.int8)
+
+    def add(self, items: List[Tuple[Tuple[str, str, Any, str, Optional[str]], Any]]) -> int:
+        """items: [(meta, embedding)]；(source, story_id, turn) 已经在索引里的跳过"""
+        fresh = [(m, v) for m, v in items if (m[0], m[1], m[2]) not in self.rows and len(v) == self.index.dim]
+        if not fresh:
+            return 0
+        start = len(self.meta)
+        end = start + len(fresh)
+        if end > len(self.sources):
+            grown = np.empty(max(2 * len(self.sources), end), dtype=np.int8)
+            grown[:start] = self.sources[:start]
+            self.sources = grown
+        self.sources[start:end] = [_SOURCE_CODES[m[0]] for m, _ in fresh]
+        for i, (m, _) in enumerate(fresh):
+            self.rows[(m[0], m[1], m[2])] = start + i
+        self.meta.extend(m for m, _ in fresh)
+        # 元数据先就位，再让向量对查询可见
+        self.index.add(np.asarray([v for _, v in fresh], dtype=np.float32))
+        return len(fresh)
+
+
+_state: Optional[_State] = None
+_lock = threading.Lock()          # 保护 _state 的追加 / 替换
+_build_lock = threading.Lock()    # 同一时刻只有一个构建
+_pending: Optional[List[Tuple[str, List[Dict[str, Any]]]]] = None  # 构建期间存库的 turns，构建完补上
+_training = False
+
+
+def _turn_items(source: str, story_id: str, turns: List[Dict[str, Any]]):
+    for i, t in enumerate(turns):
+        emb = t.get("embedding")
+        if emb is None or len(emb) == 0:
+            continue
+        turn = t.get("turn", i)
+        yield (source, story_id, turn, t.get("text") or "", t.get("author")), emb
+
+
+def _collect() -> Tuple[str, List]:
+    exp_version = analysis_data.dataset_version(include_model=False)
+    items = []
+    for sid, story in analysis_data.get_all_data()["data"].items():
+        items.extend(_turn_items("experiment", sid, story.get("rounds") or []))
+    for sid in storage.list_story_ids():
+        items.extend(_turn_items("story", sid, storage.get_story_turns(sid)))
+    return exp_version, items
+
+
+def _build() -> Optional[_State]:
+    global _state, _pending
+    with _build_lock:
+        with _lock:
+            _pending = []
+        t0 = time.perf_counter()
+        exp_version, items = _collect()
+        if not items:
+            with _lock:
+                _pending = None
+            return _state
+        state = _State(len(items[0][1]), exp_version)
+        state.add(items)
+        if state.index.needs_training():
+            state.index.train()
+        with _lock:
+            for story_id, saved in _pending:
+                state.add(list(_turn_items("story", story_id, saved)))
+            _pending = None
+            _state = state
+        logger.info(
+            "✅ [Search] 索引构建完成: %d 个向量, IVF=%s, %.2fs",
+            state.index.ntotal, "on" if state.index.trained else "off", time.perf_counter() - t0,
+        )
+        return state
+
+
+def _train_in_background(state: _State) -> None:
+    global _training
+    if _training:
+        return
+    _training = True
+
+    def run():
+        global _training
+        try:
+            t0 = time.perf_counter()
+            state.index.train()
+            logger.info("✅ [Search] IVF 重训完成: %d 个向量, %.2fs", state.index.ntotal, time.perf_counter() - t0)
+        except Exception as e:
+            logger.error("❌ [Search] IVF 训练失败: %s", e)
+        finally:
+            _training = False
+
+    threading.Thread(target=run, name="search-train", daemon=True).start()
+
+
+def _rebuild_in_background() -> None:
+    if _build_lock.locked():
+        return
+
+    def run():
+        try:
+            _build()
+        except Exception as e:
+            logger.error("❌ [Search] 索引重建失败: %s", e)
+
+    threading.Thread(target=run, name="search-rebuild", daemon=True).start()
+
+
+def _current() -> Optional[_State]:
+    state = _state
+    if state is None:
+        return _build()
+    if state.exp_version != analysis_data.dataset_version(include_model=False):
+        _rebuild_in_background()
+    return state
+
+
+def observe_turns(story_id: str, saved: List[Dict[str, Any]]) -> None:
+    """存库后调用：索引已建好时增量追加；还没建就什么都不做（构建时会从存储读到）"""
+    with _lock:
+        if _pending is not None:
+            _pending.append((story_id, saved))
+        state = _state
+        if state is None:
+            return
+        added = state.add(list(_turn_items("story", story_id, saved)))
+    if added and state.index.needs_training():
+        _train_in_background(state)
+
+
+def _hits(state: _State, scores: np.ndarray, rows: np.ndarray) -> List[Dict[str, Any]]:
+    hits = []
+    for score, row in zip(scores.tolist(), rows.tolist()):
+        source, story_id, turn, text, author = state.meta[row]
+        hits.append({
+            "score": round(score, 4), "source": source, "story_id": story_id,
+            "turn": turn, "text": text, "author": author,
+        })
+    return hits
+
+
+def search(
+    text: Optional[str] = None,
+    vector: Optional[List[float]] = None,
+    k: int = 10,
+    mode: str = "ivf",
+    source: Optional[str] = None,
+    nprobe: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    top-k 相似句。mode: ivf（近似，索引未训练时自动退回 exact）/ exact（暴力扫描）；
+    source: story / experiment / None（全部）。参数不合法抛 ValueError，模型不可用抛 RuntimeError。
+    """
+    if mode not in ("ivf", "exact"):
+        raise ValueError(f"unknown mode: {mode!r} (allowed: ivf, exact)")
+    if source is not None and source not in _SOURCE_CODES:
+        raise ValueError(f"unknown source: {source!r} (allowed: {', '.join(SOURCES)})")
+    if vector is None:
+        vector = algo.get_embedding(text or "")
+        if not vector:
+            raise RuntimeError("embedding model unavailable or empty query")
+
+    state = _current()
+    if state is None:
+        return {"mode": mode, "total": 0, "took_ms": 0.0, "hits": []}
+
+    t0 = time.perf_counter()
+    allowed = None
+    if source is not None:
+        n = state.index.ntotal
+        allowed = state.sources[:n] == _SOURCE_CODES[source]
+    exact = mode == "exact" or not state.index.trained
+    scores, rows = state.index.search(vector, k, exact=exact, nprobe=nprobe, allowed=allowed)
+    return {
+        "mode": "exact" if exact else "ivf",
+        "total": state.index.ntotal,
+        "took_ms": round((time.perf_counter() - t0) * 1000, 3),
+        "hits": _hits(state, scores, rows),
+    }
+
+
+def similar_to_turn(story_id: str, turn: int, **kwargs) -> Dict[str, Any]:
+    """用索引里已有的某个 story turn 的向量做查询（不重新编码）；turn 不在索引里抛 KeyError"""
+    state = _current()
+    row = state.rows.get(("story", story_id, turn)) if state is not None else None
+    if row is None:
+        raise KeyError((story_id, turn))
+    k = kwargs.pop("k", 10)
+    result = search(vector=state.index.vectors()[row], k=k + 1, **kwargs)
+    key = ("story", story_id, turn)
+    result["hits"] = [h for h in result["hits"] if (h["source"], h["story_id"], h["turn"]) != key][:k]
+    return result
+
+
+def status() -> Dict[str, Any]:
+    state = _state
+    if state is None:
+        return {"built": False, "building": _build_lock.locked()}
+    return {
+        "built": True,
+        "building": _build_lock.locked(),
+        "training": _training,
+        **state.index.stats(),
+        "experiment_version": state.exp_version,
+    }
+
+
+storage.add_append_listener(observe_turns)
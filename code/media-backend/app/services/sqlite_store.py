@@ -0,0 +1,323 @@
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.utils.context_state import ContextState
+
+logger = logging.getLogger(__name__)
+
+# ====== 存储引擎：本地 SQLite（WAL 模式） ======
+# - stories / turns 两张表，turns 以 (story_id, turn) 为主键，范围读走索引 O(log n)
+# - embedding 以 float32 BLOB 存储（384 维 = 1536 字节），比 JSON 浮点文本小约 4 倍
+# - turn 序号在 BEGIN IMMEDIATE 事务内分配，多线程 / 多 worker 进程下都不会重复
+# - scoring_state 表存增量打分状态（centroid 累加和 / 最后向量），与 turns 同一事务更新
+# - 每个线程一个连接（sqlite3 连接不能跨线程共享）
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    story_id   TEXT PRIMARY KEY,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    story_id      TEXT    NOT NULL,
+    turn          INTEGER NOT NULL,
+    author        TEXT    NOT NULL,
+    text          TEXT    NOT NULL,
+    flow_score    REAL    NOT NULL DEFAULT 0,
+    entropy_score REAL    NOT NULL DEFAULT 0,
+    x             REAL,
+    y             REAL,
+    embedding     BLOB,
+    extra         TEXT,
+    PRIMARY KEY (story_id, turn)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS scoring_state (
+    story_id TEXT PRIMARY KEY,
+    state    BLOB NOT NULL
+);
+"""
+
+# turns 表里有独立列的字段，其余字段进 extra（JSON）
+_COLUMNS = ("author", "text", "flow_score", "entropy_score", "x", "y")
+_OPTIONAL_COLUMNS = ("x", "y")
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_path: Optional[str] = None
+
+
+def pack_embedding(emb: Optional[List[float]]) -> Optional[bytes]:
+    if emb is None or len(emb) == 0:
+        return None
+    return np.asarray(emb, dtype=np.float32).tobytes()
+
+
+def unpack_embedding(blob: Optional[bytes]) -> Optional[List[float]]:
+    if not blob:
+        return None
+    return np.frombuffer(blob, dtype=np.float32).tolist()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == settings.SQLITE_PATH:
+        return conn
+
+    os.makedirs(os.path.dirname(settings.SQLITE_PATH), exist_ok=True)
+    # isolation_level=None：自己控制事务（BEGIN IMMEDIATE）
+    conn = sqlite3.connect(settings.SQLITE_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL" if not settings.STORAGE_FSYNC else "PRAGMA synchronous=FULL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    _local.conn = conn
+    _local.path = settings.SQLITE_PATH
+    _ensure_schema(conn)
+    return conn
+
+
+def _ensure_schema(conn: sqlite3.Connection) -> None:
+    global _initialized_path
+    with _init_lock:
+        if _initialized_path == settings.SQLITE_PATH:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            fresh = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'turns'"
+            ).fetchone() is None
+            for stmt in _SCHEMA.split(";"):
+                if stmt.strip():
+                    conn.execute(stmt)
+            if fresh:
+                n = _migrate(conn)
+                if n:
+                    logger.info("✅ [Storage] 已迁移 %d 个 story 到 SQLite: %s", n, settings.SQLITE_PATH)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        _initialized_path = settings.SQLITE_PATH
+
+
+def _iter_legacy_stories():
+    """
+    一次性迁移的数据来源：优先 per-story 日志段目录，其次旧版 stories.json
+    """
+    if os.path.isdir(settings.STORIES_DIR):
+        for path in sorted(glob.glob(os.path.join(settings.STORIES_DIR, "*.jsonl"))):
+            story_id = os.path.splitext(os.path.basename(path))[0]
+            with open(path, "rb") as f:
+                turns = [json.loads(line) for line in f if line.endswith(b"\n")]
+            yield story_id, turns
+    elif os.path.exists(settings.STORIES_PATH):
+        with open(settings.STORIES_PATH, "r", encoding="utf-8") as f:
+            yield from json.load(f).items()
+
+
+def _migrate(conn: sqlite3.Connection) -> int:
+    count = 0
+    for story_id, turns in _iter_legacy_stories():
+        conn.execute(
+            "INSERT OR IGNORE INTO stories (story_id, created_at) VALUES (?, ?)",
+            (story_id, time.time()),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO turns VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [_to_row(story_id, t.get("turn", i + 1), t) for i, t in enumerate(turns or [])],
+        )
+        count += 1
+    return count
+
+
+def _to_row(story_id: str, turn_no: int, t: Dict[str, Any]) -> tuple:
+    extra = {
+        k: v for k, v in t.items()
+        if k not in _COLUMNS and k not in ("story_id", "turn", "embedding")
+    }
+    return (
+        story_id,
+        turn_no,
+        t.get("author") or "human",
+        t.get("text") or "",
+        float(t.get("flow_score") or 0.0),
+        float(t.get("entropy_score") or 0.0),
+        t.get("x"),
+        t.get("y"),
+        pack_embedding(t.get("embedding")),
+        json.dumps(extra, ensure_ascii=False) if extra else None,
+    )
+
+
+def _from_row(row: tuple) -> Dict[str, Any]:
+    story_id, turn_no, author, text, flow, entropy, x, y, emb, extra = row
+    t: Dict[str, Any] = {
+        "author": author,
+        "text": text,
+        "flow_score": flow,
+        "entropy_score": entropy,
+        "story_id": story_id,
+        "turn": turn_no,
+    }
+    if emb is not None:
+        t["embedding"] = unpack_embedding(emb)
+    for k, v in zip(_OPTIONAL_COLUMNS, (x, y)):
+        if v is not None:
+            t[k] = v
+    if extra:
+        t.update(json.loads(extra))
+    return t
+
+
+def create_story() -> str:
+    conn = _connect()
+    while True:
+        story_id = str(uuid.uuid4())[:8]
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO stories (story_id, created_at) VALUES (?, ?)",
+            (story_id, time.time()),
+        )
+        if cur.rowcount:
+            return story_id
+
+
+def get_story_turns(story_id: str) -> List[Dict[str, Any]]:
+    rows = _connect().execute(
+        "SELECT * FROM turns WHERE story_id = ? ORDER BY turn", (story_id,)
+    ).fetchall()
+    return [_from_row(r) for r in rows]
+
+
+def get_recent_turns(story_id: str, limit: int) -> List[Dict[str, Any]]:
+    rows = _connect().execute(
+        "SELECT * FROM turns WHERE story_id = ? ORDER BY turn DESC LIMIT ?",
+        (story_id, limit),
+    ).fetchall()
+    return [_from_row(r) for r in reversed(rows)]
+
+
+def list_story_ids() -> List[str]:
+    rows = _connect().execute("SELECT story_id FROM stories ORDER BY created_at, story_id").fetchall()
+    return [r[0] for r in rows]
+
+
+def get_turns_after(story_id: str, after_turn: int) -> List[Dict[str, Any]]:
+    rows = _connect().execute(
+        "SELECT * FROM turns WHERE story_id = ? AND turn > ? ORDER BY turn",
+        (story_id, after_turn),
+    ).fetchall()
+    return [_from_row(r) for r in rows]
+
+
+def get_story_embeddings(story_id: str) -> List[List[float]]:
+    rows = _connect().execute(
+        "SELECT embedding FROM turns WHERE story_id = ? AND embedding IS NOT NULL ORDER BY turn",
+        (story_id,),
+    ).fetchall()
+    return [unpack_embedding(r[0]) for r in rows]
+
+
+def _rebuild_state(conn: sqlite3.Connection, story_id: str) -> ContextState:
+    state = ContextState()
+    for (blob,) in conn.execute(
+        "SELECT embedding FROM turns WHERE story_id = ? ORDER BY turn", (story_id,)
+    ):
+        state.advance(unpack_embedding(blob))
+    return state
+
+
+def _load_state(conn: sqlite3.Connection, story_id: str) -> ContextState:
+    """调用方需在事务内，保证 state 与 turns 是同一个快照"""
+    row = conn.execute(
+        "SELECT state FROM scoring_state WHERE story_id = ?", (story_id,)
+    ).fetchone()
+    state = ContextState.from_bytes(row[0]) if row else None
+    n = conn.execute(
+        "SELECT COUNT(*) FROM turns WHERE story_id = ?", (story_id,)
+    ).fetchone()[0]
+    if state is None or state.turns != n:
+        state = _rebuild_state(conn, story_id)
+    return state
+
+
+def get_scoring_state(story_id: str) -> ContextState:
+    conn = _connect()
+    conn.execute("BEGIN")
+    try:
+        return _load_state(conn, story_id)
+    finally:
+        conn.execute("COMMIT")
+
+
+def append_turns(story_id: str, turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # 与旧实现一致：往不存在的 story 追加时自动创建
+        conn.execute(
+            "INSERT OR IGNORE INTO stories (story_id, created_at) VALUES (?, ?)",
+            (story_id, time.time()),
+        )
+        start_turn = conn.execute(
+            "SELECT COALESCE(MAX(turn), 0) FROM turns WHERE story_id = ?", (story_id,)
+        ).fetchone()[0]
+
+        saved = []
+        rows = []
+        for i, t in enumerate(turns):
+            # 统一分配 turn 序号（从 1 开始）
+            t2 = dict(t)
+            t2["story_id"] = story_id
+            t2["turn"] = start_turn + i + 1
+            saved.append(t2)
+            rows.append(_to_row(story_id, t2["turn"], t2))
+
+        state = _load_state(conn, story_id)
+        conn.executemany("INSERT INTO turns VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        for t in saved:
+            state.advance(t.get("embedding"))
+        conn.execute(
+            "INSERT OR REPLACE INTO scoring_state (story_id, state) VALUES (?, ?)",
+            (story_id, state.to_bytes()),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return saved
+
+
+def update_projections(story_id: str, updates: Dict[int, Tuple[float, float, str]]) -> int:
+    """updates: turn 序号 -> (x, y, proj_version)；proj_version 存在 extra 里。返回实际改写的 turn 数"""
+    if not updates:
+        return 0
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        changed = 0
+        for turn_no, (x, y, version) in updates.items():
+            row = conn.execute(
+                "SELECT extra FROM turns WHERE story_id = ? AND turn = ?", (story_id, turn_no)
+            ).fetchone()
+            if row is None:
+                continue
+            extra = json.loads(row[0]) if row[0] else {}
+            extra["proj_version"] = version
+            conn.execute(
+                "UPDATE turns SET x = ?, y = ?, extra = ? WHERE story_id = ? AND turn = ?",
+                (x, y, json.dumps(extra, ensure_ascii=False), story_id, turn_no),
+            )
+            changed += 1
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return changed
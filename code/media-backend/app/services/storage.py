@@ -1,51 +1,95 @@
-import json
-import os
-import uuid
-from typing import Any, Dict, List
+import logging
+from typing import Any, Callable, Dict, List, Tuple
 
 from app.core.config import settings
+from app.utils.context_state import ContextState
+from app.utils.metrics import STORAGE
 
-def _ensure_data_file():
-    os.makedirs(settings.DATA_DIR, exist_ok=True)
-    if not os.path.exists(settings.STORIES_PATH):
-        with open(settings.STORIES_PATH, "w", encoding="utf-8") as f:
-            json.dump({}, f, ensure_ascii=False, indent=2)
+logger = logging.getLogger(__name__)
 
-def _load_db() -> Dict[str, List[Dict[str, Any]]]:
-    _ensure_data_file()
-    with open(settings.STORIES_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+# ====== 存储门面 ======
+# 路由 / scoring / llm_proxy 只依赖这里的函数，具体引擎由 settings.STORAGE_BACKEND 决定：
+# - "log"    : data/stories/<story_id>.jsonl，append-only 日志段（默认）
+# - "sqlite" : data/stories.sqlite3，WAL 模式，embedding 存 float32 BLOB
+# 每个函数的耗时记入 storylab_storage_seconds{op=函数名, kind=read|write}
+# append_turns 写成功后依次通知 add_append_listener 注册的回调（如检索索引增量追加），
+# 不管调用方是 score_and_store 还是脚本 / 迁移直接写入
+
+_impl = None
+_append_listeners: List[Callable[[str, List[Dict[str, Any]]], None]] = []
+
+
+def _backend():
+    global _impl
+    if _impl is None:
+        if settings.STORAGE_BACKEND == "sqlite":
+            from app.services import sqlite_store as impl
+        elif settings.STORAGE_BACKEND == "log":
+            from app.services import log_store as impl
+        else:
+            raise ValueError(f"unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND!r}")
+        _impl = impl
+    return _impl
 
-def _save_db(db: Dict[str, List[Dict[str, Any]]]) -> None:
-    _ensure_data_file()
-    with open(settings.STORIES_PATH, "w", encoding="utf-8") as f:
-        json.dump(db, f, ensure_ascii=False, indent=2)
 
 def create_story() -> str:
-    db = _load_db()
-    story_id = str(uuid.uuid4())[:8]
-    db[story_id] = []
-    _save_db(db)
-    return story_id
+    with STORAGE.labels(op="create_story", kind="write").time():
+        return _backend().create_story()
+
+
+def list_story_ids() -> List[str]:
+    with STORAGE.labels(op="list_story_ids", kind="read").time():
+        return _backend().list_story_ids()
+
 
 def get_story_turns(story_id: str) -> List[Dict[str, Any]]:
-    db = _load_db()
-    return db.get(story_id, [])
+    with STORAGE.labels(op="get_story_turns", kind="read").time():
+        return _backend().get_story_turns(story_id)
+
+
+def get_recent_turns(story_id: str, limit: int) -> List[Dict[str, Any]]:
+    """只取最近 limit 条 turns（按时间顺序），用于拼 LLM 上下文"""
+    with STORAGE.labels(op="get_recent_turns", kind="read").time():
+        return _backend().get_recent_turns(story_id, limit)
+
+
+def get_turns_after(story_id: str, after_turn: int) -> List[Dict[str, Any]]:
+    """只取 turn 序号大于 after_turn 的 turns（按时间顺序），用于增量刷新 LLM 上下文"""
+    with STORAGE.labels(op="get_turns_after", kind="read").time():
+        return _backend().get_turns_after(story_id, after_turn)
+
+
+def get_story_embeddings(story_id: str) -> List[List[float]]:
+    """只取该 story 已有的 embedding（按时间顺序，跳过没有向量的 turn），用于打分"""
+    with STORAGE.labels(op="get_story_embeddings", kind="read").time():
+        return _backend().get_story_embeddings(story_id)
+
+
+def get_scoring_state(story_id: str) -> ContextState:
+    """该 story 的增量打分状态（centroid 累加和 / 个数 / 最后向量），随 append_turns 一起持久化"""
+    with STORAGE.labels(op="get_scoring_state", kind="read").time():
+        return _backend().get_scoring_state(story_id)
+
+
+def add_append_listener(fn: Callable[[str, List[Dict[str, Any]]], None]) -> None:
+    """注册 append_turns 成功后的回调 fn(story_id, saved)；同一个函数只注册一次"""
+    if fn not in _append_listeners:
+        _append_listeners.append(fn)
+
 
 def append_turns(story_id: str, turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    db = _load_db()
-    cur = db.get(story_id, [])
-    start_turn = len(cur)
-
-    saved = []
-    for i, t in enumerate(turns):
-        # 统一分配 turn 序号（从 1 开始）
-        t2 = dict(t)
-        t2["story_id"] = story_id
-        t2["turn"] = start_turn + i + 1
-        saved.append(t2)
-        cur.append(t2)
-
-    db[story_id] = cur
-    _save_db(db)
+    with STORAGE.labels(op="append_turns", kind="write").time():
+        saved = _backend().append_turns(story_id, turns)
+    for fn in _append_listeners:
+        # 数据已落库：回调出错只记日志，不让这次写入失败
+        try:
+            fn(story_id, saved)
+        except Exception as e:
+            logger.warning("⚠️ [Storage] append 回调 %s 失败: %r", getattr(fn, "__name__", fn), e)
     return saved
+
+
+def update_projections(story_id: str, updates: Dict[int, Tuple[float, float, str]]) -> int:
+    """重投影：只改写指定 turn 的 x / y / proj_version（embedding 与打分不变），返回改写条数"""
+    with STORAGE.labels(op="update_projections", kind="write").time():
+        return _backend().update_projections(story_id, updates)
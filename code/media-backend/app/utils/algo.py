@@ -1,87 +1,313 @@
-import os
-import joblib
-from sentence_transformers import SentenceTransformer
+import logging
+import threading
 from scipy.spatial.distance import cosine, euclidean
 import numpy as np
 
-# 全局单例模型
-print("⏳ [Algo] 正在加载 Embedding 模型...")
-try:
-    model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
-    print("✅ [Algo] Embedding 模型加载完毕！")
-except Exception as e:
-    print(f"❌ [Algo] Embedding 模型加载失败: {e}")
-    model = None
-
-# 全局 PCA 模型
-pca_model = None
-try:
-    # 尝试加载 PCA 模型
-    # algo.py 在 app/utils/
-    # analysis.py 保存到了 data/ (也就是 media-backend/data)
-    # 所以我们要往上跳两级: utils -> app -> media-backend -> data
-    current_dir = os.path.dirname(os.path.abspath(__file__)) 
-    pca_path = os.path.join(current_dir, '..', '..', 'data', 'pca_model.pkl') 
-    pca_path = os.path.abspath(pca_path)
-    
-    if os.path.exists(pca_path):
-        pca_model = joblib.load(pca_path)
-        print(f"✅ [Algo] PCA 模型加载完毕: {pca_path}")
-    else:
-        print(f"⚠️ [Algo] PCA 模型未找到: {pca_path}")
-except Exception as e:
-    print(f"❌ [Algo] PCA 模型加载失败: {e}")
+from app.core.config import settings
+from app.utils.context_state import ContextState
+from app.utils import embed_backend, projection
+from app.utils.embedding_cache import EmbeddingCache, normalize_text
+from app.utils.metrics import EMBED, EMBED_BATCH_SIZE, EMBED_QUEUE_DEPTH, EMBED_QUEUE_WAIT, PCA
+from app.utils.micro_batch import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+
+# PCA 模型由 projection 模块按版本管理（projection.pca_path()，替换后自动热加载）
+
+# ====== 懒加载模型 ======
+# import 本模块不再加载 SentenceTransformer / PCA（否则每个 uvicorn worker、每次 --reload
+# 都要先卡几秒才能服务 /api/story/create）。第一次打分时加载，或由 warm_up_in_background() 预热。
+_model = None
+_model_lock = threading.Lock()
+_model_state = "not_loaded"  # not_loaded / loading / loaded / failed
+
+def _load_model():
+    global _model, _model_state
+    _model_state = "loading"
+    if settings.EMBED_POOL_SOCKET:
+        # 模型在进程外的池里：这里只连上去确认可用，不 import torch
+        from app.utils.embed_pool import RemoteModel
+        logger.info("⏳ [Algo] 正在连接 Embedding 进程池 %s ...", settings.EMBED_POOL_SOCKET)
+        try:
+            remote = RemoteModel(settings.EMBED_POOL_SOCKET, settings.EMBED_POOL_TIMEOUT)
+            dim = remote.wait_ready(settings.EMBED_POOL_TIMEOUT)
+            _model = remote
+            _model_state = "loaded"
+            logger.info("✅ [Algo] Embedding 进程池已就绪（%d 维）", dim)
+        except Exception as e:
+            _model_state = "failed"
+            logger.error("❌ [Algo] Embedding 进程池不可用: %s", e)
+        return
+    logger.info("⏳ [Algo] 正在加载 Embedding 模型（%s）...", settings.EMBED_BACKEND)
+    try:
+        _model = embed_backend.load(
+            MODEL_NAME, settings.EMBED_BACKEND, settings.EMBED_QUANT_CONFIG, settings.EMBED_ONNX_DIR,
+        )
+        _model_state = "loaded"
+        logger.info("✅ [Algo] Embedding 模型加载完毕！")
+    except Exception as e:
+        _model_state = "failed"
+        logger.error("❌ [Algo] Embedding 模型加载失败: %s", e)
+
+def get_model():
+    """全局单例 Embedding 模型；加载失败返回 None（与旧行为一致，打分退化为 0）"""
+    if _model_state in ("loaded", "failed"):
+        return _model
+    with _model_lock:
+        if _model_state not in ("loaded", "failed"):
+            _load_model()
+    return _model
+
+def get_pca_model():
+    """当前 PCA 模型；没有 pkl 时返回 None，坐标退化为 (0, 0)"""
+    proj = projection.current()
+    return proj.model if proj is not None else None
+
+def reload_pca_model():
+    """pca_model.pkl 被替换后（/api/analysis/rebuild）立即重新加载，之后的打分用新坐标系"""
+    proj = projection.reload()
+    return proj.model if proj is not None else None
+
+def warm_up():
+    get_model()
+    get_pca_model()
+
+def warm_up_in_background() -> threading.Thread:
+    """启动时后台预热，不阻塞服务；打分请求若先到，会在锁上等预热完成"""
+    t = threading.Thread(target=warm_up, name="algo-warmup", daemon=True)
+    t.start()
+    return t
+
+def model_status() -> dict:
+    pca = projection.status()
+    return {
+        # 模型加载失败不算就绪：embedding_model 报 "failed"，/ready 持续 503，不让坏实例接流量
+        "ready": _model_state == "loaded" and pca["state"] != "not_loaded",
+        "embedding_model": _model_state,
+        "pca_model": pca["state"],
+        "pca_version": pca["version"],
+    }
+
+# Embedding 缓存：重复句子（重试、"你好"、mock 兜底句、重新打分）不再过一遍 transformer
+# 非 torch 后端的向量略有偏差，缓存键里带上后端名，换后端不会混用磁盘缓存里的旧向量
+embedding_cache = None
+if settings.EMBED_CACHE_SIZE > 0 or settings.EMBED_CACHE_DIR:
+    _cache_key = MODEL_NAME if settings.EMBED_BACKEND == "torch" else f"{MODEL_NAME}@{settings.EMBED_BACKEND}"
+    embedding_cache = EmbeddingCache(_cache_key, settings.EMBED_CACHE_SIZE, settings.EMBED_CACHE_DIR)
+
+def _model_encode(texts: list) -> np.ndarray:
+    with EMBED.time():
+        return np.asarray(get_model().encode(list(texts)), dtype=np.float32)
+
+# Embedding 微批：各线程的 model.encode 经共享队列合批（EMBED_BATCH_MAX_SIZE <= 1 时不经过它）
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def _get_batcher() -> MicroBatcher:
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    _model_encode,
+                    max_batch=settings.EMBED_BATCH_MAX_SIZE,
+                    max_wait=settings.EMBED_BATCH_MAX_WAIT_MS / 1000,
+                    name="embed-batch",
+                    depth_gauge=EMBED_QUEUE_DEPTH,
+                    size_histogram=EMBED_BATCH_SIZE,
+                    wait_histogram=EMBED_QUEUE_WAIT,
+                )
+    return _batcher
+
+def shutdown_batcher() -> None:
+    """停掉合批线程（之后再编码会按当前 settings 重新创建）"""
+    global _batcher
+    with _batcher_lock:
+        batcher, _batcher = _batcher, None
+    if batcher is not None:
+        batcher.close()
+
+def _encode(texts: list) -> np.ndarray:
+    if settings.EMBED_BATCH_MAX_SIZE <= 1:
+        return _model_encode(texts)
+    return np.asarray(_get_batcher()(texts), dtype=np.float32)
+
+def encode_texts(texts: list) -> np.ndarray:
+    """
+    批量编码，返回 (k, d) float32 矩阵；先查缓存，未命中的文本合并成一次编码请求
+    （开了微批时再与其他连接同时在等的句子合成一次 model.encode）
+    """
+    if embedding_cache is None:
+        return _encode(list(texts))
+
+    found, missing = embedding_cache.get_many(texts)
+    if missing:
+        # 同一批里规范化后相同的文本只编码一次
+        groups = {}
+        for i in missing:
+            groups.setdefault(normalize_text(texts[i]), []).append(i)
+        reps = [texts[idx[0]] for idx in groups.values()]
+        fresh = _encode(reps)
+        embedding_cache.put_many(reps, fresh)
+        for idx, vec in zip(groups.values(), fresh):
+            for i in idx:
+                found[i] = vec
+    return np.stack(found)
 
 def get_embedding(text: str) -> list:
     """获取单个文本的向量"""
-    if not model or not text:
+    if not get_model() or not text:
         return []
-    return model.encode(text).tolist()
+    return encode_texts([text])[0].tolist()
 
-def calculate_metrics(current_text: str, context_vectors: list):
+def _score_vector(current_emb: list, last_emb, centroid):
     """
-    计算 Flow, Entropy 以及 PCA 坐标 (x, y)
+    对一个已编码的向量计算 Flow, Entropy 以及 PCA 坐标 (x, y)
+    last_emb / centroid 为 None 表示没有上下文（故事第一句）
     """
-    if not model:
-        return {
-            "embedding": [], "flow_score": 0.0, "entropy_score": 0.0,
-            "x": 0.0, "y": 0.0
-        }
-
-    # 1. 计算当前向量
-    current_emb = model.encode(current_text).tolist()
-    
     flow_score = 1.0
     entropy_score = 0.0
-    
-    if context_vectors and len(context_vectors) > 0:
-        last_emb = context_vectors[-1]
+
+    if last_emb is not None:
         sim = 1 - cosine(current_emb, last_emb)
         flow_score = max(0.0, float(sim))
-        
+
         # Entropy: Distance to the Centroid (Mean of Context)
         # "Center Offset" - 故事的中心偏移
-        context_matrix = np.array(context_vectors)
-        centroid = np.mean(context_matrix, axis=0)
         dist = euclidean(current_emb, centroid)
         # slightly adjust normalization factor for centroid distance (usually smaller than distance to start)
         entropy_score = min(1.0, dist / 10.0)
-        
-    # 2. 计算 PCA 坐标
+
+    # 2. 计算 PCA 坐标（同一个快照里取模型和版本号，两者一定配套）
     x, y = 0.0, 0.0
-    if pca_model:
+    proj = projection.current()
+    if proj is not None:
         try:
             # transform expects 2D array
-            coords = pca_model.transform([current_emb])
+            with PCA.time():
+                coords = proj.transform([current_emb])
             x = float(coords[0][0])
             y = float(coords[0][1])
         except Exception as e:
-            print(f"PCA Transform error: {e}")
+            logger.error("PCA Transform error: %s", e)
 
     return {
         "embedding": current_emb,
         "flow_score": round(flow_score, 4),
         "entropy_score": round(entropy_score, 4),
         "x": round(x, 3), 
-        "y": round(y, 3)
+        "y": round(y, 3),
+        "proj_version": proj.version if proj is not None else None,
     }
+
+def calculate_metrics(current_text: str, context_vectors: list):
+    """
+    计算 Flow, Entropy 以及 PCA 坐标 (x, y)
+    从头计算：context_vectors 为全部历史 embedding（增量版见 calculate_metrics_incremental）
+    """
+    if not get_model():
+        return {
+            "embedding": [], "flow_score": 0.0, "entropy_score": 0.0,
+            "x": 0.0, "y": 0.0
+        }
+
+    # 1. 计算当前向量
+    current_emb = encode_texts([current_text])[0].tolist()
+    return score_embedding(current_emb, context_vectors)
+
+def score_embedding(current_emb: list, context_vectors: list):
+    """对已有向量按全部历史从头打分（calculate_metrics 的后半段，也用于增量结果校验）"""
+    if context_vectors and len(context_vectors) > 0:
+        context_matrix = np.array(context_vectors)
+        centroid = np.mean(context_matrix, axis=0)
+        return _score_vector(current_emb, context_vectors[-1], centroid)
+    return _score_vector(current_emb, None, None)
+
+def calculate_metrics_incremental(current_text: str, state: ContextState):
+    """
+    增量版 calculate_metrics：上下文来自 story 的 ContextState（累加和 / 个数 / 最后向量），
+    每句 O(d)，不再把全部历史堆成矩阵。调用方负责把结果 push 回 state。
+    """
+    if not get_model():
+        return {
+            "embedding": [], "flow_score": 0.0, "entropy_score": 0.0,
+            "x": 0.0, "y": 0.0
+        }
+
+    current_emb = encode_texts([current_text])[0].tolist()
+
+    if state.count:
+        return _score_vector(current_emb, state.last.astype(np.float64), state.centroid())
+    return _score_vector(current_emb, None, None)
+
+def calculate_metrics_batch(texts: list, state: ContextState) -> list:
+    """
+    批量版 calculate_metrics_incremental：一次 model.encode 编码全部新句子，
+    Flow / Entropy 用向量化 NumPy 计算，第 i 句的上下文 = state + 前 i-1 句（与逐句循环一致）。
+    返回与逐句调用相同结构的 metrics 列表；不修改 state。
+    """
+    if not texts:
+        return []
+    if not get_model():
+        return [
+            {"embedding": [], "flow_score": 0.0, "entropy_score": 0.0, "x": 0.0, "y": 0.0}
+            for _ in texts
+        ]
+
+    emb32 = encode_texts(list(texts))
+    return score_embeddings_batch(emb32, state)
+
+def score_embeddings_batch(emb32: np.ndarray, state: ContextState) -> list:
+    """对已编码的 (k, d) float32 矩阵按链式上下文打分，calculate_metrics_batch 的后半段"""
+    k = emb32.shape[0]
+    emb = emb32.astype(np.float64)
+
+    # prev[i]: 第 i 句的上一句；sums[i]: 第 i 句之前全部向量的累加和
+    # 累加顺序与逐句 state.push 完全相同（cumsum 逐行顺序相加）
+    if state.count:
+        prev = np.vstack([state.last.astype(np.float64)[None, :], emb[:-1]])
+        sums = np.cumsum(np.vstack([state.sum[None, :], emb[:-1]]), axis=0)
+    else:
+        prev = np.vstack([np.zeros_like(emb[:1]), emb[:-1]])
+        sums = np.vstack([np.zeros_like(emb[:1]), np.cumsum(emb[:-1], axis=0)])
+    counts = state.count + np.arange(k)
+    has_ctx = counts > 0
+
+    # Flow: 1 - cosine distance（与 scipy.spatial.distance.cosine 同一公式，含 [0, 2] 裁剪）
+    uv = np.einsum("ij,ij->i", emb, prev)
+    uu = np.einsum("ij,ij->i", emb, emb)
+    vv = np.einsum("ij,ij->i", prev, prev)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos_dist = np.clip(1.0 - uv / np.sqrt(uu * vv), 0.0, 2.0)
+        centroids = sums / np.maximum(counts, 1)[:, None]
+    flow = np.where(has_ctx, np.maximum(0.0, 1.0 - cos_dist), 1.0)
+
+    # Entropy: Distance to the Centroid (Mean of Context)
+    dist = np.sqrt(np.einsum("ij,ij->i", emb - centroids, emb - centroids))
+    entropy = np.where(has_ctx, np.minimum(1.0, dist / 10.0), 0.0)
+
+    # PCA 坐标：整批一次 transform，整批共用一个投影版本
+    coords = np.zeros((k, 2))
+    proj = projection.current()
+    if proj is not None:
+        try:
+            with PCA.time():
+                coords = proj.transform(emb32)
+        except Exception as e:
+            logger.error("PCA Transform error: %s", e)
+    proj_version = proj.version if proj is not None else None
+
+    emb_lists = emb32.tolist()
+    return [
+        {
+            "embedding": emb_lists[i],
+            "flow_score": round(float(flow[i]), 4),
+            "entropy_score": round(float(entropy[i]), 4),
+            "x": round(float(coords[i][0]), 3),
+            "y": round(float(coords[i][1]), 3),
+            "proj_version": proj_version,
+        }
+        for i in range(k)
+    ]
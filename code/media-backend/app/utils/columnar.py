@@ -0,0 +1,225 @@
+import json
+import os
+import shutil
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# ====== 列式数据集格式（<name>.cols/ 目录） ======
+# table.json            : 行数、列定义、embedding 维度
+# embeddings.npy        : (n, d) float32，np.load(mmap_mode="r") 零拷贝映射；没有向量的行为全 0，
+# embeddings.mask.npy   :   并在 mask 里记为 False（全部都有向量时不写 mask）
+# <col>.npy             : 数值列（f8 / i8 / bool）
+# <col>.codes.npy       : 低基数字符串列（dataset / type / author ...）：int32 编码 + table.json 里的取值表
+# <col>.bin + .off.npy  : 其他字符串列：UTF-8 拼接 + int64 offsets（n + 1）
+# <col>.mask.npy        : 该列有缺失值时才写，False 的行在 rows() 里不带这个字段
+# 复杂值（list / dict / 混合类型）按 JSON 文本存成字符串列，kind = "json"
+
+FORMAT = "columnar-v1"
+SUFFIX = ".cols"
+_MISSING = object()
+
+
+def _safe_name(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "._-" else "_" for c in name)
+
+
+def _infer_kind(values: List[Any]) -> str:
+    present = [v for v in values if v is not _MISSING and v is not None]
+    if not present:
+        return "json"
+    if all(isinstance(v, bool) for v in present):
+        return "bool"
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return "i8"
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return "f8"
+    if all(isinstance(v, str) for v in present):
+        return "cat" if len(set(present)) <= max(16, len(present) // 8) else "str"
+    return "json"
+
+
+def _write_strings(directory: str, fname: str, strings: List[str]) -> None:
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(os.path.join(directory, fname + ".bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(directory, fname + ".off.npy"), offsets)
+
+
+def write_table(
+    path: str,
+    columns: Dict[str, Sequence[Any]],
+    embeddings: Optional[np.ndarray] = None,
+    embedding_mask: Optional[np.ndarray] = None,
+) -> None:
+    """
+    写一个列式表。columns: 列名 -> 长度为 n 的值序列（缺失值用 None 或 columnar.MISSING）。
+    先写临时目录再替换，读者不会看到写了一半的表。
+    """
+    n = len(next(iter(columns.values()))) if columns else (0 if embeddings is None else len(embeddings))
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    specs = []
+    for i, (name, values) in enumerate(columns.items()):
+        values = list(values)
+        if len(values) != n:
+            raise ValueError(f"column {name!r} has {len(values)} rows, expected {n}")
+        kind = _infer_kind(values)
+        fname = f"c{i}_{_safe_name(name)}"
+        spec: Dict[str, Any] = {"name": name, "kind": kind, "file": fname}
+
+        present = np.array([v is not _MISSING and v is not None for v in values], dtype=bool)
+        if kind == "json":
+            # json 列里 None 是合法值，只有 MISSING 才算缺失
+            present = np.array([v is not _MISSING for v in values], dtype=bool)
+        if not present.all():
+            np.save(os.path.join(tmp, fname + ".mask.npy"), present)
+            spec["mask"] = True
+
+        if kind in ("f8", "i8", "bool"):
+            fill = {"f8": 0.0, "i8": 0, "bool": False}[kind]
+            arr = np.array([v if ok else fill for v, ok in zip(values, present)], dtype=kind if kind != "bool" else bool)
+            np.save(os.path.join(tmp, fname + ".npy"), arr)
+        elif kind == "cat":
+            categories = sorted({v for v, ok in zip(values, present) if ok})
+            index = {c: j for j, c in enumerate(categories)}
+            codes = np.array([index[v] if ok else -1 for v, ok in zip(values, present)], dtype=np.int32)
+            np.save(os.path.join(tmp, fname + ".codes.npy"), codes)
+            spec["categories"] = categories
+        elif kind == "str":
+            _write_strings(tmp, fname, [v if ok else "" for v, ok in zip(values, present)])
+        else:
+            _write_strings(
+                tmp, fname,
+                [json.dumps(v, ensure_ascii=False, separators=(",", ":")) if ok else "" for v, ok in zip(values, present)],
+            )
+        specs.append(spec)
+
+    dim = 0
+    if embeddings is not None:
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[0] != n:
+            raise ValueError(f"embeddings must be (n={n}, d), got {embeddings.shape}")
+        dim = int(embeddings.shape[1])
+        np.save(os.path.join(tmp, "embeddings.npy"), embeddings)
+        if embedding_mask is not None and not np.all(embedding_mask):
+            np.save(os.path.join(tmp, "embeddings.mask.npy"), np.asarray(embedding_mask, dtype=bool))
+
+    with open(os.path.join(tmp, "table.json"), "w", encoding="utf-8") as f:
+        json.dump({"format": FORMAT, "rows": n, "dim": dim, "columns": specs}, f, ensure_ascii=False, indent=1)
+
+    # 目录不能被 os.replace 直接覆盖：旧表先挪开，新表就位后再删
+    old = path + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+MISSING = _MISSING
+
+
+class Table:
+    """
+    只读的列式表。数值列 / embedding 都是 memmap（只读、零拷贝），
+    字符串列在第一次访问时解码成 list 并缓存。
+    """
+
+    def __init__(self, path: str, mmap: bool = True):
+        self.path = path
+        self._mode = "r" if mmap else None
+        with open(os.path.join(path, "table.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT:
+            raise ValueError(f"unsupported table format: {meta.get('format')!r}")
+        self.n: int = meta["rows"]
+        self.dim: int = meta["dim"]
+        self._specs = {c["name"]: c for c in meta["columns"]}
+        self.columns: List[str] = [c["name"] for c in meta["columns"]]
+        self._decoded: Dict[str, List[Any]] = {}
+
+        self.embeddings: Optional[np.ndarray] = None
+        self.embedding_mask: Optional[np.ndarray] = None
+        if self.dim:
+            self.embeddings = self._load("embeddings.npy")
+            mask_path = os.path.join(path, "embeddings.mask.npy")
+            if os.path.exists(mask_path):
+                self.embedding_mask = np.load(mask_path)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _load(self, fname: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, fname), mmap_mode=self._mode)
+
+    def mask(self, name: str) -> Optional[np.ndarray]:
+        spec = self._specs[name]
+        return self._load(spec["file"] + ".mask.npy") if spec.get("mask") else None
+
+    def _strings(self, fname: str) -> List[str]:
+        offsets = np.load(os.path.join(self.path, fname + ".off.npy"))
+        with open(os.path.join(self.path, fname + ".bin"), "rb") as f:
+            blob = f.read()
+        return [blob[a:b].decode("utf-8") for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+    def column(self, name: str):
+        """数值列返回 memmap 数组；字符串 / json 列返回 list（缺失位置的值无意义，配合 mask 使用）"""
+        spec = self._specs[name]
+        kind = spec["kind"]
+        if kind in ("f8", "i8", "bool"):
+            return self._load(spec["file"] + ".npy")
+        if name not in self._decoded:
+            if kind == "cat":
+                categories = spec["categories"]
+                codes = self._load(spec["file"] + ".codes.npy").tolist()
+                self._decoded[name] = [categories[c] if c >= 0 else None for c in codes]
+            elif kind == "str":
+                self._decoded[name] = self._strings(spec["file"])
+            else:
+                self._decoded[name] = [json.loads(s) if s else None for s in self._strings(spec["file"])]
+        return self._decoded[name]
+
+    def rows(self, names: Optional[Iterable[str]] = None, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按行还原成 dict（列顺序 = 写入顺序），缺失的字段不出现"""
+        names = list(names) if names is not None else self.columns
+        stop = self.n if stop is None else min(stop, self.n)
+        cols = []
+        for name in names:
+            col = self.column(name)
+            values = col[start:stop]
+            values = values.tolist() if isinstance(values, np.ndarray) else values
+            mask = self.mask(name)
+            cols.append((name, values, mask[start:stop].tolist() if mask is not None else None))
+        out = []
+        for i in range(stop - start):
+            row = {}
+            for name, values, mask in cols:
+                if mask is None or mask[i]:
+                    row[name] = values[i]
+            out.append(row)
+        return out
+
+
+def load_table(path: str, mmap: bool = True) -> Table:
+    return Table(path, mmap=mmap)
+
+
+def table_path(json_path: str) -> str:
+    """xxx.json -> xxx.cols（同目录）"""
+    root, _ = os.path.splitext(json_path)
+    return root + SUFFIX
+
+
+def columns_from_rows(rows: Sequence[Dict[str, Any]], exclude: Sequence[str] = ()) -> Dict[str, List[Any]]:
+    """list of dict -> 列；列顺序按字段第一次出现的顺序，某行没有的字段记为 MISSING"""
+    names: Dict[str, None] = {}
+    for r in rows:
+        for k in r:
+            if k not in exclude:
+                names.setdefault(k, None)
+    return {k: [r.get(k, _MISSING) for r in rows] for k in names}
@@ -0,0 +1,86 @@
+import struct
+from typing import Iterable, Optional
+
+import numpy as np
+
+# 序列化格式：magic + dim + turns + count，后面跟 sum(float64[dim]) 与 last(float32[dim])
+_MAGIC = b"CST1"
+_HEADER = struct.Struct("<4sIqq")
+
+
+class ContextState:
+    """
+    story 的增量打分状态（替代每轮把全部历史 embedding 重新堆成矩阵求均值）:
+    - sum / count: 历史 embedding 的累加和与个数，centroid = sum / count
+    - last: 最后一个 embedding（float32，与模型输出同精度）
+    - turns: 该状态覆盖到的 turn 数（含没有 embedding 的 turn），用来校验与存储是否一致
+
+    sum 用 float64 累加，长故事里与 np.mean 的从头计算结果保持在舍入误差以内。
+    """
+
+    __slots__ = ("sum", "count", "last", "turns")
+
+    def __init__(self) -> None:
+        self.sum: Optional[np.ndarray] = None
+        self.count = 0
+        self.last: Optional[np.ndarray] = None
+        self.turns = 0
+
+    @classmethod
+    def from_turns(cls, turns: Iterable[dict]) -> "ContextState":
+        state = cls()
+        for t in turns:
+            state.advance(t.get("embedding"))
+        return state
+
+    def push(self, emb) -> None:
+        vec = np.asarray(emb, dtype=np.float32)
+        if self.sum is None:
+            self.sum = vec.astype(np.float64)
+        else:
+            self.sum += vec
+        self.count += 1
+        self.last = vec
+
+    def advance(self, emb) -> None:
+        """记录一个新 turn；没有 embedding 的 turn 只计数，不进入 centroid"""
+        self.turns += 1
+        if emb is not None and len(emb) > 0:
+            self.push(emb)
+
+    def centroid(self) -> Optional[np.ndarray]:
+        if not self.count:
+            return None
+        return self.sum / self.count
+
+    def copy(self) -> "ContextState":
+        other = ContextState()
+        other.sum = None if self.sum is None else self.sum.copy()
+        other.count = self.count
+        other.last = self.last
+        other.turns = self.turns
+        return other
+
+    def to_bytes(self) -> bytes:
+        dim = 0 if self.sum is None else self.sum.shape[0]
+        head = _HEADER.pack(_MAGIC, dim, self.turns, self.count)
+        if not dim:
+            return head
+        return head + self.sum.astype(np.float64).tobytes() + self.last.astype(np.float32).tobytes()
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> Optional["ContextState"]:
+        """格式不对返回 None，调用方应当从存储的 turns 重建"""
+        if len(raw) < _HEADER.size:
+            return None
+        magic, dim, turns, count = _HEADER.unpack_from(raw)
+        if magic != _MAGIC or len(raw) != _HEADER.size + dim * 12:
+            return None
+        state = cls()
+        state.turns = turns
+        state.count = count
+        if dim:
+            off = _HEADER.size
+            state.sum = np.frombuffer(raw, dtype=np.float64, count=dim, offset=off).copy()
+            state.last = np.frombuffer(raw, dtype=np.float32, count=dim, offset=off + dim * 8).copy()
+        return state
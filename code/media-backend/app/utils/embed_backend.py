@@ -0,0 +1,65 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# ====== Embedding 推理后端（EMBED_BACKEND） ======
+# - torch     : PyTorch fp32（默认，原来的行为）
+# - onnx      : 同一个模型导出的 ONNX，用 ONNX Runtime 推理（需要 pip install "sentence-transformers[onnx]"）
+# - onnx-int8 : ONNX + 动态 int8 量化（权重 int8，激活运行时量化），CPU 上最快，向量与 fp32 略有偏差
+#   量化配置按 CPU 指令集选（EMBED_QUANT_CONFIG：avx512_vnni / avx512 / avx2 / arm64）。
+#   优先用 Hub 上已导出的 onnx/model_qint8_<config>.onnx；没有的话在 EMBED_ONNX_DIR 下本地量化一次并缓存。
+# 三者输出同维度的向量，打分 / PCA 不用改；换后端前先跑 python -m app.scripts.embed_accuracy 看偏差。
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def _quantized_file(quant_config: str) -> str:
+    return f"onnx/model_qint8_{quant_config}.onnx"
+
+
+def _onnx_kwargs(threads: int) -> dict:
+    """ONNX Runtime 不看 torch / OMP 的线程设置：threads > 0 时显式指定 intra-op 线程数"""
+    if threads <= 0:
+        return {}
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    return {"session_options": options}
+
+
+def _export_int8(model_name: str, quant_config: str, export_dir: str, threads: int):
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    target = os.path.join(export_dir, model_name.replace("/", "__"))
+    file_name = _quantized_file(quant_config)
+    if not os.path.exists(os.path.join(target, file_name)):
+        logger.info("⏳ [Embed] 本地量化 %s (%s) -> %s", model_name, quant_config, target)
+        onnx_model = SentenceTransformer(model_name, backend="onnx")
+        onnx_model.save_pretrained(target)
+        export_dynamic_quantized_onnx_model(onnx_model, quant_config, target)
+    return SentenceTransformer(target, backend="onnx", model_kwargs={"file_name": file_name, **_onnx_kwargs(threads)})
+
+
+def load(model_name: str, backend: str = "torch", quant_config: str = "avx2", export_dir: str = "", threads: int = 0):
+    """按后端加载 SentenceTransformer；threads > 0 时限定 ONNX Runtime 的线程数。后端名不合法抛 ValueError"""
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown EMBED_BACKEND: {backend!r} (allowed: {', '.join(BACKENDS)})")
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs=_onnx_kwargs(threads))
+    try:
+        return SentenceTransformer(
+            model_name, backend="onnx",
+            model_kwargs={"file_name": _quantized_file(quant_config), **_onnx_kwargs(threads)},
+        )
+    except Exception as e:
+        if not export_dir:
+            raise
+        logger.warning("⚠️ [Embed] Hub 上没有 %s（%s），改为本地量化", _quantized_file(quant_config), e)
+        return _export_int8(model_name, quant_config, export_dir, threads)
@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ====== 进程外 Embedding 池（可选，EMBED_POOL_SOCKET 非空时启用） ======
+# 模型只在池进程里：父进程加载一次，fork 出固定个数的 worker，权重以写时复制共享（不会随 worker 数翻倍）；
+# 每个 worker 显式设置 torch 线程数，worker 数 x 线程数 <= CPU 核数，不再互相抢核。
+# uvicorn 的 web worker 只持有 RemoteModel（不 import torch），加多少 web worker 内存都基本不变。
+#
+# IPC：Unix socket，每次 encode 一个短连接（所有池 worker 在同一个监听 socket 上 accept，
+# 哪个空闲哪个接，天然负载均衡；Unix socket 建连只要几十微秒）。
+#   请求：>I 长度 + UTF-8 JSON 文本列表（空列表 = ping，只回维度）
+#   响应：>BII (status, n, dim) + n*dim 个 little-endian float32；status=1 时后面是 n 字节的错误信息
+
+_REQUEST = struct.Struct(">I")
+_RESPONSE = struct.Struct(">BII")
+_MAX_REQUEST = 64 << 20
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytearray:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:])
+        if k == 0:
+            raise ConnectionError("embedding pool connection closed")
+        got += k
+    return buf
+
+
+# ====== web worker 端 ======
+class RemoteModel:
+    """池里的 SentenceTransformer 的替身：encode(texts) -> (n, d) float32"""
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        self.path = path
+        self.timeout = timeout
+
+    def _request(self, texts: List[str]) -> np.ndarray:
+        payload = json.dumps(list(texts), ensure_ascii=False).encode("utf-8")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            sock.sendall(_REQUEST.pack(len(payload)) + payload)
+            status, n, dim = _RESPONSE.unpack(_recv_exact(sock, _RESPONSE.size))
+            body = _recv_exact(sock, n if status else n * dim * 4)
+        if status:
+            raise RuntimeError(f"embedding pool error: {body.decode('utf-8', 'replace')}")
+        return np.frombuffer(body, dtype="<f4").reshape(n, dim)
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        return self._request(list(texts))
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._request([]).shape[1]
+
+    def wait_ready(self, timeout: float) -> int:
+        """等池启动（socket 出现且模型加载完）；返回向量维度，超时抛最后一次的错误"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.get_sentence_embedding_dimension()
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+
+
+# ====== 池进程端 ======
+def set_torch_threads(threads: int) -> None:
+    """在 import torch 之前设环境变量，之后再 set_num_threads（fork 出的 worker 里再调一次）"""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # 只能在第一次并行计算之前设置；fork 出的 worker 里已经设过就跳过
+        pass
+
+
+def _handle(conn: socket.socket, model, dims: Dict[str, int]) -> None:
+    (size,) = _REQUEST.unpack(_recv_exact(conn, _REQUEST.size))
+    if size > _MAX_REQUEST:
+        raise ValueError(f"request too large: {size} bytes")
+    try:
+        texts = json.loads(_recv_exact(conn, size).decode("utf-8"))
+        if texts:
+            emb = np.ascontiguousarray(model.encode(texts), dtype="<f4")
+            dims["dim"] = emb.shape[1]
+        else:
+            if "dim" not in dims:
+                dims["dim"] = int(model.get_sentence_embedding_dimension())
+            emb = np.empty((0, dims["dim"]), dtype="<f4")
+    except Exception as e:
+        msg = repr(e).encode("utf-8")
+        conn.sendall(_RESPONSE.pack(1, len(msg), 0) + msg)
+        return
+    conn.sendall(_RESPONSE.pack(0, emb.shape[0], emb.shape[1]))
+    if emb.size:
+        conn.sendall(emb.data)
+
+
+def _worker_loop(listener: socket.socket, model, load_model: Callable[[], object], threads: int) -> None:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    set_torch_threads(threads)
+    if model is None:
+        model = load_model()
+    model.encode(["warm up"])
+    dims: Dict[str, int] = {}
+    while True:
+        conn, _ = listener.accept()
+        with conn:
+            conn.settimeout(30)
+            try:
+                _handle(conn, model, dims)
+            except Exception as e:
+                logger.warning("⚠️ [EmbedPool] 请求处理失败: %r", e)
+
+
+class _Stop(Exception):
+    pass
+
+
+def serve(
+    path: str,
+    load_model: Callable[[], object],
+    workers: int = 2,
+    threads: int = 1,
+    preload: bool = True,
+) -> None:
+    """
+    绑定 Unix socket，fork workers 个进程服务 encode 请求；worker 异常退出会被重新拉起。
+    preload=True 时父进程先加载模型再 fork（权重写时复制共享）；False 时每个 worker 各自加载。
+    SIGTERM / SIGINT 时停掉所有 worker 并删除 socket 文件。
+    """
+    set_torch_threads(threads)
+    model = load_model() if preload else None
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    os.chmod(path, 0o600)
+    listener.listen(256)
+
+    children: Dict[int, int] = {}  # pid -> 槽位
+
+    def spawn(slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _worker_loop(listener, model, load_model, threads)
+            except BaseException as e:
+                logger.error("❌ [EmbedPool] worker 异常退出: %r", e)
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = slot
+
+    def stop(signum, frame):
+        # waitpid 被信号打断后会自动重试，只有抛异常才能跳出
+        raise _Stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        for slot in range(workers):
+            spawn(slot)
+        logger.info("✅ [EmbedPool] %d 个 worker x %d 线程，监听 %s", workers, threads, path)
+        while True:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            slot = children.pop(pid, None)
+            if slot is not None:
+                logger.warning("⚠️ [EmbedPool] worker %d 退出（status=%d），重新拉起", pid, status)
+                time.sleep(1.0)
+                spawn(slot)
+    except _Stop:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        listener.close()
+        if os.path.exists(path):
+            os.unlink(path)
+        logger.info("🛑 [EmbedPool] 已停止")
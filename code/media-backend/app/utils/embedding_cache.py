@@ -0,0 +1,199 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.filelock import file_lock
+
+# ====== Embedding 缓存 ======
+# key = 模型名 + 规范化文本（strip + 连续空白折叠成一个空格）
+# - 内存：有界 LRU（OrderedDict）
+# - 磁盘（可选）：vectors.f32 为 float32 行矩阵（np.memmap 读取），keys.jsonl 为 key -> 行号，
+#   均为 append-only，多个 worker 进程共享同一目录，重启后仍然命中
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WS.sub(" ", (text or "").strip())
+
+
+class DiskEmbeddingStore:
+    """append-only 的磁盘向量表，读取走 memmap（按需重新映射以看到其他进程的追加）"""
+
+    def __init__(self, directory: str, dim: int):
+        self.dim = dim
+        self.vectors_path = os.path.join(directory, f"vectors_{dim}.f32")
+        self.keys_path = os.path.join(directory, f"keys_{dim}.jsonl")
+        self.lock_path = os.path.join(directory, f".cache_{dim}.lock")
+        os.makedirs(directory, exist_ok=True)
+
+        self._rows: Dict[str, int] = {}
+        self._keys_offset = 0
+        self._mm: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        with self._lock:
+            self._refresh_keys()
+
+    def _refresh_keys(self) -> None:
+        """只读 keys.jsonl 上次读到之后的新行"""
+        try:
+            size = os.path.getsize(self.keys_path)
+        except FileNotFoundError:
+            return
+        if size <= self._keys_offset:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self._keys_offset += len(line)
+                try:
+                    rec = json.loads(line)
+                    self._rows[rec["k"]] = rec["r"]
+                except (ValueError, KeyError):
+                    continue
+
+    def _row(self, row: int) -> Optional[np.ndarray]:
+        if self._mm is None or row >= self._mm.shape[0]:
+            try:
+                n = os.path.getsize(self.vectors_path) // (self.dim * 4)
+            except FileNotFoundError:
+                return None
+            if row >= n:
+                return None
+            self._mm = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+        return np.array(self._mm[row])
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                self._refresh_keys()
+                row = self._rows.get(key)
+            if row is None:
+                return None
+            return self._row(row)
+
+    def put_many(self, items: Sequence[Tuple[str, np.ndarray]]) -> None:
+        if not items:
+            return
+        with self._lock, file_lock(self.lock_path):
+            self._refresh_keys()
+            items = [(k, v) for k, v in items if k not in self._rows]
+            if not items:
+                return
+            # 先写向量再写 key：key 可见时向量一定已经落盘
+            with open(self.vectors_path, "ab") as f:
+                start = f.tell() // (self.dim * 4)
+                f.write(np.stack([np.asarray(v, dtype=np.float32) for _, v in items]).tobytes())
+            lines = []
+            for i, (k, _) in enumerate(items):
+                lines.append(json.dumps({"k": k, "r": start + i}, ensure_ascii=False) + "\n")
+            with open(self.keys_path, "ab") as f:
+                f.write("".join(lines).encode("utf-8"))
+            self._refresh_keys()
+
+
+class EmbeddingCache:
+    """
+    有界 LRU + 可选磁盘层。get_many 返回命中的向量和未命中的下标，调用方只编码未命中的文本。
+    """
+
+    def __init__(self, model_name: str, max_entries: int = 4096, disk_dir: str = ""):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._disk: Optional[DiskEmbeddingStore] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._open_existing()
+
+    def _open_existing(self) -> None:
+        """重启后直接挂上已有的磁盘层（维度从文件名里取）"""
+        if not self.disk_dir or not os.path.isdir(self.disk_dir):
+            return
+        for name in sorted(os.listdir(self.disk_dir)):
+            m = re.match(r"^keys_(\d+)\.jsonl$", name)
+            if m:
+                self._disk = DiskEmbeddingStore(self.disk_dir, int(m.group(1)))
+                return
+
+    def _key(self, text: str) -> str:
+        return f"{self.model_name}\x00{normalize_text(text)}"
+
+    def _disk_store(self, dim: int) -> Optional[DiskEmbeddingStore]:
+        if not self.disk_dir:
+            return None
+        if self._disk is None or self._disk.dim != dim:
+            self._disk = DiskEmbeddingStore(self.disk_dir, dim)
+        return self._disk
+
+    def _remember(self, key: str, vec: np.ndarray) -> None:
+        # 缓存里的向量是共享的，禁止调用方原地修改
+        vec.setflags(write=False)
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+            self.evictions += 1
+
+    def get_many(self, texts: Sequence[str]) -> Tuple[List[Optional[np.ndarray]], List[int]]:
+        found: List[Optional[np.ndarray]] = [None] * len(texts)
+        missing: List[int] = []
+        with self._lock:
+            for i, text in enumerate(texts):
+                key = self._key(text)
+                vec = self._lru.get(key)
+                if vec is not None:
+                    self._lru.move_to_end(key)
+                    self.hits += 1
+                    found[i] = vec
+                    continue
+                disk = self._disk
+                vec = disk.get(key) if disk is not None else None
+                if vec is not None:
+                    self.disk_hits += 1
+                    if self.max_entries > 0:
+                        self._remember(key, vec)
+                    found[i] = vec
+                    continue
+                self.misses += 1
+                missing.append(i)
+        return found, missing
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        if len(texts) == 0:
+            return
+        items = []
+        with self._lock:
+            for text, vec in zip(texts, vectors):
+                key = self._key(text)
+                vec = np.array(vec, dtype=np.float32)
+                if self.max_entries > 0:
+                    self._remember(key, vec)
+                items.append((key, vec))
+            disk = self._disk_store(vectors.shape[1])
+        if disk is not None:
+            disk.put_many(items)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._lru),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_entries": len(self._disk._rows) if self._disk is not None else 0,
+            }
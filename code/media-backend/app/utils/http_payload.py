@@ -0,0 +1,47 @@
+import gzip
+import json
+from typing import Any, Optional
+
+# ====== 大响应体：快速序列化 + 预压缩 ======
+# orjson / brotli 都是可选依赖：装了就用，没装退回标准库 json / gzip
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 取决于部署环境
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 取决于部署环境
+    brotli = None
+
+
+def _default(obj: Any) -> Any:
+    # numpy 数组（列式数据集里 memmap 出来的 embedding）
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def pick_encoding(accept_encoding: str) -> Optional[str]:
+    """按 Accept-Encoding 选压缩方式：br（装了 brotli 时）优先，其次 gzip"""
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
@@ -0,0 +1,121 @@
+import json
+from typing import Any, Iterator, Sequence, Set, Tuple
+
+# ====== 流式读取大 JSON 文件里的「顶层 dict 的某个子 dict」 ======
+# 实验数据都是 {"...": ..., "experiment_data": {key: {...}, key: {...}, ...}} 这种结构，
+# 整个文件 json.load 要把全部 embedding 一次性变成 Python 对象。
+# iter_members 按块读文件，逐个 raw_decode 子 dict 的成员，内存里只保留当前这一条记录。
+
+_CHUNK = 1 << 20
+_WS = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+class _Buffer:
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(max(_CHUNK, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        # 丢掉已消费的部分，缓冲区只保留当前记录
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ValueError(f"expected {ch!r} at offset {self.pos}, got {self.peek()!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # 值还没读完整：继续读（读到文件尾仍失败就是真的格式错误）
+                if not self.fill():
+                    raise
+                continue
+            # 数字可能被块边界截断（"1.2|34"），不在末尾才算完整
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return obj
+
+
+def _skip(buf: _Buffer) -> None:
+    """跳过一个值；dict 逐个成员解析后丢弃，不把整个大 dict 读进内存"""
+    if buf.peek() != "{":
+        buf.value()
+        return
+    buf.expect("{")
+    while buf.peek() != "}":
+        buf.value()
+        buf.expect(":")
+        buf.value()
+        if buf.peek() == ",":
+            buf.pos += 1
+    buf.pos += 1
+
+
+def _iter_key(path: str, key: str, seen: Set[str]) -> Iterator[Tuple[str, Any]]:
+    """逐条产出顶层字段 key（须为 dict）的成员；扫描途中把遇到的顶层字段名记进 seen"""
+    with open(path, "r", encoding="utf-8") as f:
+        buf = _Buffer(f)
+        buf.expect("{")
+        while buf.peek() not in ("}", ""):
+            name = buf.value()
+            buf.expect(":")
+            seen.add(name)
+            if name == key and buf.peek() == "{":
+                buf.expect("{")
+                if buf.peek() != "}":
+                    while buf.peek() != "}":
+                        member = buf.value()
+                        buf.expect(":")
+                        yield member, buf.value()
+                        if buf.peek() == ",":
+                            buf.pos += 1
+                    return
+                # 空 dict：继续扫完，把后面的字段名也记进 seen
+                buf.pos += 1
+            else:
+                _skip(buf)
+            if buf.peek() == ",":
+                buf.pos += 1
+
+
+def iter_members(path: str, keys: Sequence[str]) -> Iterator[Tuple[str, Any]]:
+    """
+    逐条产出顶层对象里、按 keys 顺序第一个非空子 dict 的 (key, value)，
+    与 data.get(keys[0]) or data.get(keys[1]) ... 一致（与字段在文件里的先后无关）。
+    前面的 key 不存在或为空时再扫一遍文件找下一个；文件里没出现过的 key 不再扫。
+    """
+    seen: Set[str] = set()
+    for i, key in enumerate(keys):
+        if i and key not in seen:
+            continue
+        found = False
+        for item in _iter_key(path, key, seen):
+            found = True
+            yield item
+        if found:
+            return
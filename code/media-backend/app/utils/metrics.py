@@ -0,0 +1,219 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# ====== Prometheus 风格的指标 ======
+# 装了 prometheus_client 就直接用它（默认 registry，顺带进程级指标）；
+# 没装时用这里的最小实现（Counter / Histogram，带 labels），/metrics 输出同样的文本格式。
+# 两者接口一致：metric.labels(op="x").observe(0.1) / metric.inc() / gauge.set(3) / with metric.time(): ...
+
+try:
+    import prometheus_client as _prom
+except ImportError:  # pragma: no cover - 取决于部署环境
+    _prom = None
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List["_Metric"] = []
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else f"{float(v):.1f}"
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self
+
+    def labels(self, *values, **kwargs) -> "_Metric":
+        if kwargs:
+            values = tuple(kwargs[n] for n in self.labelnames)
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {key}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._child()
+                    self._children[key] = child
+        return child
+
+    def _child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _samples(self, labels: Sequence[Tuple[str, str]]) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child._samples(list(zip(self.labelnames, key))))
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.value = 0.0
+        super().__init__(name, documentation, labelnames)
+
+    def _child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def _samples(self, labels):
+        yield f"{self.name}_total{_label_str(labels)} {_fmt(self.value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.value = 0.0
+        super().__init__(name, documentation, labelnames)
+
+    def _child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def _samples(self, labels):
+        yield f"{self.name}{_label_str(labels)} {_fmt(self.value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        super().__init__(name, documentation, labelnames)
+
+    def _child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, amount: float) -> None:
+        i = bisect.bisect_left(self.buckets, amount)
+        with self._lock:
+            self._counts[i] += 1
+            self.sum += amount
+
+    @contextmanager
+    def time(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    def _samples(self, labels):
+        with self._lock:
+            counts, total = list(self._counts), self.sum
+        acc = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            acc += n
+            yield f"{self.name}_bucket{_label_str(list(labels) + [('le', _fmt(bound))])} {acc}"
+        yield f"{self.name}_sum{_label_str(labels)} {_fmt(total)}"
+        yield f"{self.name}_count{_label_str(labels)} {acc}"
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()):
+    if _prom is not None:
+        return _prom.Counter(name, documentation, labelnames)
+    metric = Counter(name, documentation, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()):
+    if _prom is not None:
+        return _prom.Gauge(name, documentation, labelnames)
+    metric = Gauge(name, documentation, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+    if _prom is not None:
+        return _prom.Histogram(name, documentation, labelnames, buckets=buckets)
+    metric = Histogram(name, documentation, labelnames, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def render() -> Tuple[bytes, str]:
+    """(响应体, Content-Type)，Prometheus 文本格式"""
+    if _prom is not None:
+        return _prom.generate_latest(), _prom.CONTENT_TYPE_LATEST
+    return ("\n".join(m.render() for m in _registry) + "\n").encode("utf-8"), CONTENT_TYPE
+
+
+# ====== 单轮流水线的各段耗时 ======
+_FAST_BUCKETS = (1e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.05)
+_LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+LLM_TTFT = histogram(
+    "storylab_llm_ttft_seconds", "LLM 请求发出到收到第一个 token 的时间（每次续写请求一条）", buckets=_LLM_BUCKETS,
+)
+LLM_STREAM = histogram(
+    "storylab_llm_stream_seconds", "一次 LLM 流式请求从发出到读完的总时间", buckets=_LLM_BUCKETS,
+)
+SEGMENT = histogram(
+    "storylab_segment_seconds", "流式断句：每个 delta 的 SentenceSegmenter.feed 耗时", buckets=_FAST_BUCKETS,
+)
+EMBED = histogram("storylab_embed_seconds", "model.encode 一次调用的耗时（缓存未命中的部分）")
+PCA = histogram("storylab_pca_seconds", "PCA 投影一次 transform 的耗时", buckets=_FAST_BUCKETS)
+SCORING = histogram("storylab_scoring_seconds", "score_turns 一次调用的总耗时（编码 + 打分 + 投影）")
+STORAGE = histogram("storylab_storage_seconds", "存储读写耗时", ("op", "kind"))
+
+# ====== Embedding 微批 ======
+EMBED_QUEUE_DEPTH = gauge("storylab_embed_queue_depth", "等待合批编码的句子数")
+EMBED_BATCH_SIZE = histogram(
+    "storylab_embed_batch_size", "每次合批 encode 的句子数", buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+EMBED_QUEUE_WAIT = histogram(
+    "storylab_embed_queue_wait_seconds", "句子从进队到被合批送进 model.encode 的等待时间",
+    buckets=(1e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+LLM_MOCK_FALLBACK = counter("storylab_llm_mock_fallback", "LLM 不可用时改用 mock 文本的次数", ("reason",))
+LLM_CONTINUE_RETRIES = counter("storylab_llm_continue_retries", "句数不够时补发续写请求的次数")
@@ -0,0 +1,140 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+# ====== 动态微批 ======
+# 多个线程（各个 ws 连接 / REST 请求的打分任务）各自提交几条输入，单独的 dispatcher 线程把它们
+# 合成一批调用一次 fn（如 model.encode），结果按提交顺序切开，经 Future 还给各自的调用方。
+# - 第一条请求到达后最多再等 max_wait 秒，或凑够 max_batch 条就立即发出；max_wait=0 只合并已经在排队的
+# - 上一批只来自一个调用方（没有并发）时不等：顺序调用的单个用户不会因为合批多出 max_wait 的延迟
+# - 单个请求超过 max_batch 条时整批单独发出（不拆分）；凑批时放不下的请求留到下一批打头
+# - fn 只在 dispatcher 线程里调用：模型前向不再被多个线程同时抢 CPU
+# - fork 出的子进程里第一次 submit 时重建队列和线程（父进程的线程不会被继承）
+
+_STOP = object()
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], Sequence[Any]],
+        max_batch: int = 32,
+        max_wait: float = 0.005,
+        name: str = "micro-batch",
+        depth_gauge=None,
+        size_histogram=None,
+        wait_histogram=None,
+    ):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait)
+        self.name = name
+        self._depth_gauge = depth_gauge
+        self._size_histogram = size_histogram
+        self._wait_histogram = wait_histogram
+
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = 0
+        self._depth = 0  # 已提交、还没发出的条数
+        self._last_parts = 0  # 上一批合并了几个请求
+
+    # ---- 调用方 ----
+    def submit(self, items: Sequence[Any]) -> Future:
+        """提交一组输入，返回 Future；结果是 fn 输出里与之对应的那一段"""
+        items = list(items)
+        fut: Future = Future()
+        if not items:
+            fut.set_result([])
+            return fut
+        self._ensure_thread()
+        self._add_depth(len(items))
+        self._queue.put((items, fut, time.perf_counter()))
+        return fut
+
+    def __call__(self, items: Sequence[Any]) -> Any:
+        """同步调用：提交并等待结果"""
+        return self.submit(items).result()
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """发出已排队的请求后停止 dispatcher 线程"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    # ---- dispatcher ----
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                    self._depth = 0
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _add_depth(self, n: int) -> None:
+        with self._lock:
+            self._depth += n
+            depth = self._depth
+        if self._depth_gauge is not None:
+            self._depth_gauge.set(depth)
+
+    def _next_batch(self, first) -> Tuple[List[Tuple[List[Any], Future, float]], Any]:
+        """以 first 打头凑一批，返回 (batch, 放不下留给下一批的请求或 _STOP / None)"""
+        batch = [first]
+        size = len(first[0])
+        deadline = time.perf_counter() + (self.max_wait if self._last_parts > 1 else 0.0)
+        while size < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP or size + len(item[0]) > self.max_batch:
+                return batch, item
+            batch.append(item)
+            size += len(item[0])
+        return batch, None
+
+    def _dispatch(self, batch: List[Tuple[List[Any], Future, float]]) -> None:
+        items = [x for part, _, _ in batch for x in part]
+        self._add_depth(-len(items))
+        self._last_parts = len(batch)
+        now = time.perf_counter()
+        if self._size_histogram is not None:
+            self._size_histogram.observe(len(items))
+        if self._wait_histogram is not None:
+            for part, _, submitted in batch:
+                self._wait_histogram.observe(now - submitted)
+
+        try:
+            out = self.fn(items)
+        except Exception as e:
+            # 异常原样交给这一批的每个调用方
+            for _, fut, _ in batch:
+                fut.set_exception(e)
+            return
+        start = 0
+        for part, fut, _ in batch:
+            fut.set_result(out[start:start + len(part)])
+            start += len(part)
+
+    def _run(self) -> None:
+        carry = None
+        while True:
+            item = carry if carry is not None else self._queue.get()
+            carry = None
+            if item is _STOP:
+                return
+            batch, carry = self._next_batch(item)
+            self._dispatch(batch)
@@ -0,0 +1,146 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from typing import Any, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# ====== 版本化的 PCA 投影 ======
+# pca_path()（默认 DATA_DIR/pca_model.pkl）是唯一的「当前」模型；版本号 = 文件内容 sha1 前 12 位，所有进程算出来一致。
+# current() 最多每 PCA_RELOAD_INTERVAL 秒 stat 一次文件，(大小, mtime) 变了就重新加载，
+# 然后整体替换 _current 这一个引用：调用方拿到的 Projection 快照里 version 与 model 永远配套，
+# 不用重启 worker 就能切到 /api/analysis/rebuild 新拟合的模型。
+
+def pca_path() -> str:
+    """settings.PCA_PATH，未设置时为 DATA_DIR/pca_model.pkl；每次现取，DATA_DIR 改了也跟着变"""
+    return os.path.abspath(settings.PCA_PATH or os.path.join(settings.DATA_DIR, "pca_model.pkl"))
+
+
+class Projection(NamedTuple):
+    """
+    一个 PCA 版本。除了原始 sklearn 模型，还预先摊平成 float32 的投影矩阵：
+    transform(X) = X @ components.T - offset，一次矩阵乘法，不走 sklearn 的逐次参数校验。
+    whiten 的缩放已乘进 components；模型不是标准 PCA（没有 mean_ / components_）时退回 model.transform。
+    """
+    version: str
+    model: Any
+    mean: Optional[np.ndarray] = None        # (d,) float32
+    components: Optional[np.ndarray] = None  # (k, d) float32，已含 whiten 缩放
+    offset: Optional[np.ndarray] = None      # (k,) float32 = mean @ components.T
+
+    def transform(self, X) -> np.ndarray:
+        """批量投影：(n, d) -> (n, k) float64（与 sklearn 输出同类型）；单个向量也请包成 (1, d)"""
+        if self.components is None:
+            return np.asarray(self.model.transform(X))
+        X = np.asarray(X, dtype=np.float32)
+        return (X @ self.components.T - self.offset).astype(np.float64)
+
+
+def from_model(version: str, model: Any) -> Projection:
+    mean = getattr(model, "mean_", None)
+    components = getattr(model, "components_", None)
+    if mean is None or components is None:
+        return Projection(version, model)
+
+    components = np.asarray(components, dtype=np.float64)
+    if getattr(model, "whiten", False):
+        # 与 sklearn 一致：方差裁剪到 eps 以上再开方
+        scale = np.sqrt(np.asarray(model.explained_variance_, dtype=np.float64))
+        scale = np.maximum(scale, np.finfo(scale.dtype).eps)
+        components = components / scale[:, None]
+    mean = np.asarray(mean, dtype=np.float64)
+    return Projection(
+        version,
+        model,
+        mean.astype(np.float32),
+        np.ascontiguousarray(components, dtype=np.float32),
+        (mean @ components.T).astype(np.float32),
+    )
+
+
+_current: Optional[Projection] = None
+_signature: Optional[Tuple[str, int, int]] = None
+_checked_at = 0.0
+_state = "not_loaded"  # not_loaded / loaded / missing / failed
+_lock = threading.Lock()
+
+
+def _stat_signature(path: str) -> Optional[Tuple[str, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return path, st.st_size, st.st_mtime_ns
+
+
+def load_file(path: str) -> Projection:
+    """读取一个 pca pkl：同一份字节既算版本号又反序列化，版本与模型不会错配"""
+    import joblib
+
+    with open(path, "rb") as f:
+        raw = f.read()
+    return from_model(hashlib.sha1(raw).hexdigest()[:12], joblib.load(io.BytesIO(raw)))
+
+
+def _reload_locked(path: str, signature: Optional[Tuple[str, int, int]]) -> None:
+    global _current, _signature, _state
+    _signature = signature
+    if signature is None:
+        if _state != "missing":
+            logger.warning("⚠️ [Projection] PCA 模型未找到: %s", path)
+        _current, _state = None, "missing"
+        return
+    try:
+        proj = load_file(path)
+    except Exception as e:
+        # 加载失败（比如写到一半）：保留旧模型继续服务，下次检查再试
+        _state = "failed" if _current is None else _state
+        _signature = None
+        logger.error("❌ [Projection] PCA 模型加载失败: %s", e)
+        return
+    if _current is None or proj.version != _current.version:
+        logger.info("✅ [Projection] PCA 模型 %s 已加载: %s", proj.version, path)
+    _current, _state = proj, "loaded"
+
+
+def current() -> Optional[Projection]:
+    """当前投影快照；没有 pkl 时返回 None，坐标退化为 (0, 0)"""
+    global _checked_at
+    now = time.monotonic()
+    if _state != "not_loaded" and now - _checked_at < settings.PCA_RELOAD_INTERVAL:
+        return _current
+    with _lock:
+        if _state == "not_loaded" or now - _checked_at >= settings.PCA_RELOAD_INTERVAL:
+            path = pca_path()
+            signature = _stat_signature(path)
+            if _state == "not_loaded" or signature != _signature:
+                _reload_locked(path, signature)
+            _checked_at = time.monotonic()
+    return _current
+
+
+def reload() -> Optional[Projection]:
+    """pca_model.pkl 刚被本进程替换：立即重新加载，不等下一次定期检查"""
+    global _checked_at
+    with _lock:
+        path = pca_path()
+        _reload_locked(path, _stat_signature(path))
+        _checked_at = time.monotonic()
+    return _current
+
+
+def project(vectors) -> Optional[np.ndarray]:
+    """用当前版本批量投影 (n, d) -> (n, 2)；没有模型返回 None"""
+    proj = current()
+    return proj.transform(vectors) if proj is not None else None
+
+
+def status() -> dict:
+    return {"state": _state, "version": _current.version if _current is not None else None}
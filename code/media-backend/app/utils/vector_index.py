@@ -0,0 +1,211 @@
+import math
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# ====== 向量索引（纯 NumPy，cosine 相似度） ======
+# - 向量入库前 L2 归一化，存成一个可增长的 float32 矩阵；exact = 整个矩阵乘一次 + argpartition
+# - ivf = 球面 k-means 把向量分成 nlist 个桶（倒排表），查询时只算离 query 最近的 nprobe 个桶
+# - add() 增量追加：已训练时直接分到最近的桶；总量涨到训练时的 RETRAIN_GROWTH 倍后 needs_training() 为真，
+#   由调用方在后台线程 train()（训练期间新加的向量训练完后补分桶）
+# 写操作串行（_write_lock），读不加锁：先取快照（矩阵引用 + 行数），扩容都是「拷贝后替换引用」
+
+RETRAIN_GROWTH = 4
+_ASSIGN_CHUNK = 16384
+
+
+def normalize(vectors) -> np.ndarray:
+    X = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return X / norms
+
+
+def default_nlist(n: int) -> int:
+    return int(min(4096, max(16, math.sqrt(n))))
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """scores 里最大的 k 个的下标（降序）"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def _assign(X: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    out = np.empty(len(X), dtype=np.int32)
+    for s in range(0, len(X), _ASSIGN_CHUNK):
+        out[s:s + _ASSIGN_CHUNK] = np.argmax(X[s:s + _ASSIGN_CHUNK] @ centroids.T, axis=1)
+    return out
+
+
+def kmeans(X: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """球面 k-means（X 已归一化），返回 (k, d) 归一化中心"""
+    rng = np.random.default_rng(seed)
+    centroids = X[rng.choice(len(X), size=k, replace=False)].copy()
+    for _ in range(iters):
+        labels = _assign(X, centroids)
+        counts = np.bincount(labels, minlength=k)
+        # 按桶排序后 reduceat 求和（比 np.add.at 快一个数量级）
+        order = np.argsort(labels, kind="stable")
+        starts = np.r_[0, np.cumsum(counts)[:-1]]
+        sums = np.zeros_like(centroids)
+        nonempty = counts > 0
+        sums[nonempty] = np.add.reduceat(X[order], starts[nonempty], axis=0)
+        empty = counts == 0
+        if empty.any():
+            # 空桶重新撒到随机样本上
+            sums[empty] = X[rng.choice(len(X), size=int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+class _IVF:
+    def __init__(self, centroids: np.ndarray, n_rows: int):
+        self.centroids = centroids
+        self.trained_on = n_rows
+        self.lists: List[np.ndarray] = [np.empty(16, dtype=np.int64) for _ in range(len(centroids))]
+        self.sizes = np.zeros(len(centroids), dtype=np.int64)
+
+    def add(self, rows: np.ndarray, labels: np.ndarray) -> None:
+        order = np.argsort(labels, kind="stable")
+        labels, rows = labels[order], rows[order]
+        bounds = np.flatnonzero(np.diff(labels)) + 1
+        for part_rows, c in zip(np.split(rows, bounds), labels[np.r_[0, bounds]] if len(labels) else []):
+            size = int(self.sizes[c])
+            lst = self.lists[c]
+            if size + len(part_rows) > len(lst):
+                grown = np.empty(max(2 * len(lst), size + len(part_rows)), dtype=np.int64)
+                grown[:size] = lst[:size]
+                lst = grown
+            lst[size:size + len(part_rows)] = part_rows
+            self.lists[c] = lst
+            self.sizes[c] = size + len(part_rows)
+
+    def candidates(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        probe = _top_k(self.centroids @ q, min(nprobe, len(self.centroids)))
+        parts = []
+        for c in probe:
+            size = int(self.sizes[c])
+            parts.append(self.lists[c][:size])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+
+class VectorIndex:
+    def __init__(self, dim: int, nlist: int = 0, nprobe: int = 16, min_train: int = 4096, capacity: int = 1024):
+        self.dim = dim
+        self.nlist = nlist  # 0 = 按训练时的数据量自动取 sqrt(n)
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.ntotal = 0
+        self._vecs = np.empty((capacity, dim), dtype=np.float32)
+        self._ivf: Optional[_IVF] = None
+        self._write_lock = threading.Lock()
+        self._train_lock = threading.Lock()
+
+    @property
+    def trained(self) -> bool:
+        return self._ivf is not None
+
+    def vectors(self) -> np.ndarray:
+        return self._vecs[:self.ntotal]
+
+    def stats(self) -> dict:
+        ivf = self._ivf
+        return {
+            "vectors": self.ntotal,
+            "dim": self.dim,
+            "ivf": ivf is not None,
+            "nlist": len(ivf.centroids) if ivf is not None else 0,
+            "trained_on": ivf.trained_on if ivf is not None else 0,
+            "nprobe": self.nprobe,
+        }
+
+    def add(self, vectors) -> np.ndarray:
+        """追加向量（会归一化），返回它们的行号"""
+        X = np.asarray(vectors, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.shape[1] != self.dim:
+            raise ValueError(f"dim mismatch: index {self.dim}, got {X.shape[1]}")
+        norms = np.linalg.norm(X, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        with self._write_lock:
+            start, end = self.ntotal, self.ntotal + len(X)
+            if end > len(self._vecs):
+                grown = np.empty((max(2 * len(self._vecs), end), self.dim), dtype=np.float32)
+                grown[:start] = self._vecs[:start]
+                self._vecs = grown
+            # 直接归一化进矩阵，不产生中间副本（百万级批量 add 时省一整份内存）
+            np.divide(X, norms, out=self._vecs[start:end])
+            rows = np.arange(start, end, dtype=np.int64)
+            ivf = self._ivf
+            if ivf is not None:
+                ivf.add(rows, _assign(self._vecs[start:end], ivf.centroids))
+            self.ntotal = end
+        return rows
+
+    def needs_training(self) -> bool:
+        if self.ntotal < self.min_train:
+            return False
+        return self._ivf is None or self.ntotal >= RETRAIN_GROWTH * self._ivf.trained_on
+
+    def train(self, sample_size: int = 0, iters: int = 10, seed: int = 0) -> None:
+        """在当前全部向量（或随机 sample_size 条）上训练中心并重建倒排表；不阻塞并发的 add / search"""
+        with self._train_lock:
+            n = self.ntotal
+            X = self._vecs[:n]
+            nlist = min(self.nlist or default_nlist(n), n)
+            sample = sample_size or max(64 * nlist, 1)
+            if sample < n:
+                rng = np.random.default_rng(seed)
+                train_X = X[np.sort(rng.choice(n, size=sample, replace=False))]
+            else:
+                train_X = X
+            ivf = _IVF(kmeans(train_X, nlist, iters=iters, seed=seed), n)
+            ivf.add(np.arange(n, dtype=np.int64), _assign(X, ivf.centroids))
+            with self._write_lock:
+                # 训练期间新加的行补分桶，然后整体替换
+                if self.ntotal > n:
+                    tail = np.arange(n, self.ntotal, dtype=np.int64)
+                    ivf.add(tail, _assign(self._vecs[n:self.ntotal], ivf.centroids))
+                self._ivf = ivf
+
+    def search(
+        self,
+        query,
+        k: int = 10,
+        exact: bool = False,
+        nprobe: Optional[int] = None,
+        allowed: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        返回 (scores, rows)，按 cosine 相似度降序。
+        exact=False 且已训练时走 IVF；allowed 是按行号的 bool 数组（只在这些行里找）
+        """
+        q = normalize(query)[0]
+        # 先取行数再取矩阵：扩容后的新矩阵一定包含旧的前 n 行
+        n, ivf = self.ntotal, self._ivf
+        vecs = self._vecs
+        if allowed is not None:
+            n = min(n, len(allowed))
+        if n == 0 or k <= 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        if exact or ivf is None:
+            scores = vecs[:n] @ q
+            if allowed is not None:
+                scores = np.where(allowed[:n], scores, -np.inf)
+            top = _top_k(scores, k)
+            top = top[np.isfinite(scores[top])]
+            return scores[top], top.astype(np.int64)
+
+        cand = ivf.candidates(q, nprobe or self.nprobe)
+        cand = cand[cand < n]
+        if allowed is not None:
+            cand = cand[allowed[cand]]
+        scores = vecs[cand] @ q
+        top = _top_k(scores, k)
+        return scores[top], cand[top]
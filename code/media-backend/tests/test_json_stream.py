@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from app.utils.json_stream import iter_members
+
+KEYS = ("data", "experiment_data")
+
+
+def _write(tmp_path, obj):
+    path = tmp_path / "exp.json"
+    path.write_text(json.dumps(obj, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def _expected(obj):
+    return list((obj.get("data") or obj.get("experiment_data", {})).items())
+
+
+@pytest.mark.parametrize(
+    "obj",
+    [
+        # 两个 key 都在：不管谁先出现，"data" 优先
+        {"experiment_data": {"e1": {"v": [1.5, 2]}}, "data": {"d1": {"v": [3]}, "d2": {"v": []}}},
+        {"data": {"d1": {"v": [3]}}, "meta": "x", "experiment_data": {"e1": {"v": [1]}}},
+        # "data" 为空或不存在：退回 "experiment_data"
+        {"data": {}, "experiment_data": {"e1": {"v": [1]}, "e2": {"v": [2]}}},
+        {"experiment_data": {"e1": {"v": [1]}}, "data": {}},
+        {"meta": {"nested": {"a": 1}}, "experiment_data": {"e1": {"v": [1]}}},
+        {"meta": 1},
+    ],
+)
+def test_iter_members_matches_dict_get_precedence(tmp_path, obj):
+    assert list(iter_members(_write(tmp_path, obj), KEYS)) == _expected(obj)
+
+
+def test_iter_members_across_chunk_boundaries(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.utils.json_stream._CHUNK", 7)
+    obj = {
+        "experiment_data": {f"e{i}": {"v": [i + 0.123456] * 5} for i in range(20)},
+        "data": {f"d{i}": {"text": "句子" * i, "v": [i * 1.25]} for i in range(20)},
+    }
+    assert list(iter_members(_write(tmp_path, obj), KEYS)) == _expected(obj)
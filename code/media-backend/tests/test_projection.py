@@ -0,0 +1,74 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from sklearn.decomposition import PCA
+
+from app.utils.projection import from_model
+
+# Projection 的 float32 矩阵乘法内核必须与 sklearn pca.transform 一致（含 whiten），误差 < TOL
+DIM = 384
+TOL = 1e-4
+
+
+def _fit(whiten: bool, seed: int) -> PCA:
+    rng = np.random.default_rng(seed)
+    # 有明显主方向的数据，接近真实 embedding 的分布
+    basis = rng.normal(size=(8, DIM))
+    X = rng.normal(size=(2000, 8)) @ basis * 0.05 + rng.normal(size=(2000, DIM)) * 0.01
+    return PCA(n_components=2, whiten=whiten).fit(X)
+
+
+@pytest.mark.parametrize("whiten", [False, True])
+def test_transform_matches_sklearn(whiten):
+    pca = _fit(whiten, seed=int(whiten))
+    proj = from_model("test", pca)
+    X = (np.random.default_rng(42).normal(size=(5000, DIM)) * 0.05).astype(np.float32)
+
+    batch = proj.transform(X)
+    assert batch.dtype == np.float64 and batch.shape == (5000, 2)
+    np.testing.assert_allclose(batch, pca.transform(X.astype(np.float64)), rtol=0, atol=TOL)
+    # 单个向量（线上逐句打分）同样一致
+    np.testing.assert_allclose(proj.transform(X[:1]), pca.transform(X[:1].astype(np.float64)), rtol=0, atol=TOL)
+    # list 输入（存库的 embedding）与 ndarray 结果相同（批大小不同，BLAS 舍入可能差在 1e-8 量级）
+    np.testing.assert_allclose(proj.transform(X[:3].tolist()), batch[:3], rtol=0, atol=1e-6)
+
+
+def test_non_pca_model_falls_back_to_transform():
+    class Scaler:
+        def transform(self, X):
+            return np.asarray(X)[:, :2] * 2
+
+    proj = from_model("test", Scaler())
+    assert proj.components is None
+    np.testing.assert_array_equal(proj.transform([[1.0, 2.0, 3.0]]), [[2.0, 4.0]])
+
+
+def test_rebuild_writes_pca_under_data_dir(tmp_path, monkeypatch):
+    from app.core.config import settings
+    from app.services import analysis_data
+    from app.utils import projection
+
+    repo_pca = projection.pca_path()
+    repo_stat = os.stat(repo_pca) if os.path.exists(repo_pca) else None
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "PCA_PATH", "")
+    monkeypatch.setattr(analysis_data, "_cache", None)
+
+    rng = np.random.default_rng(0)
+    stories = {
+        f"s{i}": {"rounds": [{"turn": j + 1, "embedding": rng.normal(size=8).tolist()} for j in range(3)]}
+        for i in range(4)
+    }
+    (tmp_path / "exp.json").write_text(json.dumps({"data": stories}), encoding="utf-8")
+    try:
+        result = analysis_data.rebuild()
+        assert projection.pca_path() == str(tmp_path / "pca_model.pkl")
+        assert (tmp_path / "pca_model.pkl").exists()
+        assert projection.current().version == result["proj_version"]
+    finally:
+        monkeypatch.undo()
+        projection.reload()
+    if repo_stat is not None:
+        assert os.stat(repo_pca).st_mtime_ns == repo_stat.st_mtime_ns
@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import analysis_data, log_store, search_index, storage
+
+DIM = 16
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", "log")
+    monkeypatch.setattr(settings, "STORAGE_FSYNC", False)
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "STORIES_PATH", os.path.join(tmp_path, "stories.json"))
+    monkeypatch.setattr(settings, "STORIES_DIR", os.path.join(tmp_path, "stories"))
+    monkeypatch.setattr(storage, "_impl", None)
+    monkeypatch.setattr(log_store, "_store_ready", False)
+    monkeypatch.setattr(analysis_data, "_cache", None)
+    monkeypatch.setattr(search_index, "_state", None)
+    return tmp_path
+
+
+def _turn(text: str, vec: np.ndarray) -> dict:
+    return {"author": "ai", "text": text, "embedding": vec.tolist(), "flow_score": 0.5}
+
+
+def test_direct_append_turns_is_searchable_without_rebuild(data_dir):
+    rng = np.random.default_rng(0)
+    story_id = storage.create_story()
+    storage.append_turns(story_id, [_turn(f"t{i}", rng.normal(size=DIM)) for i in range(5)])
+    assert search_index.search(vector=rng.normal(size=DIM).tolist(), mode="exact")["total"] == 5
+
+    # 脚本 / 迁移直接写存储（不经过 score_and_store）：索引已建好时也要增量追加
+    probe = rng.normal(size=DIM)
+    storage.append_turns(story_id, [_turn("direct", probe)])
+    result = search_index.search(vector=probe.tolist(), k=1, mode="exact")
+    assert result["total"] == 6
+    assert result["hits"][0]["text"] == "direct"
+    assert result["hits"][0]["turn"] == 6
+
+
+def test_append_listener_errors_do_not_fail_the_write(data_dir, monkeypatch):
+    def broken(story_id, saved):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(storage, "_append_listeners", [broken])
+    story_id = storage.create_story()
+    saved = storage.append_turns(story_id, [{"author": "ai", "text": "x"}])
+    assert [t["turn"] for t in storage.get_story_turns(story_id)] == [t["turn"] for t in saved] == [1]
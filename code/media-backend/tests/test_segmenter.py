@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from app.services.llm_proxy import SentenceSegmenter, extract_complete_sentences
+
+# 随机文本（中英文、句末符号、空白、换行）按随机切片喂入：SentenceSegmenter 每一步输出的句子和残句
+# 都必须与「整 buffer 重跑 extract_complete_sentences」完全一致
+_ALPHABET = (
+    list("故事继续森林灯光她他走停看雨风")
+    + list("abcdefg XYZ")
+    + list("。！？.!?")
+    + list("，,、:：;；…-—（）()[]【】\"“”‘’'")
+    + [" ", "  ", "\t", "\n", "\r\n", "　", "\xa0"]
+)
+SEED = 0
+CASES = 2000
+
+
+def _reference(chunks):
+    buffer = ""
+    out = []
+    for d in chunks:
+        buffer += d
+        sents, buffer = extract_complete_sentences(buffer)
+        out.append((sents, buffer))
+    return out
+
+
+def _incremental(chunks):
+    seg = SentenceSegmenter()
+    return [(seg.feed(d), seg.remainder) for d in chunks]
+
+
+def _random_chunks(rng: random.Random):
+    text = "".join(rng.choice(_ALPHABET) for _ in range(rng.randint(0, 80)))
+    chunks = []
+    i = 0
+    while i < len(text):
+        n = rng.randint(1, 8)
+        chunks.append(text[i:i + n])
+        i += n
+    # 偶尔插入单独的换行 / 空 delta 这类边界情况
+    if chunks and rng.random() < 0.2:
+        chunks.insert(rng.randrange(len(chunks)), rng.choice(["\n", "", " "]))
+    return chunks
+
+
+def test_random_chunking_matches_full_rescan():
+    rng = random.Random(SEED)
+    for case in range(CASES):
+        chunks = _random_chunks(rng)
+        assert _incremental(chunks) == _reference(chunks), f"case {case}: {chunks!r}"
+
+
+@pytest.mark.parametrize(
+    "chunks",
+    [
+        ["雾气从河面升起", "，像一层薄薄的纱。她停", "下脚步！"],
+        ["Hello", " world.", "..", " Next?", "!"],
+        ["。", "！", "？", "\n", "正文。"],
+        ["第一句。\r", "\n第二句。"],
+        [],
+    ],
+)
+def test_fixed_chunkings_match_full_rescan(chunks):
+    assert _incremental(chunks) == _reference(chunks)
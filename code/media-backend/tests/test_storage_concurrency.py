@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from app.core.config import settings
+from app.services import log_store, storage
+
+# 多进程 x 多线程同时往同一个 story 追加 turns：turn 既不丢失也不重复，序号从 1 连续，
+# 每条 turn 的内容完整（没有写了一半的行）
+PROCS = 3
+THREADS = 4
+APPENDS = 15
+
+
+@pytest.fixture(params=["log", "sqlite"])
+def backend(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(settings, "STORAGE_FSYNC", False)
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "STORIES_PATH", os.path.join(tmp_path, "stories.json"))
+    monkeypatch.setattr(settings, "STORIES_DIR", os.path.join(tmp_path, "stories"))
+    monkeypatch.setattr(settings, "SQLITE_PATH", os.path.join(tmp_path, "stories.sqlite3"))
+    monkeypatch.setattr(storage, "_impl", None)
+    monkeypatch.setattr(log_store, "_store_ready", False)
+    return request.param
+
+
+def _append_many(story_id: str, proc_idx: int) -> list:
+    def run(thread_idx: int) -> list:
+        texts = []
+        for i in range(APPENDS):
+            # 每次追加 1~3 条，模拟 human + 若干 AI turn
+            batch = [
+                {"author": "ai", "text": f"p{proc_idx}-t{thread_idx}-a{i}-{k}", "flow_score": 0.5}
+                for k in range(1 + i % 3)
+            ]
+            storage.append_turns(story_id, batch)
+            texts += [t["text"] for t in batch]
+        return texts
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return [t for texts in pool.map(run, range(THREADS)) for t in texts]
+
+
+def _check(story_id: str, written: list) -> None:
+    turns = storage.get_story_turns(story_id)
+    assert [t["turn"] for t in turns] == list(range(1, len(written) + 1))
+    assert sorted(t["text"] for t in turns) == sorted(written)
+    assert all(t["author"] == "ai" and t["flow_score"] == 0.5 for t in turns)
+
+
+def test_concurrent_appends_threads(backend):
+    story_id = storage.create_story()
+    _check(story_id, _append_many(story_id, 0))
+
+
+@pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(), reason="需要 fork（子进程继承测试里改过的 settings）"
+)
+def test_concurrent_appends_processes(backend):
+    story_id = storage.create_story()
+    ctx = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=PROCS, mp_context=ctx) as pool:
+        futures = [pool.submit(_append_many, story_id, p) for p in range(PROCS)]
+        written = [t for f in futures for t in f.result()]
+    _check(story_id, written)